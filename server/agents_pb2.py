@@ -24,17 +24,41 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0c\x61gents.proto\".\n\x0b\x43hatMessage\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\"7\n\x13\x43hatMessageProgress\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t2J\n\x0c\x41gentService\x12:\n\x12ProcessChatMessage\x12\x0c.ChatMessage\x1a\x14.ChatMessageProgress0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0c\x61gents.proto\"A\n\x0b\x43hatMessage\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0e\n\x06sender\x18\x02 \x01(\t\x12\x11\n\tworkspace\x18\x03 \x01(\t\"t\n\x13\x43hatMessageProgress\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x19\n\x05\x64\x65lta\x18\x03 \x01(\x0b\x32\n.FileDelta\x12 \n\x0b\x64iagnostics\x18\x04 \x03(\x0b\x32\x0b.Diagnostic\"c\n\tFileDelta\x12\x10\n\x08sequence\x18\x01 \x01(\x04\x12\x0e\n\x06offset\x18\x02 \x01(\x04\x12\x0f\n\x07\x63ontent\x18\x03 \x01(\t\x12\r\n\x05\x66inal\x18\x04 \x01(\x08\x12\x14\n\x0c\x63ontent_hash\x18\x05 \x01(\t\"]\n\nDiagnostic\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x0c\n\x04line\x18\x02 \x01(\r\x12\x0e\n\x06\x63olumn\x18\x03 \x01(\r\x12\x0f\n\x07message\x18\x04 \x01(\t\x12\x0e\n\x06source\x18\x05 \x01(\t\"P\n\nJobRequest\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x11\n\tworkspace\x18\x02 \x01(\t\x12\x1e\n\x08priority\x18\x03 \x01(\x0e\x32\x0c.JobPriority\")\n\x0c\x42\x61tchRequest\x12\x19\n\x04jobs\x18\x01 \x03(\x0b\x32\x0b.JobRequest\"8\n\nBatchReply\x12\x10\n\x08\x62\x61tch_id\x18\x01 \x01(\t\x12\x18\n\x04jobs\x18\x02 \x03(\x0b\x32\n.JobStatus\"\x17\n\x05JobId\x12\x0e\n\x06job_id\x18\x01 \x01(\t\"\xc0\x01\n\tJobStatus\x12\x0e\n\x06job_id\x18\x01 \x01(\t\x12\r\n\x05state\x18\x02 \x01(\t\x12\x1e\n\x08priority\x18\x03 \x01(\x0e\x32\x0c.JobPriority\x12\x11\n\tworkspace\x18\x04 \x01(\t\x12\x0e\n\x06status\x18\x05 \x01(\t\x12\x17\n\x0f\x66iles_completed\x18\x06 \x03(\t\x12\r\n\x05\x65rror\x18\x07 \x01(\t\x12\x14\n\x0cwait_seconds\x18\x08 \x01(\x01\x12\x13\n\x0brun_seconds\x18\t \x01(\x01\" \n\x0cStatsRequest\x12\x10\n\x08sessions\x18\x01 \x01(\x08\"1\n\nStatsReply\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x15\n\rsessions_json\x18\x02 \x01(\t\"\x0f\n\rHealthRequest\"E\n\x0bHealthReply\x12\r\n\x05ready\x18\x01 \x01(\x08\x12\x0e\n\x06status\x18\x02 \x01(\t\x12\x17\n\x0fstartup_seconds\x18\x03 \x01(\x01*G\n\x0bJobPriority\x12\x13\n\x0fPRIORITY_NORMAL\x10\x00\x12\x11\n\rPRIORITY_HIGH\x10\x01\x12\x10\n\x0cPRIORITY_LOW\x10\x02\x32\x91\x03\n\x0c\x41gentService\x12:\n\x12ProcessChatMessage\x12\x0c.ChatMessage\x1a\x14.ChatMessageProgress0\x01\x12\x39\n\x11StreamChatMessage\x12\x0c.ChatMessage\x1a\x14.ChatMessageProgress0\x01\x12&\n\x08GetStats\x12\r.StatsRequest\x1a\x0b.StatsReply\x12$\n\tSubmitJob\x12\x0b.JobRequest\x1a\n.JobStatus\x12)\n\x0bSubmitBatch\x12\r.BatchRequest\x1a\x0b.BatchReply\x12\x1c\n\x06GetJob\x12\x06.JobId\x1a\n.JobStatus\x12*\n\x08WatchJob\x12\x06.JobId\x1a\x14.ChatMessageProgress0\x01\x12\x1f\n\tCancelJob\x12\x06.JobId\x1a\n.JobStatus\x12&\n\x06Health\x12\x0e.HealthRequest\x1a\x0c.HealthReplyb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'agents_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_JOBPRIORITY']._serialized_start=973
+  _globals['_JOBPRIORITY']._serialized_end=1044
   _globals['_CHATMESSAGE']._serialized_start=16
-  _globals['_CHATMESSAGE']._serialized_end=62
-  _globals['_CHATMESSAGEPROGRESS']._serialized_start=64
-  _globals['_CHATMESSAGEPROGRESS']._serialized_end=119
-  _globals['_AGENTSERVICE']._serialized_start=121
-  _globals['_AGENTSERVICE']._serialized_end=195
+  _globals['_CHATMESSAGE']._serialized_end=81
+  _globals['_CHATMESSAGEPROGRESS']._serialized_start=83
+  _globals['_CHATMESSAGEPROGRESS']._serialized_end=199
+  _globals['_FILEDELTA']._serialized_start=201
+  _globals['_FILEDELTA']._serialized_end=300
+  _globals['_DIAGNOSTIC']._serialized_start=302
+  _globals['_DIAGNOSTIC']._serialized_end=395
+  _globals['_JOBREQUEST']._serialized_start=397
+  _globals['_JOBREQUEST']._serialized_end=477
+  _globals['_BATCHREQUEST']._serialized_start=479
+  _globals['_BATCHREQUEST']._serialized_end=520
+  _globals['_BATCHREPLY']._serialized_start=522
+  _globals['_BATCHREPLY']._serialized_end=578
+  _globals['_JOBID']._serialized_start=580
+  _globals['_JOBID']._serialized_end=603
+  _globals['_JOBSTATUS']._serialized_start=606
+  _globals['_JOBSTATUS']._serialized_end=798
+  _globals['_STATSREQUEST']._serialized_start=800
+  _globals['_STATSREQUEST']._serialized_end=832
+  _globals['_STATSREPLY']._serialized_start=834
+  _globals['_STATSREPLY']._serialized_end=883
+  _globals['_HEALTHREQUEST']._serialized_start=885
+  _globals['_HEALTHREQUEST']._serialized_end=900
+  _globals['_HEALTHREPLY']._serialized_start=902
+  _globals['_HEALTHREPLY']._serialized_end=971
+  _globals['_AGENTSERVICE']._serialized_start=1047
+  _globals['_AGENTSERVICE']._serialized_end=1448
 # @@protoc_insertion_point(module_scope)
@@ -39,6 +39,46 @@ class AgentServiceStub(object):
                 request_serializer=agents__pb2.ChatMessage.SerializeToString,
                 response_deserializer=agents__pb2.ChatMessageProgress.FromString,
                 _registered_method=True)
+        self.StreamChatMessage = channel.unary_stream(
+                '/AgentService/StreamChatMessage',
+                request_serializer=agents__pb2.ChatMessage.SerializeToString,
+                response_deserializer=agents__pb2.ChatMessageProgress.FromString,
+                _registered_method=True)
+        self.GetStats = channel.unary_unary(
+                '/AgentService/GetStats',
+                request_serializer=agents__pb2.StatsRequest.SerializeToString,
+                response_deserializer=agents__pb2.StatsReply.FromString,
+                _registered_method=True)
+        self.SubmitJob = channel.unary_unary(
+                '/AgentService/SubmitJob',
+                request_serializer=agents__pb2.JobRequest.SerializeToString,
+                response_deserializer=agents__pb2.JobStatus.FromString,
+                _registered_method=True)
+        self.SubmitBatch = channel.unary_unary(
+                '/AgentService/SubmitBatch',
+                request_serializer=agents__pb2.BatchRequest.SerializeToString,
+                response_deserializer=agents__pb2.BatchReply.FromString,
+                _registered_method=True)
+        self.GetJob = channel.unary_unary(
+                '/AgentService/GetJob',
+                request_serializer=agents__pb2.JobId.SerializeToString,
+                response_deserializer=agents__pb2.JobStatus.FromString,
+                _registered_method=True)
+        self.WatchJob = channel.unary_stream(
+                '/AgentService/WatchJob',
+                request_serializer=agents__pb2.JobId.SerializeToString,
+                response_deserializer=agents__pb2.ChatMessageProgress.FromString,
+                _registered_method=True)
+        self.CancelJob = channel.unary_unary(
+                '/AgentService/CancelJob',
+                request_serializer=agents__pb2.JobId.SerializeToString,
+                response_deserializer=agents__pb2.JobStatus.FromString,
+                _registered_method=True)
+        self.Health = channel.unary_unary(
+                '/AgentService/Health',
+                request_serializer=agents__pb2.HealthRequest.SerializeToString,
+                response_deserializer=agents__pb2.HealthReply.FromString,
+                _registered_method=True)
 
 
 class AgentServiceServicer(object):
@@ -50,6 +90,66 @@ class AgentServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamChatMessage(self, request, context):
+        """Same as ProcessChatMessage, but also streams the generated code as
+        FileDelta messages while the workers write it.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetStats(self, request, context):
+        """Server metrics (span timings, token counts, cache hits) in the
+        Prometheus text format.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SubmitJob(self, request, context):
+        """Queue a session to run in the background, without keeping a stream
+        open. Jobs run on the server's JOB_WORKERS by priority; jobs of the
+        same priority take turns by batch.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SubmitBatch(self, request, context):
+        """Queue several jobs as one batch, which takes turns with other batches
+        and jobs of the same priority instead of running all of its jobs first.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetJob(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchJob(self, request, context):
+        """The job's progress so far and then as it happens, until it finishes.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def CancelJob(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Health(self, request, context):
+        """Answers as soon as the server listens; ready once it has loaded the
+        agents and warmed up, other requests fail with UNAVAILABLE until then.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_AgentServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +158,46 @@ def add_AgentServiceServicer_to_server(servicer, server):
                     request_deserializer=agents__pb2.ChatMessage.FromString,
                     response_serializer=agents__pb2.ChatMessageProgress.SerializeToString,
             ),
+            'StreamChatMessage': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamChatMessage,
+                    request_deserializer=agents__pb2.ChatMessage.FromString,
+                    response_serializer=agents__pb2.ChatMessageProgress.SerializeToString,
+            ),
+            'GetStats': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetStats,
+                    request_deserializer=agents__pb2.StatsRequest.FromString,
+                    response_serializer=agents__pb2.StatsReply.SerializeToString,
+            ),
+            'SubmitJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.SubmitJob,
+                    request_deserializer=agents__pb2.JobRequest.FromString,
+                    response_serializer=agents__pb2.JobStatus.SerializeToString,
+            ),
+            'SubmitBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.SubmitBatch,
+                    request_deserializer=agents__pb2.BatchRequest.FromString,
+                    response_serializer=agents__pb2.BatchReply.SerializeToString,
+            ),
+            'GetJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetJob,
+                    request_deserializer=agents__pb2.JobId.FromString,
+                    response_serializer=agents__pb2.JobStatus.SerializeToString,
+            ),
+            'WatchJob': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchJob,
+                    request_deserializer=agents__pb2.JobId.FromString,
+                    response_serializer=agents__pb2.ChatMessageProgress.SerializeToString,
+            ),
+            'CancelJob': grpc.unary_unary_rpc_method_handler(
+                    servicer.CancelJob,
+                    request_deserializer=agents__pb2.JobId.FromString,
+                    response_serializer=agents__pb2.JobStatus.SerializeToString,
+            ),
+            'Health': grpc.unary_unary_rpc_method_handler(
+                    servicer.Health,
+                    request_deserializer=agents__pb2.HealthRequest.FromString,
+                    response_serializer=agents__pb2.HealthReply.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'AgentService', rpc_method_handlers)
@@ -95,3 +235,219 @@ class AgentService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def StreamChatMessage(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/AgentService/StreamChatMessage',
+            agents__pb2.ChatMessage.SerializeToString,
+            agents__pb2.ChatMessageProgress.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetStats(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AgentService/GetStats',
+            agents__pb2.StatsRequest.SerializeToString,
+            agents__pb2.StatsReply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SubmitJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AgentService/SubmitJob',
+            agents__pb2.JobRequest.SerializeToString,
+            agents__pb2.JobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SubmitBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AgentService/SubmitBatch',
+            agents__pb2.BatchRequest.SerializeToString,
+            agents__pb2.BatchReply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AgentService/GetJob',
+            agents__pb2.JobId.SerializeToString,
+            agents__pb2.JobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def WatchJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/AgentService/WatchJob',
+            agents__pb2.JobId.SerializeToString,
+            agents__pb2.ChatMessageProgress.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def CancelJob(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AgentService/CancelJob',
+            agents__pb2.JobId.SerializeToString,
+            agents__pb2.JobStatus.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Health(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AgentService/Health',
+            agents__pb2.HealthRequest.SerializeToString,
+            agents__pb2.HealthReply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
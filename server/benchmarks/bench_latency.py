@@ -0,0 +1,170 @@
+"""End-to-end latency benchmark for AgentService.ProcessChatMessage.
+
+Runs the real gRPC service in-process against FakeChatCompletionClient on
+synthetic workspaces, so no OpenAI key or network is needed:
+
+    python benchmarks/bench_latency.py --sizes 10 100 1000
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grpc
+
+import agents_pb2
+import agents_pb2_grpc
+from multi_agent import streaming_writer
+from multi_agent.fake_model_client import FakeChatCompletionClient
+from multi_agent.metrics import LoopLagMonitor
+from multi_agent.multi_agent import MultiAgent
+from server import AgentService
+
+
+COMPONENT_TEMPLATE = """import React from "react";
+
+export interface Component{i}Props {{
+  title: string;
+}}
+
+export default function Component{i}({{ title }}: Component{i}Props) {{
+  const label = `component {i}: ${{title}}`;
+  return <div className="component-{i}">{{label}}</div>;
+}}
+"""
+
+
+def create_workspace(file_count: int) -> str:
+    root = tempfile.mkdtemp(prefix="bench-workspace-")
+    for i in range(file_count):
+        directory = os.path.join(root, "src", "components", f"group{i // 50}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"Component{i}.tsx"), "w") as f:
+            f.write(COMPONENT_TEMPLATE.format(i=i))
+    return root
+
+
+def create_plan(file_count: int, task_count: int):
+    plan = []
+    for i in range(min(task_count, file_count)):
+        plan.append(
+            {
+                "description": f"Add a subtitle prop to Component{i}.",
+                "file_names": [f"src/components/group{i // 50}/Component{i}.tsx"],
+                "task_id": f"task_{i}",
+                # every fourth task depends on the one before it
+                "parent_task_id": f"task_{i - 1}" if i % 4 == 3 else None,
+            }
+        )
+    return plan
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def run_once(stub, message: str):
+    started = time.perf_counter()
+    planning_latency = None
+    file_started = {}
+    file_latencies = []
+    async for progress in stub.ProcessChatMessage(agents_pb2.ChatMessage(message=message)):
+        now = time.perf_counter()
+        if progress.status == "writing_code":
+            if planning_latency is None:
+                planning_latency = now - started
+            file_started.setdefault(progress.filename, now)
+        elif progress.status == "file_completed":
+            file_latencies.append(now - file_started.pop(progress.filename))
+    return planning_latency or 0.0, file_latencies, time.perf_counter() - started
+
+
+async def bench_size(args, file_count: int) -> dict:
+    workspace = create_workspace(file_count)
+    model_client = FakeChatCompletionClient(
+        plan=create_plan(file_count, args.tasks),
+        time_to_first_token=args.ttft,
+        tokens_per_second=args.tps,
+        completion_tokens=args.tokens,
+    )
+    multi_agent = MultiAgent()
+    await multi_agent.initialize(
+        model_client=model_client,
+        project_directory=workspace,
+        max_workers=args.workers,
+        edit_mode=args.edits,
+        edit_min_chars=0,
+        planner_mode=args.planner,
+    )
+    server = grpc.aio.server()
+    agents_pb2_grpc.add_AgentServiceServicer_to_server(AgentService(multi_agent), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+
+    monitor = LoopLagMonitor(interval=0.005)
+    monitor.start()
+    bytes_before = streaming_writer.total_bytes_written
+    results = []
+    try:
+        async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = agents_pb2_grpc.AgentServiceStub(channel)
+            for _ in range(args.repeat):
+                results.append(await run_once(stub, "Add a subtitle to the components."))
+    finally:
+        await monitor.stop()
+        await server.stop(None)
+        await multi_agent.stop()
+        shutil.rmtree(workspace)
+
+    file_latencies = [latency for _, files, _ in results for latency in files]
+    return {
+        "files": file_count,
+        "planning_s": statistics.mean(r[0] for r in results),
+        "file_mean_s": statistics.mean(file_latencies) if file_latencies else 0.0,
+        "file_max_s": max(file_latencies, default=0.0),
+        "wall_s": statistics.mean(r[2] for r in results),
+        "bytes_written": (streaming_writer.total_bytes_written - bytes_before) // args.repeat,
+        "loop_lag_p99_ms": percentile(monitor.samples, 0.99) * 1000,
+        "loop_lag_max_ms": max(monitor.samples, default=0.0) * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--tasks", type=int, default=8, help="files the plan changes")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ttft", type=float, default=0.2, help="time to first token (s)")
+    parser.add_argument("--tps", type=float, default=500, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=300, help="tokens per file")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--edits", action="store_true", help="workers answer with SEARCH/REPLACE edits"
+    )
+    parser.add_argument("--planner", choices=["stream", "tools"], default="stream")
+    args = parser.parse_args()
+
+    rows = [await bench_size(args, size) for size in args.sizes]
+    columns = list(rows[0])
+    print(" ".join(f"{column:>16}" for column in columns))
+    for row in rows:
+        print(
+            " ".join(
+                f"{value:>16.3f}" if isinstance(value, float) else f"{value:>16}"
+                for value in row.values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
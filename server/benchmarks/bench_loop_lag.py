@@ -0,0 +1,134 @@
+"""Event-loop responsiveness while a large workspace is scanned.
+
+Starts a session on a large synthetic workspace that has not been indexed
+yet and, while it plans, keeps calling the GetStats RPC to measure how long
+other gRPC callers wait. Exits with status 1 if the p99 round trip is above
+``--max-ms``, so it can guard against blocking work creeping back onto the
+event loop:
+
+    python benchmarks/bench_loop_lag.py --files 5000 --max-ms 100
+
+``--inline`` scans and builds the context on the event loop instead, for
+comparison.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import grpc
+
+import agents_pb2
+import agents_pb2_grpc
+from bench_latency import create_plan, create_workspace, percentile
+from multi_agent.fake_model_client import FakeChatCompletionClient
+from multi_agent.group_chat_manager import GroupChatManager
+from multi_agent.metrics import LoopLagMonitor, metrics
+from multi_agent.multi_agent import MultiAgent
+from server import AgentService
+
+
+async def list_files_inline(self, query: str):
+    # the scan and build as they ran before the executors
+    with metrics.span("snapshot_build"):
+        self._workspace_index.refresh()
+        return self._context_builder.build(query)
+
+
+async def first_dispatch(call) -> None:
+    async for progress in call:
+        if progress.status == "writing_code":
+            return
+
+
+async def bench(args) -> dict:
+    if args.inline:
+        GroupChatManager.list_files_with_content = list_files_inline
+    workspace = create_workspace(args.files)
+    multi_agent = MultiAgent()
+    await multi_agent.initialize(
+        model_client=FakeChatCompletionClient(
+            plan=create_plan(args.files, 4), completion_tokens=50
+        ),
+        project_directory=workspace,
+    )
+    if not args.cold:
+        # let the tokenizer processes finish starting, as on a running server
+        await asyncio.sleep(args.warmup)
+    server = grpc.aio.server()
+    agents_pb2_grpc.add_AgentServiceServicer_to_server(AgentService(multi_agent), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+
+    monitor = LoopLagMonitor(interval=0.005)
+    monitor.start()
+    round_trips = []
+    try:
+        async with grpc.aio.insecure_channel(f"127.0.0.1:{port}") as channel:
+            stub = agents_pb2_grpc.AgentServiceStub(channel)
+            call = stub.ProcessChatMessage(
+                agents_pb2.ChatMessage(message="Add a subtitle to the components.")
+            )
+            session = asyncio.ensure_future(first_dispatch(call))
+            # probe until the first task is dispatched, i.e. the scan is over
+            started = time.perf_counter()
+            while not session.done():
+                probe = time.perf_counter()
+                await stub.GetStats(agents_pb2.StatsRequest())
+                round_trips.append(time.perf_counter() - probe)
+                await asyncio.sleep(args.interval)
+            await session
+            scan = time.perf_counter() - started
+            async for _ in call:
+                pass
+    finally:
+        await monitor.stop()
+        await server.stop(None)
+        await multi_agent.stop()
+        shutil.rmtree(workspace)
+
+    return {
+        "mode": "inline" if args.inline else "executors",
+        "files": args.files,
+        "scan_s": scan,
+        "probes": len(round_trips),
+        "rpc_p99_ms": percentile(round_trips, 0.99) * 1000,
+        "rpc_max_ms": max(round_trips, default=0.0) * 1000,
+        "loop_lag_max_ms": max(monitor.samples, default=0.0) * 1000,
+    }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between probes")
+    parser.add_argument("--max-ms", type=float, default=100, help="allowed p99 round trip")
+    parser.add_argument("--inline", action="store_true", help="scan on the event loop")
+    parser.add_argument(
+        "--cold", action="store_true", help="scan while the tokenizer processes start"
+    )
+    parser.add_argument("--warmup", type=float, default=3, help="seconds to wait otherwise")
+    args = parser.parse_args()
+
+    row = await bench(args)
+    print(" ".join(f"{column:>16}" for column in row))
+    print(
+        " ".join(
+            f"{value:>16.3f}" if isinstance(value, float) else f"{value:>16}"
+            for value in row.values()
+        )
+    )
+    if row["rpc_p99_ms"] > args.max_ms:
+        print(f"p99 round trip {row['rpc_p99_ms']:.1f}ms is above {args.max_ms:g}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
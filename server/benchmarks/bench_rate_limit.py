@@ -0,0 +1,110 @@
+"""Rate limiter benchmark against a local fake OpenAI API that returns 429s.
+
+Runs ``--sessions`` sessions that each stream ``--calls`` completions at the
+same time through OpenAIChatCompletionClient, with and without the shared
+RateLimiter in front of it:
+
+    python benchmarks/bench_rate_limit.py --sessions 4 --calls 25
+"""
+
+import argparse
+import asyncio
+import contextvars
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from autogen_core.models import UserMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from fake_openai_server import FakeOpenAIServer
+from multi_agent.rate_limiter import RateLimitedChatCompletionClient, RateLimiter
+
+
+session_var = contextvars.ContextVar("session", default="")
+
+
+async def run_session(client, session: str, calls: int):
+    session_var.set(session)
+    started = time.perf_counter()
+    ok = failed = 0
+
+    async def call(i: int):
+        nonlocal ok, failed
+        try:
+            messages = [UserMessage(content=f"{session} request {i}", source="user")]
+            async for _ in client.create_stream(messages):
+                pass
+            ok += 1
+        except Exception:
+            failed += 1
+
+    await asyncio.gather(*[call(i) for i in range(calls)])
+    return ok, failed, time.perf_counter() - started
+
+
+async def bench(args, limited: bool) -> dict:
+    server = FakeOpenAIServer(
+        requests_per_second=args.rps, max_concurrent=args.max_concurrent
+    ).start()
+    client = OpenAIChatCompletionClient(
+        model="gpt-4o", api_key="fake", base_url=server.base_url, max_retries=0
+    )
+    limiter = RateLimiter(max_concurrency=args.concurrency)
+    if limited:
+        client = RateLimitedChatCompletionClient(
+            client,
+            limiter,
+            max_retries=args.retries,
+            base_delay=0.2,
+            session_key=session_var.get,
+        )
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *[run_session(client, f"session{i}", args.calls) for i in range(args.sessions)]
+    )
+    wall = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+    durations = [duration for _, _, duration in results]
+    return {
+        "limiter": "on" if limited else "off",
+        "ok": sum(ok for ok, _, _ in results),
+        "failed": sum(failed for _, failed, _ in results),
+        "server_429s": server.rate_limited,
+        "wall_s": wall,
+        # spread of session durations, low means sessions were served fairly
+        "session_spread_s": max(durations) - min(durations),
+        "session_mean_s": statistics.mean(durations),
+        "final_limit": limiter.limit if limited else 0.0,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--calls", type=int, default=25, help="streamed calls per session")
+    parser.add_argument("--rps", type=float, default=20, help="server requests per second")
+    parser.add_argument("--max-concurrent", type=int, default=4, help="server concurrency")
+    parser.add_argument("--concurrency", type=int, default=16, help="limiter start limit")
+    parser.add_argument("--retries", type=int, default=8)
+    args = parser.parse_args()
+
+    rows = [await bench(args, limited=False), await bench(args, limited=True)]
+    columns = list(rows[0])
+    print(" ".join(f"{column:>16}" for column in columns))
+    for row in rows:
+        print(
+            " ".join(
+                f"{value:>16.3f}" if isinstance(value, float) else f"{value:>16}"
+                for value in row.values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
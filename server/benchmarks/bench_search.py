@@ -0,0 +1,124 @@
+"""Build and query times of the workspace search index and import graph.
+
+Indexes a synthetic workspace, then times top-k queries, from ones that name
+a single file to ones that match every file, and incremental updates. The
+import graph is built over the same files with a few imports added to each.
+Exits with status 1 if the p99 query is above ``--max-ms``:
+
+    python benchmarks/bench_search.py --files 10000 --max-ms 50
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_latency import COMPONENT_TEMPLATE, create_workspace, percentile
+from multi_agent.import_graph import ImportGraph
+from multi_agent.search_index import SearchIndex
+
+TSCONFIG = '{"compilerOptions": {"paths": {"@/*": ["./*"]}}}'
+
+
+def read_workspace(root: str):
+    documents = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path) as f:
+                documents.append((os.path.relpath(path, root), f.read()))
+    return documents
+
+
+def with_imports(documents, count: int = 5):
+    # each component uses a few random others
+    paths = [path for path, _ in documents]
+    for path, content in documents:
+        imports = "".join(
+            f'import {{ X }} from "@/{os.path.splitext(other)[0]}";\n'
+            for other in random.sample(paths, count)
+        )
+        yield path, imports + content
+
+
+def queries(file_count: int, count: int):
+    # a specific file, a few related ones and terms that every file contains
+    for _ in range(count):
+        i = random.randrange(file_count)
+        yield random.choice(
+            [
+                f"Add a subtitle to Component{i}",
+                f"Render the title of the components in group{i // 50}",
+                "Change the label of every component",
+            ]
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=50, help="allowed p99 query")
+    args = parser.parse_args()
+
+    workspace = create_workspace(args.files)
+    try:
+        documents = read_workspace(workspace)
+    finally:
+        shutil.rmtree(workspace)
+
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.update(documents)
+    build = time.perf_counter() - started
+
+    graph = ImportGraph()
+    graph.update([("tsconfig.json", TSCONFIG)])
+    sources = list(with_imports(documents))
+    started = time.perf_counter()
+    graph.update(sources)
+    graph_build = time.perf_counter() - started
+
+    query_times = []
+    for query in queries(args.files, args.queries):
+        started = time.perf_counter()
+        index.search(query, k=args.k)
+        query_times.append(time.perf_counter() - started)
+
+    update_times = []
+    for _ in range(args.queries):
+        path, _ = random.choice(documents)
+        content = COMPONENT_TEMPLATE.format(i=random.randrange(args.files))
+        started = time.perf_counter()
+        index.update([(path, content)])
+        update_times.append(time.perf_counter() - started)
+
+    row = {
+        "files": len(index),
+        "build_s": build,
+        "query_p50_ms": percentile(query_times, 0.5) * 1000,
+        "query_p99_ms": percentile(query_times, 0.99) * 1000,
+        "update_p99_ms": percentile(update_times, 0.99) * 1000,
+        "graph_build_s": graph_build,
+    }
+    print(" ".join(f"{column:>14}" for column in row))
+    print(
+        " ".join(
+            f"{value:>14.3f}" if isinstance(value, float) else f"{value:>14}"
+            for value in row.values()
+        )
+    )
+    if row["query_p99_ms"] > args.max_ms:
+        print(f"p99 query {row['query_p99_ms']:.1f}ms is above {args.max_ms:g}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Cold start benchmark for the gRPC server.
+
+Starts ``server.py`` as a new process against ``fake_openai_server.py`` and a
+synthetic workspace, and times how long it takes until it listens, until the
+Health RPC reports it ready, and the first and second ProcessChatMessage
+requests after that:
+
+    python benchmarks/bench_startup.py --files 1000 --runs 3
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import grpc
+
+import agents_pb2
+import agents_pb2_grpc
+from bench_latency import create_workspace
+from fake_openai_server import FakeOpenAIServer
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def request_seconds(stub) -> float:
+    started = time.perf_counter()
+    async for _ in stub.ProcessChatMessage(
+        agents_pb2.ChatMessage(message="Add a subtitle to Component0.")
+    ):
+        pass
+    return time.perf_counter() - started
+
+
+async def run_once(args, base_url: str, workspace: str) -> dict:
+    port = free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="bench",
+        OPENAI_BASE_URL=base_url,
+        WORKSPACE_DIR=workspace,
+        GRPC_PORT=str(port),
+        LOG_LEVEL="ERROR",
+        PYTHONWARNINGS="ignore",
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, SERVER], env=env)
+    listening = None
+    try:
+        async with grpc.aio.insecure_channel(
+            f"127.0.0.1:{port}",
+            # the default backoff would hide when the port opened
+            options=[
+                ("grpc.initial_reconnect_backoff_ms", 10),
+                ("grpc.min_reconnect_backoff_ms", 10),
+                ("grpc.max_reconnect_backoff_ms", 10),
+            ],
+        ) as channel:
+            stub = agents_pb2_grpc.AgentServiceStub(channel)
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"server.py exited with {process.returncode}")
+                try:
+                    health = await stub.Health(agents_pb2.HealthRequest(), timeout=1)
+                except grpc.aio.AioRpcError:
+                    await asyncio.sleep(args.poll)
+                    continue
+                if listening is None:
+                    listening = time.perf_counter() - started
+                if health.ready:
+                    break
+                await asyncio.sleep(args.poll)
+            ready = time.perf_counter() - started
+            first = await request_seconds(stub)
+            second = await request_seconds(stub)
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "listening_s": listening,
+        "ready_s": ready,
+        "server_ready_s": health.startup_seconds,
+        "first_request_s": first,
+        "second_request_s": second,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=1000, help="workspace size")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--poll", type=float, default=0.01, help="health check interval (s)")
+    args = parser.parse_args()
+
+    openai = FakeOpenAIServer(requests_per_second=1000, max_concurrent=100, latency=0.01)
+    openai.start()
+    workspace = create_workspace(args.files)
+    try:
+        runs = [await run_once(args, openai.base_url, workspace) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workspace)
+        openai.shutdown()
+
+    # medians over the runs
+    row = {"files": args.files}
+    row.update({column: statistics.median(run[column] for run in runs) for column in runs[0]})
+    print(" ".join(f"{column:>16}" for column in row))
+    print(
+        " ".join(
+            f"{value:>16.3f}" if isinstance(value, float) else f"{value:>16}"
+            for value in row.values()
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
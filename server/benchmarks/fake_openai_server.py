@@ -0,0 +1,173 @@
+"""A local stand-in for the OpenAI chat completions API that rate limits.
+
+Answers ``POST /v1/chat/completions``, streamed or not, and responds with 429
+and a ``Retry-After`` header once more than ``--max-concurrent`` requests are
+in flight or more than ``--rps`` arrived within the last second. Point the
+server at it to try the rate limiter without spending anything:
+
+    python benchmarks/fake_openai_server.py --port 8001
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python server.py
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        requests_per_second: float = 20,
+        max_concurrent: int = 4,
+        latency: float = 0.05,
+        chunk_delay: float = 0.005,
+        completion_words: int = 20,
+        retry_after: int = 1,
+    ) -> None:
+        super().__init__(address, FakeOpenAIHandler)
+        self.requests_per_second = requests_per_second
+        self.max_concurrent = max_concurrent
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.completion_words = completion_words
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.arrivals = deque()
+        self.requests = 0
+        self.rate_limited = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def admit(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.requests += 1
+            while self.arrivals and now - self.arrivals[0] > 1:
+                self.arrivals.popleft()
+            if (
+                self.in_flight >= self.max_concurrent
+                or len(self.arrivals) >= self.requests_per_second
+            ):
+                self.rate_limited += 1
+                return False
+            self.arrivals.append(now)
+            self.in_flight += 1
+            return True
+
+    def finish(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+
+    def start(self) -> "FakeOpenAIServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if not self.server.admit():
+            self.send_json(
+                429,
+                {
+                    "error": {
+                        "message": "Rate limit reached, please try again later.",
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                    }
+                },
+                headers={"Retry-After": str(self.server.retry_after)},
+            )
+            return
+        try:
+            time.sleep(self.server.latency)
+            words = [f"word{i} " for i in range(self.server.completion_words)]
+            if body.get("stream"):
+                self.stream(body["model"], words)
+            else:
+                self.send_json(200, self.completion(body["model"], "".join(words)))
+        finally:
+            self.server.finish()
+
+    def completion(self, model: str, content: str) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 10,
+                "completion_tokens": self.server.completion_words,
+                "total_tokens": 10 + self.server.completion_words,
+            },
+        }
+
+    def stream(self, model: str, words) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunk = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+        }
+        for word in words:
+            delta = {"index": 0, "delta": {"content": word}, "finish_reason": None}
+            self.wfile.write(f"data: {json.dumps({**chunk, 'choices': [delta]})}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.server.chunk_delay)
+        last = {"index": 0, "delta": {}, "finish_reason": "stop"}
+        self.wfile.write(f"data: {json.dumps({**chunk, 'choices': [last]})}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def send_json(self, status: int, payload: dict, headers: dict = {}) -> None:
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--max-concurrent", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(
+        ("127.0.0.1", args.port),
+        requests_per_second=args.rps,
+        max_concurrent=args.max_concurrent,
+        latency=args.latency,
+    )
+    print(f"Fake OpenAI API on {server.base_url}")
+    server.serve_forever()
@@ -1,4 +1,4 @@
-from typing import List
+import logging
 
 from autogen_core import MessageContext
 from autogen_core import (
@@ -7,13 +7,15 @@ from autogen_core import (
 )
 from autogen_core.models import (
     ChatCompletionClient,
-    LLMMessage,
     SystemMessage,
     UserMessage,
 )
+from multi_agent.chat_history import ChatHistory
 from multi_agent.messages import GroupChatMessage
 
 
+logger = logging.getLogger(__name__)
+
 class BaseGroupChatAgent(RoutedAgent):
     """A group chat participant using an LLM."""
 
@@ -23,18 +25,19 @@ class BaseGroupChatAgent(RoutedAgent):
         group_chat_topic_type: str,
         model_client: ChatCompletionClient,
         system_message: str,
+        history_token_budget: int = 4000,
     ) -> None:
         super().__init__(description=description)
         self._group_chat_topic_type = group_chat_topic_type
         self._model_client = model_client
         self._system_message = SystemMessage(content=system_message)
-        self._chat_history: List[LLMMessage] = []
+        self._chat_history = ChatHistory(token_budget=history_token_budget)
 
     @message_handler
     async def handle_message(
         self, message: GroupChatMessage, ctx: MessageContext
     ) -> None:
-        print(f"group chat agent received message: {message}")
+        logger.debug("group chat agent received message: %s", message)
 
     # @message_handler
     # async def handle_request_to_speak(
@@ -1,6 +1,10 @@
+import asyncio
+import hashlib
+import logging
 import os
+
 from multi_agent.agents.base_group_chat_agent import BaseGroupChatAgent
-from autogen_core import MessageContext
+from autogen_core import CancellationToken, MessageContext
 
 from autogen_core.models import (
     ChatCompletionClient,
@@ -10,18 +14,88 @@ from autogen_core.models import (
     CreateResult,
 )
 from autogen_core import (
-    DefaultTopicId,
     message_handler,
 )
 
+from multi_agent.blob_store import BlobStore
+from multi_agent.edits import EditError, apply_edits, parse_edits
+from multi_agent.executors import run_blocking
 from multi_agent.messages import (
-    GroupChatMessage,
     SingleTaskMessage,
     TaskCompletionMessage,
 )
+from multi_agent.streaming_writer import StreamingFileWriter
+
+from multi_agent.metrics import metrics
+from multi_agent.session import put_update
+
+
+logger = logging.getLogger(__name__)
+
+# rendering whole files with rich is slow and blocks the event loop
+RICH_DEBUG = os.environ.get("RICH_DEBUG") == "1"
+
+EDIT_SYSTEM_MESSAGE = """
+            You are a highly skilled Next.js developer highly proficient in writing the functionality fo the nextjs application. You are here to change code to solve a given problem. You will get the request in following format:
+            - Request: "Add a button to this login page."
+            - Filename: "login.tsx"
+            - Current file content: "<the contents of the existing file>"
+            Respond only with edits to the current file content, as one or more blocks of this form:
+            <<<<<<< SEARCH
+            lines copied exactly from the current file content
+            =======
+            the lines that replace them
+            >>>>>>> REPLACE
+            Every SEARCH section must match exactly one place in the file, include a few unchanged lines around the change to make it unique.
+            Keep the blocks small and do not repeat code that does not change.
+            You can not write to any other file.
+            You can not use markdown in your response.
+            use client if you are using something like `useState` or `useEffect` in your code.
+            """
 
-from rich.console import Console
-from rich.markdown import Markdown
+
+class DeltaStream:
+    """Numbers the chunks of one file for the session's delta queue."""
+
+    def __init__(
+        self,
+        queue: asyncio.Queue | None,
+        filename: str,
+        cancellation_token: CancellationToken,
+    ) -> None:
+        self._queue = queue
+        self._filename = filename
+        self._cancellation_token = cancellation_token
+        self._sequence = 0
+        self._offset = 0
+
+    async def send(self, content: str) -> None:
+        if self._queue is None:
+            return
+        await self._put(
+            {"sequence": self._sequence, "offset": self._offset, "content": content}
+        )
+        self._sequence += 1
+        self._offset += len(content)
+
+    async def finish(self, content: str) -> None:
+        if self._queue is None:
+            return
+        await self._put(
+            {
+                "sequence": self._sequence,
+                "offset": self._offset,
+                "final": True,
+                "content_hash": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            }
+        )
+
+    async def _put(self, delta: dict) -> None:
+        await put_update(
+            self._queue,
+            {"status": "writing_code", "filename": self._filename, "delta": delta},
+            self._cancellation_token,
+        )
 
 
 class NextJSProgrammingAgent(BaseGroupChatAgent):
@@ -31,6 +105,13 @@ class NextJSProgrammingAgent(BaseGroupChatAgent):
         description: str,
         group_chat_topic_type: str,
         model_client: ChatCompletionClient,
+        flush_interval: float = 0.25,
+        flush_bytes: int = 4096,
+        queue: asyncio.Queue | None = None,
+        edit_mode: bool = False,
+        edit_min_chars: int = 2000,
+        history_token_budget: int = 4000,
+        blobs: BlobStore | None = None,
     ) -> None:
         super().__init__(
             description=description,
@@ -47,57 +128,135 @@ class NextJSProgrammingAgent(BaseGroupChatAgent):
             Only code content is allowed in your response.
             use client if you are using something like `useState` or `useEffect` in your code.
             """,
+            history_token_budget=history_token_budget,
         )
+        self._flush_interval = flush_interval
+        self._flush_bytes = flush_bytes
+        # when set, every streamed chunk is also sent to the session as a delta
+        self._queue = queue
+        # existing files of at least edit_min_chars are changed with
+        # SEARCH/REPLACE edits instead of being written out again
+        self._edit_mode = edit_mode
+        self._edit_min_chars = edit_min_chars
+        self._edit_system_message = SystemMessage(content=EDIT_SYSTEM_MESSAGE)
+        # file contents come and go as refs to the session's blob store
+        self._blobs = blobs if blobs is not None else BlobStore()
 
     @message_handler
     async def handle_request_to_code(
         self, message: SingleTaskMessage, ctx: MessageContext
-    ) -> None:
-        # print(f"\n{'-'*80}\n{self.id.type}:", flush=True)
-
-        print("writing the file {}".format(message.file_name))
-        self._chat_history.append(
+    ) -> TaskCompletionMessage:
+        logger.info("writing the file %s", message.file_name)
+        # earlier tasks are only sent as their request, without the file content
+        self._chat_history.start_task()
+        file_content = self._blobs.get(message.file_content)
+        related_files = ""
+        if message.related_files:
+            related_files = (
+                "Imported and related files, for reference only:\n"
+                f"{message.related_files}\n"
+            )
+        # counts the tokens of the file content, which can take a while
+        await run_blocking(
+            self._chat_history.append,
             UserMessage(
                 content=f"""
                 Request: {message.description}
                 Filename: {message.file_name}
-                Current file content: {message.file_content}
+                {related_files}Current file content: {file_content}
                 """,
                 source="system",
-            )
+            ),
+            summary=UserMessage(
+                content=f"""
+                Request: {message.description}
+                Filename: {message.file_name}
+                """,
+                source="system",
+            ),
         )
-        file_content = ""
-        # async generator
-        async for item in self._model_client.create_stream(
-            [self._system_message] + self._chat_history
-        ):
-            if isinstance(item, CreateResult):
-                completion = item
-            else:
-                # print(item, flush=True)
-                # write to the disk
-                file_content += item
-                self._write_to_disk(
-                    file_name=message.full_path, file_content=file_content
+        deltas = DeltaStream(self._queue, message.file_name, ctx.cancellation_token)
+        content = None
+        if self._edit_mode and message.file_content.size >= self._edit_min_chars:
+            with metrics.span("file_generation", mode="edit"):
+                content = await self.generate_edits(
+                    message, file_content, deltas, ctx.cancellation_token
                 )
+        if content is None:
+            with metrics.span("file_generation", mode="full"):
+                content = await self.generate_file(message, deltas, ctx.cancellation_token)
+        await deltas.finish(content)
+        self._chat_history.append(
+            AssistantMessage(content=f"Wrote {message.file_name}.", source=self.id.type)
+        )
+        if RICH_DEBUG:
+            from rich.console import Console
+            from rich.markdown import Markdown
 
-        assert isinstance(completion.content, str)
-        Console().print(Markdown(completion.content))
-        # print(completion.content, flush=True)
-        await self.publish_message(
-            TaskCompletionMessage(
-                file_name=message.file_name,
-                file_content=completion.content,
-                completion="code",
-            ),
-            topic_id=DefaultTopicId(type=self._group_chat_topic_type),
+            Console().print(Markdown(content))
+        # the manager sends the task directly, reply to it instead of publishing
+        return TaskCompletionMessage(
+            task_id=message.task_id,
+            file_name=message.file_name,
+            file_content=self._blobs.put(content),
+            completion="code",
         )
 
-    def _write_to_disk(self, file_name: str, file_content: str):
-        # if the file parent directory does not exist, create it
-        if not os.path.exists(os.path.dirname(file_name)):
-            os.makedirs(os.path.dirname(file_name))
+    async def generate_file(
+        self,
+        message: SingleTaskMessage,
+        deltas: DeltaStream,
+        cancellation_token: CancellationToken,
+    ) -> str:
+        writer = StreamingFileWriter(
+            message.full_path,
+            flush_interval=self._flush_interval,
+            flush_bytes=self._flush_bytes,
+        )
+        try:
+            # async generator
+            async for item in self._model_client.create_stream(
+                [self._system_message] + self._chat_history.messages(),
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(item, CreateResult):
+                    completion = item
+                else:
+                    # buffered, flushed to disk for the live preview now and then
+                    writer.write(item)
+                    await deltas.send(item)
+        except BaseException:
+            writer.abort()
+            raise
 
-        with open(file_name, "w") as f:
-            f.write(file_content)
-        return True
+        assert isinstance(completion.content, str)
+        await run_blocking(writer.close, completion.content)
+        return completion.content
+
+    async def generate_edits(
+        self,
+        message: SingleTaskMessage,
+        file_content: str,
+        deltas: DeltaStream,
+        cancellation_token: CancellationToken,
+    ) -> str | None:
+        """Ask for edits and apply them, None if they do not apply cleanly."""
+        completion = await self._model_client.create(
+            [self._edit_system_message] + self._chat_history.messages(),
+            cancellation_token=cancellation_token,
+        )
+        assert isinstance(completion.content, str)
+        try:
+            content = apply_edits(file_content, parse_edits(completion.content))
+        except EditError as e:
+            logger.warning(
+                "Edits for %s did not apply, regenerating the file: %s",
+                message.file_name,
+                e,
+            )
+            metrics.increment("edit_fallbacks")
+            return None
+        metrics.increment("edits_applied")
+        await run_blocking(StreamingFileWriter(message.full_path).close, content)
+        await deltas.send(content)
+        return content
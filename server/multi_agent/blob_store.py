@@ -0,0 +1,74 @@
+import hashlib
+from typing import Dict
+
+from pydantic import BaseModel
+
+
+class BlobRef(BaseModel):
+    """A file body in a :class:`BlobStore`, by the hash of its content."""
+
+    hash: str
+    size: int
+    # only set while the blob travels to another process, see BlobStore.inline
+    content: str | None = None
+
+
+class BlobStore:
+    """File bodies of a session, keyed by content hash and reference counted.
+
+    Messages between the manager and its workers carry a :class:`BlobRef`
+    instead of the text, so a file body is held once however many messages
+    and agents refer to it. Each :meth:`put` is matched by a :meth:`release`;
+    the body is dropped with its last reference. Stores are per process, a
+    ref sent to a worker process is :meth:`inline`-d on the way out and
+    :meth:`absorb`-ed on the way in.
+    """
+
+    def __init__(self) -> None:
+        self._blobs: Dict[str, str] = {}
+        self._references: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    @property
+    def size(self) -> int:
+        return sum(len(content) for content in self._blobs.values())
+
+    def put(self, content: str) -> BlobRef:
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if digest not in self._blobs:
+            self._blobs[digest] = content
+        self._references[digest] = self._references.get(digest, 0) + 1
+        return BlobRef(hash=digest, size=len(content))
+
+    def get(self, ref: BlobRef) -> str:
+        if ref.content is not None:
+            return ref.content
+        try:
+            return self._blobs[ref.hash]
+        except KeyError:
+            raise KeyError(f"Blob {ref.hash} is not in the store") from None
+
+    def release(self, ref: BlobRef) -> None:
+        references = self._references.get(ref.hash, 0) - 1
+        if references > 0:
+            self._references[ref.hash] = references
+        else:
+            self._references.pop(ref.hash, None)
+            self._blobs.pop(ref.hash, None)
+
+    def inline(self, ref: BlobRef) -> BlobRef:
+        """A copy of ``ref`` that carries its content, to leave the process."""
+        return ref.model_copy(update={"content": self.get(ref)})
+
+    def absorb(self, ref: BlobRef) -> BlobRef:
+        """Store the content of an inlined ref, the plain ref that is returned
+        is released like one from :meth:`put`."""
+        if ref.content is None:
+            raise ValueError(f"Blob {ref.hash} came without its content")
+        return self.put(ref.content)
+
+    def clear(self) -> None:
+        self._blobs.clear()
+        self._references.clear()
@@ -0,0 +1,93 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List
+
+from autogen_core.models import LLMMessage
+
+from multi_agent.workspace_index import count_tokens
+
+
+@dataclass
+class HistoryEntry:
+    message: LLMMessage
+    tokens: int
+    # sent instead of ``message`` once a newer task has started
+    summary: LLMMessage | None = None
+    summary_tokens: int = 0
+
+    def compact(self) -> None:
+        """Replace the message by its summary, so the full payload, e.g. a
+        file's content, is not kept once the task is over."""
+        if self.summary is not None:
+            self.message, self.tokens = self.summary, self.summary_tokens
+            self.summary, self.summary_tokens = None, 0
+
+    @property
+    def compact_message(self) -> LLMMessage:
+        return self.summary or self.message
+
+    @property
+    def compact_tokens(self) -> int:
+        return self.summary_tokens if self.summary is not None else self.tokens
+
+
+def message_tokens(message: LLMMessage) -> int:
+    content = message.content
+    return count_tokens(content if isinstance(content, str) else str(content))
+
+
+class ChatHistory:
+    """Chat history that stays within ``token_budget`` tokens.
+
+    Only the messages of the current task, everything since the last
+    :meth:`start_task`, are sent in full. Earlier messages are replaced by
+    their summary, e.g. the request without the file content it carried, which
+    is all that is kept of them, and the oldest ones are dropped once the
+    budget is exceeded. The current task
+    is always sent, even if it is over budget on its own.
+    """
+
+    def __init__(self, token_budget: int = 4000) -> None:
+        self._token_budget = token_budget
+        self._entries: Deque[HistoryEntry] = deque()
+        self._task_start = 0
+
+    def start_task(self) -> None:
+        # the previous task is over, only its summaries are sent from now on
+        for i in range(self._task_start, len(self._entries)):
+            self._entries[i].compact()
+        self._task_start = len(self._entries)
+
+    def append(self, message: LLMMessage, summary: LLMMessage | None = None) -> None:
+        entry = HistoryEntry(message=message, tokens=message_tokens(message))
+        if summary is not None:
+            entry.summary = summary
+            entry.summary_tokens = message_tokens(summary)
+        self._entries.append(entry)
+
+    def messages(self) -> List[LLMMessage]:
+        self._trim()
+        entries = list(self._entries)
+        earlier = [entry.compact_message for entry in entries[: self._task_start]]
+        return earlier + [entry.message for entry in entries[self._task_start :]]
+
+    @property
+    def token_count(self) -> int:
+        entries = list(self._entries)
+        return sum(entry.compact_tokens for entry in entries[: self._task_start]) + sum(
+            entry.tokens for entry in entries[self._task_start :]
+        )
+
+    def _trim(self) -> None:
+        # drop whole earlier messages, oldest first
+        total = self.token_count
+        while self._task_start > 0 and total > self._token_budget:
+            total -= self._entries.popleft().compact_tokens
+            self._task_start -= 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._task_start = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
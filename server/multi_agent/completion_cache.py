@@ -0,0 +1,190 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+
+from multi_agent.executors import run_blocking
+from multi_agent.metrics import metrics
+from multi_agent.wrapped_client import WrappedChatCompletionClient
+
+
+class CompletionCache:
+    """LRU of completions keyed by content hash, optionally persisted to SQLite.
+
+    Entries are stored as JSON and evicted least recently used first once the
+    in-memory total exceeds ``max_bytes``. When ``path`` is given every entry is
+    also written to a SQLite file, which is consulted on in-memory misses and
+    survives restarts. SQLite is read and written on the I/O thread pool.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, path: str | None = None) -> None:
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    async def get(self, key: str) -> CreateResult | None:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        elif self._db is not None:
+            value = await run_blocking(self._load, key)
+            if value is not None:
+                self._remember(key, value)
+        if value is None:
+            self.misses += 1
+            metrics.increment("completion_cache_misses")
+            return None
+        self.hits += 1
+        metrics.increment("completion_cache_hits")
+        result = CreateResult.model_validate_json(value)
+        result.cached = True
+        return result
+
+    async def put(self, key: str, result: CreateResult) -> None:
+        value = result.model_dump_json()
+        self._remember(key, value)
+        if self._db is not None:
+            await run_blocking(self._save, key, value)
+
+    def _load(self, key: str) -> str | None:
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def _save(self, key: str, value: str) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, value: str) -> None:
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self._max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class CachingChatCompletionClient(WrappedChatCompletionClient):
+    """Wraps a model client and answers repeated requests from a CompletionCache.
+
+    Cache hits from :meth:`create_stream` are replayed as a stream of chunks
+    followed by the :class:`CreateResult`, so streaming consumers do not need to
+    know whether a completion was cached.
+    """
+
+    # cached content is replayed in chunks of this many characters
+    replay_chunk_size = 64
+
+    def __init__(
+        self, client: ChatCompletionClient, cache: CompletionCache, model: str
+    ) -> None:
+        super().__init__(client)
+        self._cache = cache
+        self._model = model
+
+    def cache_key(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        json_output: Optional[bool],
+        extra_create_args: Mapping[str, Any],
+    ) -> str:
+        payload = {
+            "model": self._model,
+            "messages": [message.model_dump(mode="json") for message in messages],
+            "tools": [getattr(tool, "schema", tool) for tool in tools],
+            "json_output": json_output,
+            "extra_create_args": extra_create_args,
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        key = self.cache_key(messages, tools, json_output, extra_create_args)
+        cached = await self._cache.get(key)
+        if cached is not None:
+            return cached
+        result = await self._client.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+        await self._store(key, result)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        key = self.cache_key(messages, tools, json_output, extra_create_args)
+        cached = await self._cache.get(key)
+        if cached is not None:
+            if isinstance(cached.content, str):
+                for start in range(0, len(cached.content), self.replay_chunk_size):
+                    yield cached.content[start : start + self.replay_chunk_size]
+            yield cached
+            return
+
+        async for item in self._client.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(item, CreateResult):
+                await self._store(key, item)
+            yield item
+
+    async def _store(self, key: str, result: CreateResult) -> None:
+        # truncated or filtered completions are not worth replaying
+        if result.finish_reason in ("stop", "function_calls"):
+            await self._cache.put(key, result)
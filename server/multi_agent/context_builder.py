@@ -0,0 +1,167 @@
+import logging
+import re
+from typing import List, Set, Tuple
+
+from multi_agent.workspace_index import FileEntry, WorkspaceIndex, count_tokens
+
+
+_SIGNATURE_RE = re.compile(
+    r"^\s*(?:import\s|export\s|(?:async\s+)?function\s|class\s|interface\s|type\s"
+    r"|(?:const|let|var)\s+\w+\s*(?::[^=]*)?=\s*(?:async\s*)?\()"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def file_summary(entry: FileEntry) -> str:
+    """Signature-only view of a file: its imports, exports and declarations."""
+    if entry.summary is None:
+        lines = [
+            line.rstrip()
+            for line in entry.content.splitlines()
+            if _SIGNATURE_RE.match(line)
+        ]
+        entry.summary = "\n".join(lines)
+        entry.summary_token_count = count_tokens(entry.summary)
+    return entry.summary
+
+
+class ContextBuilder:
+    """Packs the workspace into the planner prompt within a token budget.
+
+    Files are ranked by how well their path, exports and content match the
+    user's message in the workspace's search index. The best matches are
+    included in full, files that no longer fit are reduced to their
+    signatures, and the rest are listed by path as far as the budget allows,
+    with a count of the files left out.
+    """
+
+    def __init__(self, index: WorkspaceIndex, token_budget: int) -> None:
+        self._index = index
+        self._token_budget = token_budget
+        # the render_file wrapper costs the same for every file
+        self._header_tokens = count_tokens(
+            WorkspaceIndex.render_file(
+                FileEntry(
+                    path="",
+                    mtime_ns=0,
+                    size=0,
+                    content_hash="",
+                    token_count=0,
+                    content="",
+                )
+            )
+        )
+
+    def rank(self, query: str) -> List[Tuple[float, FileEntry]]:
+        scores = self._index.search.scores(query)
+        # a copy, the build runs on a thread while the index may be refreshed
+        ranked = [
+            (scores.get(entry.path, 0.0), entry)
+            for entry in list(self._index.files.values())
+        ]
+        # best match first, then cheapest first so more files fit
+        ranked.sort(key=lambda item: (-item[0], item[1].token_count, item[1].path))
+        return ranked
+
+    def build(self, query: str) -> str:
+        ranked = [entry for _, entry in self.rank(query)]
+        full: List[FileEntry] = []
+        summarized: List[FileEntry] = []
+        listed: Set[str] = set()
+
+        # the listing header and the "... and N more files" line
+        remaining = self._token_budget - count_tokens(
+            self._render_listing([], len(ranked))
+        )
+        # the best matches are listed by path before anything is shown in
+        # full, with up to half the budget so large workspaces still get some
+        # files in full
+        listing_budget = min(remaining, self._token_budget // 2)
+        for entry in ranked:
+            listing_tokens = self._listing_tokens(entry)
+            if listing_tokens > listing_budget:
+                break
+            listed.add(entry.path)
+            listing_budget -= listing_tokens
+            remaining -= listing_tokens
+
+        for entry in ranked:
+            # promoting a listed file also frees its line in the listing
+            listing_tokens = self._listing_tokens(entry) if entry.path in listed else 0
+            wrapper_tokens = self._header_tokens + count_tokens(entry.path)
+            full_tokens = wrapper_tokens + entry.token_count - listing_tokens
+            if full_tokens <= remaining:
+                full.append(entry)
+                listed.discard(entry.path)
+                remaining -= full_tokens
+                continue
+            summary = file_summary(entry)
+            summary_tokens = wrapper_tokens + entry.summary_token_count - listing_tokens
+            if summary and summary_tokens <= remaining:
+                summarized.append(entry)
+                listed.discard(entry.path)
+                remaining -= summary_tokens
+
+        # what is left of the budget lists more of the files
+        shown = {entry.path for entry in full + summarized}
+        for entry in ranked:
+            if entry.path in listed or entry.path in shown:
+                continue
+            listing_tokens = self._listing_tokens(entry)
+            if listing_tokens > remaining:
+                break
+            listed.add(entry.path)
+            remaining -= listing_tokens
+
+        listing = [entry for entry in ranked if entry.path in listed]
+        omitted = len(ranked) - len(full) - len(summarized) - len(listing)
+        logger.info(
+            "Context: %d full, %d summarized, %d listed, %d omitted, %d tokens",
+            len(full),
+            len(summarized),
+            len(listing),
+            omitted,
+            self._token_budget - remaining,
+        )
+        parts = [WorkspaceIndex.render_file(entry) for entry in full]
+        parts.extend(self._render_summary(entry) for entry in summarized)
+        if listing or omitted:
+            parts.append(self._render_listing(listing, omitted))
+        return "".join(parts)
+
+    @staticmethod
+    def _listing_tokens(entry: FileEntry) -> int:
+        # "- <path>\n"
+        return count_tokens(entry.path) + 2
+
+    def related(self, filename: str, query: str, k: int) -> str:
+        """Signatures of the files ``filename`` imports and of the ``k`` other
+        files that match ``query`` best."""
+        paths = self._index.graph.imports(filename)
+        if k > 0:
+            exclude = {filename, *paths}
+            paths += [path for path, _ in self._index.search.search(query, k, exclude)]
+        parts = []
+        for path in paths:
+            entry = self._index.files.get(path)
+            if entry is not None and file_summary(entry):
+                parts.append(self._render_summary(entry))
+        return "".join(parts)
+
+    @staticmethod
+    def _render_summary(entry: FileEntry) -> str:
+        return (
+            f"Filepath - {entry.path}\n"
+            "Signatures (content omitted)\n"
+            "---------------------------\n"
+            f"{entry.summary}\n"
+            "---------------------------\n"
+        )
+
+    @staticmethod
+    def _render_listing(entries: List[FileEntry], omitted: int = 0) -> str:
+        lines = "".join(f"- {entry.path}\n" for entry in entries)
+        if omitted:
+            lines += f"... and {omitted} more files\n"
+        return f"Other files (content omitted)\n{lines}"
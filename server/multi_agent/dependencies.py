@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict
+
+from multi_agent.executors import run_blocking
+from multi_agent.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+LOCKFILES = ("package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml")
+# kept inside node_modules so deleting node_modules also forces a reinstall
+FINGERPRINT_FILE = os.path.join("node_modules", ".install-fingerprint")
+
+
+class DependencyInstaller:
+    """Runs ``npm install`` for a workspace only when its dependencies change.
+
+    The fingerprint is a hash of ``package.json`` and the lockfile, recorded
+    after every successful install. Installs run with the workspace as their
+    ``cwd`` and at most one runs per workspace at a time; sessions that ask
+    while one is running wait for the same install. The fingerprints are read
+    on the I/O thread pool.
+    """
+
+    _installers: Dict[str, "DependencyInstaller"] = {}
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self._task: asyncio.Task | None = None
+        self._task_fingerprint: str | None = None
+
+    @classmethod
+    def for_directory(cls, root: str) -> "DependencyInstaller":
+        root = os.path.abspath(root)
+        if root not in cls._installers:
+            cls._installers[root] = cls(root)
+        return cls._installers[root]
+
+    @classmethod
+    def release(cls, root: str) -> bool:
+        """Drop the installer of the workspace at ``root``, unless it is
+        installing. Returns whether it was dropped."""
+        root = os.path.abspath(root)
+        installer = cls._installers.get(root)
+        if installer is not None and installer.installing:
+            return False
+        cls._installers.pop(root, None)
+        return True
+
+    @property
+    def installing(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def fingerprint(self) -> str | None:
+        """Hash of package.json and the lockfile, None without a package.json."""
+        if not os.path.exists(os.path.join(self.root, "package.json")):
+            return None
+        digest = hashlib.sha256()
+        for name in ("package.json",) + LOCKFILES:
+            path = os.path.join(self.root, name)
+            if not os.path.exists(path):
+                continue
+            digest.update(name.encode("utf-8") + b"\0")
+            with open(path, "rb") as f:
+                digest.update(f.read())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def installed_fingerprint(self) -> str | None:
+        try:
+            with open(os.path.join(self.root, FINGERPRINT_FILE), "r") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _record(self, fingerprint: str) -> None:
+        # the install may have rewritten the lockfile, record what is on disk now
+        fingerprint = self.fingerprint() or fingerprint
+        path = os.path.join(self.root, FINGERPRINT_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(fingerprint)
+
+    async def ensure_installed(self) -> asyncio.Task | None:
+        """Start an install if the dependencies changed since the last one.
+
+        Returns the running install, or None when nothing needs installing.
+        """
+        # read before looking at the running install, so no other session can
+        # start one in between
+        fingerprint = await run_blocking(self.fingerprint)
+        installed = await run_blocking(self.installed_fingerprint)
+        if fingerprint is None:
+            logger.info("No package.json in %s, skipping npm install", self.root)
+            return None
+        if self.installing:
+            if self._task_fingerprint == fingerprint:
+                return self._task
+            # dependencies changed while installing, install again afterwards
+            self._task = asyncio.create_task(self._install_after(self._task, fingerprint))
+            self._task_fingerprint = fingerprint
+            return self._task
+        if fingerprint == installed:
+            metrics.increment("npm_install_skipped")
+            logger.info("Dependencies unchanged, skipping npm install")
+            return None
+        self._task = asyncio.create_task(self._install(fingerprint))
+        self._task_fingerprint = fingerprint
+        return self._task
+
+    async def _install_after(self, previous: asyncio.Task, fingerprint: str) -> bool:
+        await asyncio.gather(previous, return_exceptions=True)
+        return await self._install(fingerprint)
+
+    async def _install(self, fingerprint: str) -> bool:
+        try:
+            with metrics.span("npm_install"):
+                process = await asyncio.create_subprocess_exec(
+                    "npm",
+                    "install",
+                    cwd=self.root,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                stdout, stderr = await process.communicate()
+        except OSError as e:
+            logger.error("Could not run npm install: %s", e)
+            return False
+
+        if process.returncode != 0:
+            logger.error("npm install failed: %s", stderr.decode())
+            return False
+        await run_blocking(self._record, fingerprint)
+        logger.info("npm install succeeded")
+        return True
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from autogen_core import (
+    AgentId,
+    CancellationToken,
+    MessageContext,
+    RoutedAgent,
+    TopicId,
+    TypeSubscription,
+    message_handler,
+    try_get_known_serializers_for_type,
+)
+from autogen_ext.runtimes.grpc import GrpcWorkerAgentRuntime, GrpcWorkerAgentRuntimeHost
+
+from multi_agent.messages import (
+    HeartbeatAck,
+    ReleaseSession,
+    SingleTaskMessage,
+    TaskCompletionMessage,
+    WorkerDeregistration,
+    WorkerHeartbeat,
+)
+from multi_agent.metrics import metrics
+from multi_agent.session import session_id_for_key
+
+
+logger = logging.getLogger(__name__)
+
+# workers publish heartbeats to the registry, the manager publishes session
+# releases to every worker process
+registry_topic_type = "worker_registry"
+control_topic_type = "worker_control"
+
+
+def local_address(address: str) -> str:
+    # the host may listen on every interface, processes on this machine
+    # connect to it through localhost
+    return f"localhost:{address.rsplit(':', 1)[-1]}"
+
+
+@dataclass
+class RemoteWorker:
+    agent_type: str
+    capacity: int
+    last_seen: float
+    in_flight: int = 0
+    # resolved once the worker deregisters or stops sending heartbeats
+    lost: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / self.capacity
+
+
+class WorkerRegistry:
+    """Worker processes known to the manager and the load on each of them.
+
+    A worker is registered by its first heartbeat and forgotten when it
+    deregisters or misses heartbeats for ``heartbeat_timeout`` seconds.
+    """
+
+    def __init__(self, heartbeat_timeout: float = 15.0) -> None:
+        self._heartbeat_timeout = heartbeat_timeout
+        self.workers: Dict[str, RemoteWorker] = {}
+        # worker agent key -> worker process that holds its chat history
+        self._placements: Dict[str, str] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return sum(worker.in_flight for worker in self.workers.values())
+
+    def heartbeat(self, agent_type: str, capacity: int) -> None:
+        worker = self.workers.get(agent_type)
+        if worker is None:
+            logger.info("Worker %s registered, capacity %d", agent_type, capacity)
+            worker = self.workers[agent_type] = RemoteWorker(
+                agent_type=agent_type, capacity=max(capacity, 1), last_seen=0.0
+            )
+            metrics.set_gauge("remote_workers", len(self.workers))
+        worker.last_seen = time.monotonic()
+
+    def deregister(self, agent_type: str) -> None:
+        worker = self.workers.pop(agent_type, None)
+        if worker is None:
+            return
+        logger.info("Worker %s deregistered with %d tasks", agent_type, worker.in_flight)
+        worker.lost.set_result(None)
+        metrics.set_gauge("remote_workers", len(self.workers))
+
+    def expire(self) -> None:
+        deadline = time.monotonic() - self._heartbeat_timeout
+        for worker in list(self.workers.values()):
+            if worker.last_seen < deadline:
+                logger.warning("Worker %s stopped sending heartbeats", worker.agent_type)
+                self.deregister(worker.agent_type)
+
+    def place(self, key: str) -> RemoteWorker | None:
+        """The least loaded worker for the worker agent ``key``, or the worker
+        it ran on before while that one has spare capacity."""
+        worker = self.workers.get(self._placements.get(key, ""))
+        if worker is None or worker.load >= 1:
+            if not self.workers:
+                return None
+            worker = min(self.workers.values(), key=lambda w: (w.load, w.in_flight))
+        self._placements[key] = worker.agent_type
+        return worker
+
+    def forget(self, session_id: str) -> None:
+        for key in [key for key in self._placements if session_id_for_key(key) == session_id]:
+            del self._placements[key]
+
+
+class WorkerRegistryAgent(RoutedAgent):
+    def __init__(self, registry: WorkerRegistry) -> None:
+        super().__init__("Worker registry")
+        self._registry = registry
+
+    @message_handler
+    async def handle_heartbeat(
+        self, message: WorkerHeartbeat, ctx: MessageContext
+    ) -> HeartbeatAck:
+        self._registry.heartbeat(message.agent_type, message.capacity)
+        return HeartbeatAck(agent_type=message.agent_type)
+
+    @message_handler
+    async def handle_deregistration(
+        self, message: WorkerDeregistration, ctx: MessageContext
+    ) -> None:
+        self._registry.deregister(message.agent_type)
+
+
+class RemoteWorkers:
+    """Runs worker tasks in worker processes connected through a host runtime.
+
+    The host listens on ``address``; worker processes on this or other
+    machines connect to it with ``python -m multi_agent.worker --host
+    <address>``, and ``processes`` of them are started here. Each worker
+    process registers its own agent type, because the host routes every
+    agent type to exactly one process, and announces it with heartbeats.
+    Tasks go to the least loaded process, a worker that disappears
+    mid-task has its task moved to another one.
+    """
+
+    def __init__(
+        self,
+        address: str = "localhost:50060",
+        processes: int = 0,
+        heartbeat_timeout: float = 15.0,
+    ) -> None:
+        self._address = address
+        self._processes_wanted = processes
+        self.registry = WorkerRegistry(heartbeat_timeout=heartbeat_timeout)
+        self._host = GrpcWorkerAgentRuntimeHost(address=address)
+        self._runtime = GrpcWorkerAgentRuntime(host_address=local_address(address))
+        self._processes: List[asyncio.subprocess.Process] = []
+        self._tasks: Set[asyncio.Task] = set()
+        self._expiry: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._host.start()
+        self._runtime.start()
+        for message_type in (
+            SingleTaskMessage,
+            TaskCompletionMessage,
+            ReleaseSession,
+            HeartbeatAck,
+        ):
+            self._runtime.add_message_serializer(
+                try_get_known_serializers_for_type(message_type)
+            )
+        await WorkerRegistryAgent.register(
+            self._runtime, registry_topic_type, lambda: WorkerRegistryAgent(self.registry)
+        )
+        await self._runtime.add_subscription(
+            TypeSubscription(topic_type=registry_topic_type, agent_type=registry_topic_type)
+        )
+        self._expiry = asyncio.create_task(self._expire_workers())
+        server_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for _ in range(self._processes_wanted):
+            self._processes.append(
+                await asyncio.create_subprocess_exec(
+                    sys.executable,
+                    "-m",
+                    "multi_agent.worker",
+                    "--host",
+                    local_address(self._address),
+                    cwd=server_directory,
+                )
+            )
+        logger.info(
+            "Worker host on %s, started %d worker processes",
+            self._address,
+            len(self._processes),
+        )
+
+    async def _expire_workers(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            self.registry.expire()
+
+    async def run(
+        self,
+        message: SingleTaskMessage,
+        key: str,
+        cancellation_token: CancellationToken,
+    ) -> TaskCompletionMessage | None:
+        """Run ``message`` on a worker process as the worker agent ``key``.
+
+        Returns None when no worker process is connected, so the caller can
+        run the task itself.
+        """
+        while True:
+            worker = self.registry.place(key)
+            if worker is None:
+                return None
+            # the grpc runtime ignores cancellation tokens, the worker process
+            # is told to stop through release_session instead
+            request = asyncio.ensure_future(
+                self._runtime.send_message(message, AgentId(worker.agent_type, key))
+            )
+            self._tasks.add(request)
+            request.add_done_callback(self._request_done)
+            wait = asyncio.ensure_future(
+                asyncio.wait([request, worker.lost], return_when=asyncio.FIRST_COMPLETED)
+            )
+            cancellation_token.link_future(wait)
+            worker.in_flight += 1
+            metrics.set_gauge("remote_worker_tasks", self.registry.in_flight)
+            try:
+                await wait
+            finally:
+                worker.in_flight -= 1
+                metrics.set_gauge("remote_worker_tasks", self.registry.in_flight)
+            if request.done():
+                return request.result()
+            # the host never answers for a worker that is gone
+            request.cancel()
+            logger.warning(
+                "Worker %s was lost while writing %s, moving the task",
+                worker.agent_type,
+                message.file_name,
+            )
+            metrics.increment("remote_worker_retries")
+
+    def _request_done(self, request: asyncio.Future) -> None:
+        self._tasks.discard(request)
+        # retrieved by run() unless the session was cancelled meanwhile
+        if not request.cancelled():
+            request.exception()
+
+    def release_session(self, session_id: str) -> None:
+        """Cancel what is left of the session on the worker processes and
+        drop its workers there."""
+        self.registry.forget(session_id)
+        if not self.registry.workers:
+            return
+        task = asyncio.ensure_future(
+            self._runtime.publish_message(
+                ReleaseSession(session_id=session_id),
+                TopicId(control_topic_type, "default"),
+            )
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        if self._expiry is not None:
+            self._expiry.cancel()
+        for process in self._processes:
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*[process.wait() for process in self._processes])
+        await self._runtime.stop()
+        await self._host.stop()
@@ -0,0 +1,109 @@
+import re
+from dataclasses import dataclass
+from typing import List
+
+
+SEARCH_MARKER = re.compile(r"^<{5,} ?SEARCH\s*$")
+DIVIDER_MARKER = re.compile(r"^={5,}\s*$")
+REPLACE_MARKER = re.compile(r"^>{5,} ?REPLACE\s*$")
+HUNK_HEADER = re.compile(r"^@@ .* @@")
+
+
+class EditError(ValueError):
+    pass
+
+
+@dataclass
+class Edit:
+    search: str
+    replace: str
+
+
+def parse_search_replace(text: str) -> List[Edit]:
+    """Parse ``<<<<<<< SEARCH`` / ``=======`` / ``>>>>>>> REPLACE`` blocks."""
+    edits = []
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        if not SEARCH_MARKER.match(lines[i]):
+            i += 1
+            continue
+        search: List[str] = []
+        replace: List[str] = []
+        i += 1
+        while i < len(lines) and not DIVIDER_MARKER.match(lines[i]):
+            search.append(lines[i])
+            i += 1
+        i += 1
+        while i < len(lines) and not REPLACE_MARKER.match(lines[i]):
+            replace.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise EditError("Unterminated SEARCH/REPLACE block.")
+        i += 1
+        edits.append(Edit(search="\n".join(search), replace="\n".join(replace)))
+    return edits
+
+
+def parse_unified_diff(text: str) -> List[Edit]:
+    """Turn every hunk of a unified diff into an :class:`Edit`.
+
+    Line numbers in the hunk headers are ignored, hunks are located by their
+    context and removed lines instead, which is what models get right.
+    """
+    edits = []
+    search: List[str] | None = None
+    replace: List[str] = []
+
+    def finish_hunk():
+        if search is not None and (search or replace):
+            edits.append(Edit(search="\n".join(search), replace="\n".join(replace)))
+
+    for line in text.splitlines():
+        if HUNK_HEADER.match(line):
+            finish_hunk()
+            search, replace = [], []
+        elif search is None or line.startswith(("--- ", "+++ ")):
+            continue
+        elif line.startswith("-"):
+            search.append(line[1:])
+        elif line.startswith("+"):
+            replace.append(line[1:])
+        elif line.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        else:
+            # context, models often drop the leading space of empty lines
+            search.append(line[1:])
+            replace.append(line[1:])
+    finish_hunk()
+    return edits
+
+
+def parse_edits(text: str) -> List[Edit]:
+    """Parse a model response made of SEARCH/REPLACE blocks or a unified diff."""
+    edits = parse_search_replace(text)
+    if not edits:
+        edits = parse_unified_diff(text)
+    if not edits:
+        raise EditError("No edits found in the response.")
+    return edits
+
+
+def apply_edits(content: str, edits: List[Edit]) -> str:
+    """Apply ``edits`` in order, each one has to match exactly one place."""
+    for edit in edits:
+        if not edit.search.strip():
+            # only a new or empty file can be written without context
+            if content.strip():
+                raise EditError("Empty SEARCH section for a non-empty file.")
+            content = edit.replace
+            continue
+        matches = content.count(edit.search)
+        if matches != 1:
+            first_line = edit.search.strip().splitlines()[0]
+            if matches == 0:
+                raise EditError(f"SEARCH section not found: {first_line!r}")
+            raise EditError(f"SEARCH section matches {matches} places: {first_line!r}")
+        content = content.replace(edit.search, edit.replace, 1)
+    return content
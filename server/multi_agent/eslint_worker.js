@@ -0,0 +1,31 @@
+// Lints files for the server with the workspace's own ESLint and config.
+// Reads one JSON request per line on stdin, {"id": 1, "file": "src/a.tsx"},
+// and answers each with {"id": 1, "messages": [...]} or {"id": 1, "error": ""}.
+// Started in the workspace and kept running, so ESLint and its plugins are
+// only loaded once.
+const readline = require("readline");
+
+const root = process.cwd();
+
+async function load() {
+  const eslint = require(require.resolve("eslint", { paths: [root] }));
+  // loadESLint picks flat or legacy config like the eslint command does
+  const ESLint = eslint.loadESLint ? await eslint.loadESLint({ cwd: root }) : eslint.ESLint;
+  return new ESLint({ cwd: root });
+}
+
+const linter = load();
+// the answer goes out even if nobody waits for the lint to load
+linter.catch(() => {});
+
+readline.createInterface({ input: process.stdin }).on("line", async (line) => {
+  const { id, file } = JSON.parse(line);
+  let reply;
+  try {
+    const [result] = await (await linter).lintFiles([file]);
+    reply = { id, messages: result ? result.messages : [] };
+  } catch (e) {
+    reply = { id, error: String((e && e.message) || e) };
+  }
+  process.stdout.write(JSON.stringify(reply) + "\n");
+});
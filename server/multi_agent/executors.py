@@ -0,0 +1,117 @@
+"""Executors for blocking work, so it does not stall the shared event loop.
+
+File I/O and CPU work that touches shared state, like building the planner
+context, runs on a thread pool of ``IO_THREADS`` threads. Tokenizing large
+batches, e.g. a workspace that is indexed for the first time, is spread over
+``TOKENIZER_PROCESSES`` worker processes, smaller batches are tokenized on the
+thread pool. The tokenizer is only imported where it is used, so the server
+can run blocking work before tiktoken is loaded.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, TypeVar
+
+
+T = TypeVar("T")
+
+IO_THREADS = int(os.environ.get("IO_THREADS", 8))
+TOKENIZER_PROCESSES = int(
+    os.environ.get("TOKENIZER_PROCESSES", min(4, os.cpu_count() or 1))
+)
+# characters in a batch before it is worth sending to the worker processes
+PROCESS_TOKENIZE_MIN_CHARS = int(os.environ.get("PROCESS_TOKENIZE_MIN_CHARS", 1_000_000))
+
+_io_executor: ThreadPoolExecutor | None = None
+_tokenizer_executor: ProcessPoolExecutor | None = None
+
+
+def io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+    return _io_executor
+
+
+def tokenizer_executor() -> ProcessPoolExecutor:
+    global _tokenizer_executor
+    if _tokenizer_executor is None:
+        _tokenizer_executor = ProcessPoolExecutor(
+            max_workers=TOKENIZER_PROCESSES,
+            # forking a process that runs grpc threads is not safe
+            mp_context=multiprocessing.get_context("spawn"),
+            # load the BPE ranks once per process instead of per batch
+            initializer=_load_encoding,
+        )
+    return _tokenizer_executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run ``func`` on the I/O thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor(), partial(func, *args, **kwargs))
+
+
+def _load_encoding() -> None:
+    from multi_agent.workspace_index import get_encoding
+
+    get_encoding()
+
+
+def _count_tokens_batch(texts: List[str]) -> List[int]:
+    from multi_agent.workspace_index import count_tokens
+
+    return [count_tokens(text) for text in texts]
+
+
+async def count_tokens_batch(texts: List[str]) -> List[int]:
+    """Token counts of ``texts``, computed off the event loop."""
+    if not texts:
+        return []
+    total = sum(len(text) for text in texts)
+    if TOKENIZER_PROCESSES < 1 or total < PROCESS_TOKENIZE_MIN_CHARS:
+        return await run_blocking(_count_tokens_batch, texts)
+    # a few batches per process of about the same size, in order
+    batch_chars = total // (TOKENIZER_PROCESSES * 4) + 1
+    batches: List[List[str]] = [[]]
+    size = 0
+    for text in texts:
+        if size >= batch_chars:
+            batches.append([])
+            size = 0
+        batches[-1].append(text)
+        size += len(text)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *[
+            loop.run_in_executor(tokenizer_executor(), _count_tokens_batch, batch)
+            for batch in batches
+        ]
+    )
+    return [count for result in results for count in result]
+
+
+def warm_up() -> None:
+    """Start the tokenizer processes in the background.
+
+    Spawning them re-imports the server in each process, which is better
+    paid for at startup than by the first large snapshot.
+    """
+    if TOKENIZER_PROCESSES < 1:
+        return
+    executor = tokenizer_executor()
+    for _ in range(TOKENIZER_PROCESSES):
+        executor.submit(_count_tokens_batch, [])
+
+
+def shutdown() -> None:
+    global _io_executor, _tokenizer_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=False)
+        _io_executor = None
+    if _tokenizer_executor is not None:
+        _tokenizer_executor.shutdown(wait=False, cancel_futures=True)
+        _tokenizer_executor = None
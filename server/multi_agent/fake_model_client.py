@@ -0,0 +1,190 @@
+import asyncio
+import json
+from typing import Any, AsyncGenerator, Callable, Dict, List, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+
+from multi_agent.plan_stream import PLAN_FORMAT
+
+
+def default_file_content(messages: Sequence[LLMMessage], tokens: int) -> str:
+    lines = ["// generated by the fake model client"]
+    for i in range(max(tokens // 8, 1)):
+        lines.append(f"export const value{i} = {i};")
+    return "\n".join(lines) + "\n"
+
+
+def default_file_edits(messages: Sequence[LLMMessage]) -> str:
+    # a one line change below the first line of the current file content
+    content = str(messages[-1].content).split("Current file content:", 1)[-1]
+    first_line = content.lstrip().splitlines()[0] if content.strip() else ""
+    return (
+        f"<<<<<<< SEARCH\n{first_line}\n=======\n{first_line}\n"
+        "// edited by the fake model client\n>>>>>>> REPLACE\n"
+    )
+
+
+class FakeChatCompletionClient(ChatCompletionClient):
+    """Deterministic, local stand-in for a streaming chat model.
+
+    ``create`` answers the planner: the first call of a conversation returns the
+    scripted ``plan`` as ``assign_tasks`` tool calls, later calls answer with a
+    short text. Without tools it answers a worker in edit mode with
+    ``file_edits``. ``create_stream`` answers the workers, waiting
+    ``time_to_first_token`` seconds and then emitting ``completion_tokens``
+    chunks at ``tokens_per_second``, or streams the ``plan`` as JSON lines
+    when asked for a plan in the streamed format. Tool calls also take as
+    long as generating their arguments would.
+    """
+
+    def __init__(
+        self,
+        plan: List[Dict[str, Any]] | None = None,
+        time_to_first_token: float = 0.0,
+        tokens_per_second: float = 0.0,
+        completion_tokens: int = 200,
+        file_content: Callable[[Sequence[LLMMessage], int], str] = default_file_content,
+        tool_name: str = "assign_tasks",
+        file_edits: Callable[[Sequence[LLMMessage]], str] = default_file_edits,
+    ) -> None:
+        self.plan = plan or []
+        self.time_to_first_token = time_to_first_token
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.file_content = file_content
+        self.tool_name = tool_name
+        self.file_edits = file_edits
+        self.create_calls = 0
+        self.stream_calls = 0
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._actual_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    async def _first_token_delay(self) -> None:
+        if self.time_to_first_token > 0:
+            await asyncio.sleep(self.time_to_first_token)
+
+    def _record_usage(self, messages: Sequence[LLMMessage], completion_tokens: int) -> RequestUsage:
+        usage = RequestUsage(
+            prompt_tokens=self.count_tokens(messages),
+            completion_tokens=completion_tokens,
+        )
+        self._actual_usage = usage
+        self._total_usage = RequestUsage(
+            prompt_tokens=self._total_usage.prompt_tokens + usage.prompt_tokens,
+            completion_tokens=self._total_usage.completion_tokens + usage.completion_tokens,
+        )
+        return usage
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self.create_calls += 1
+        await self._first_token_delay()
+        if not tools:
+            edits = self.file_edits(messages)
+            # roughly four characters per token
+            tokens = max(len(edits) // 4, 1)
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(tokens / self.tokens_per_second)
+            return CreateResult(
+                finish_reason="stop",
+                content=edits,
+                usage=self._record_usage(messages, tokens),
+                cached=False,
+            )
+        planned = any(isinstance(m, FunctionExecutionResultMessage) for m in messages)
+        if tools and self.plan and not planned:
+            calls = [
+                FunctionCall(id=f"call_{i}", name=self.tool_name, arguments=json.dumps(args))
+                for i, args in enumerate(self.plan)
+            ]
+            # roughly four characters per token
+            tokens = sum(len(call.arguments) for call in calls) // 4
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(tokens / self.tokens_per_second)
+            return CreateResult(
+                finish_reason="function_calls",
+                content=calls,
+                usage=self._record_usage(messages, tokens),
+                cached=False,
+            )
+        return CreateResult(
+            finish_reason="stop",
+            content="All tasks have been assigned.",
+            usage=self._record_usage(messages, 6),
+            cached=False,
+        )
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        self.stream_calls += 1
+        if self.plan and any(PLAN_FORMAT in str(m.content) for m in messages):
+            content = "".join(json.dumps(task) + "\n" for task in self.plan)
+            tokens = len(content) // 4
+        else:
+            content = self.file_content(messages, self.completion_tokens)
+            tokens = self.completion_tokens
+        # split into roughly tokens equally sized chunks
+        chunk_size = max(len(content) // max(tokens, 1), 1)
+        chunks = [content[i : i + chunk_size] for i in range(0, len(content), chunk_size)]
+        await self._first_token_delay()
+        for chunk in chunks:
+            if cancellation_token is not None and cancellation_token.is_cancelled():
+                raise asyncio.CancelledError()
+            if self.tokens_per_second > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield chunk
+        yield CreateResult(
+            finish_reason="stop",
+            content=content,
+            usage=self._record_usage(messages, len(chunks)),
+            cached=False,
+        )
+
+    def actual_usage(self) -> RequestUsage:
+        return self._actual_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(
+        self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []
+    ) -> int:
+        # roughly four characters per token, good enough for a fake
+        return sum(len(str(m.content)) for m in messages) // 4
+
+    def remaining_tokens(
+        self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []
+    ) -> int:
+        return 128000 - self.count_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return ModelCapabilities(vision=False, function_calling=True, json_output=True)
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return ModelInfo(vision=False, function_calling=True, json_output=True, family="unknown")
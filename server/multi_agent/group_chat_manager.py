@@ -1,24 +1,23 @@
 import asyncio
 from asyncio import subprocess
+import logging
 import os
 import string
-from typing import List
+from typing import TYPE_CHECKING, Dict, List, Sequence
 
-from autogen_core import AgentId, MessageContext
+from autogen_core import AgentId, CancellationToken, MessageContext
 from autogen_core import (
     RoutedAgent,
     message_handler,
 )
 from autogen_core.models import (
+    AssistantMessage,
     ChatCompletionClient,
     SystemMessage,
     UserMessage,
     CreateResult,
     LLMMessage,
 )
-from autogen_core import TopicId
-
-import tiktoken
 from autogen_core.tool_agent import ToolAgent, tool_agent_caller_loop
 from autogen_core.tools import FunctionTool, Tool, ToolSchema
 from multi_agent.messages import (
@@ -27,60 +26,132 @@ from multi_agent.messages import (
     TaskMessage,
     SingleTaskMessage,
 )
-from rich.console import Console
-from rich.markdown import Markdown
+from multi_agent.agents.nextjs_programming_agent import DeltaStream
+from multi_agent.blob_store import BlobStore
+from multi_agent.context_builder import ContextBuilder
+from multi_agent.dependencies import DependencyInstaller
+from multi_agent.executors import run_blocking
+from multi_agent.metrics import metrics
+from multi_agent.plan_stream import PLAN_FORMAT, PlanStreamParser
+from multi_agent.session import PlanningFailed, put_update
+from multi_agent.task_graph import FileJob, FileSchedule, TaskGraph
+from multi_agent.validation import Diagnostic, Validator
+from multi_agent.worker_pool import WorkerPool
+from multi_agent.workspace_index import WorkspaceIndex
 
+if TYPE_CHECKING:
+    # needs autogen-ext[grpc], which is optional
+    from multi_agent.distributed import RemoteWorkers
 
-class GroupChatManager(RoutedAgent):
-    tasks: List[TaskMessage] = []
-    current_task: TaskMessage | None = None
-    current_file_index: int = 0
 
+logger = logging.getLogger(__name__)
+
+
+class GroupChatManager(RoutedAgent):
     def __init__(
         self,
-        worker_topic_types: List[str],
+        worker_agent_type: str,
         model_client: ChatCompletionClient,
         tool_schema: List[ToolSchema],
-        worker_descriptions: List[str],
+        worker_description: str,
+        max_workers: int = 4,
+        context_token_budget: int = 60000,
+        project_directory: str | None = None,
+        planner_mode: str = "stream",
+        plan_rounds: int = 2,
+        related_files: int = 3,
+        validation: Sequence[str] = (),
+        fix_rounds: int = 2,
+        validation_concurrency: int = 4,
         chat_stopped: bool = False,
         queue: asyncio.Queue = None,
+        delta_queue: asyncio.Queue | None = None,
+        remote_workers: "RemoteWorkers | None" = None,
+        blobs: BlobStore | None = None,
     ) -> None:
         super().__init__("Group chat manager")
         self._model_client = model_client
-        self._worker_topic_types = worker_topic_types
+        self._worker_agent_type = worker_agent_type
         self._chat_history: List[UserMessage] = []
-        self._worker_description = worker_descriptions
+        self._worker_description = worker_description
+        self._task_graph = TaskGraph()
+        self._worker_pool = WorkerPool(
+            max_workers=max_workers, run_job=self.assign_task_to_worker
+        )
         self._previous_participant_topic_type: str | None = None
         self._chat_stopped = chat_stopped
         self._tool_agent_id = AgentId("tool_executor_agent", self.id.key)
         self._tool_schema = tool_schema
+        # "stream" dispatches tasks while the plan is generated, "tools" plans
+        # with assign_tasks tool calls
+        self._planner_mode = planner_mode
+        # streamed plans get plan_rounds - 1 chances to fix rejected tasks
+        self._plan_rounds = plan_rounds
+        # files from the search index a worker gets the signatures of, on top
+        # of the files it imports
+        self._related_files = related_files
         cwd_directory = os.path.dirname(__file__)
-        self._project_directory = os.path.join(
+        self._project_directory = project_directory or os.path.join(
             cwd_directory, "../../code-server/workspace"
         )
+        self._workspace_index = WorkspaceIndex.for_directory(self._project_directory)
+        self._context_builder = ContextBuilder(
+            self._workspace_index, token_budget=context_token_budget
+        )
+        # holds back files that another task writes or whose imports are pending
+        self._file_schedule = FileSchedule(self._workspace_index.graph.imports)
+        self._dependencies = DependencyInstaller.for_directory(self._project_directory)
+        # checks of the written files, each failed file goes back to its
+        # worker at most fix_rounds times
+        self._validator = (
+            Validator.for_directory(
+                self._project_directory, validation, validation_concurrency
+            )
+            if validation
+            else None
+        )
+        self._fix_rounds = fix_rounds
+        # file -> worker slot that wrote it, and holds its chat history
+        self._file_workers: Dict[str, int] = {}
         self._queue = queue
+        # workers in other processes can not reach the session's queue, their
+        # files are sent to it in one delta once written
+        self._delta_queue = delta_queue
+        self._remote_workers = remote_workers
+        # shared with the session's workers, file contents are sent as refs
+        self._blobs = blobs if blobs is not None else BlobStore()
+        self._cancellation_token = CancellationToken()
 
     @message_handler
     async def handle_message(
         self, message: GroupChatMessage, ctx: MessageContext
     ) -> None:
         if self._chat_stopped:
-            Console().print(Markdown(f"### System: \nChat is stopped."))
+            logger.info("Chat is stopped.")
             return
 
-        print(f"group chat manager received message: {message}")
+        logger.debug("group chat manager received message: %s", message)
+        # cancelled when the client goes away or the session runs out of time
+        self._cancellation_token = ctx.cancellation_token
+        ctx.cancellation_token.add_callback(self.cancel)
 
         # start the task planning process
-        print("Starting task planning process")
-        await self._queue.put({"status": "planning"})
-        project_content = self.list_files_with_content()
+        logger.info("Starting task planning process for %s", self.id.key)
+        await self.report({"status": "planning"})
+        # dependencies edited outside a session install while the code is written
+        await self._dependencies.ensure_installed()
+        if self._validator is not None:
+            # the checkers load the project while the code is written
+            asyncio.ensure_future(self._validator.start())
+        project_content = await self.list_files_with_content(message.body.content)
 
         system_message = SystemMessage(
-            content="""You are a manager with deep technical insights. Based on the user's message and looking at the project content, you need to assign tasks to NextJS experts. These tasks are executed in parallel so there should be no dependencies between them at all. If there is a dependency combine the tasks. You need to provide a detailed description of the task, what needs to be done, and the expected outcome.
+            content="""You are a manager with deep technical insights. Based on the user's message and looking at the project content, you need to assign tasks to NextJS experts. Tasks are executed in parallel unless a task names a parent_task_id, in which case it only starts once the parent task is finished. Only add a parent when the task really needs the parent's output, and never make a task depend on itself or on one of its own dependents. You need to provide a detailed description of the task, what needs to be done, and the expected outcome.
             here is the message from the user: \n\n
             {message} \n\n
             Here is the project content: \n\n
             {project_content} \n\n
+            Files that are only listed or shown as signatures were left out to save space, the expert still gets their full content.
             when creating the tasks make sure that each task only modified only one file. If the task modifies multiple files,
             split the task into multiple tasks.
             don't modify package.json or .env files.
@@ -92,118 +163,315 @@ class GroupChatManager(RoutedAgent):
 
         session: List[LLMMessage] = [system_message]
 
-        await tool_agent_caller_loop(
-            self,
-            tool_agent_id=self._tool_agent_id,
-            model_client=self._model_client,
-            input_messages=session,
-            tool_schema=self._tool_schema,
-            cancellation_token=ctx.cancellation_token,
-        )
+        with metrics.span("planning", mode=self._planner_mode):
+            planned = False
+            if self._planner_mode == "stream":
+                planned = await self.plan_streaming(session, ctx.cancellation_token)
+            if not planned:
+                await self.plan_with_tools(session, ctx.cancellation_token)
+
+        missing = self._task_graph.missing_parents()
+        if missing:
+            # the waiting tasks would never run, stop before the others are written
+            await self.report({"status": "planning_failed"})
+            raise PlanningFailed(
+                "Tasks wait for parent tasks that were never assigned: "
+                + "; ".join(
+                    f"{parent} (needed by {', '.join(children)})"
+                    for parent, children in missing.items()
+                )
+            )
+        # every assign_tasks call has been queued by now, wait for the workers,
+        # raises CancelledError if the session is cancelled meanwhile
+        await self._worker_pool.join()
+        if self._validator is not None:
+            with metrics.span("validation_stage"):
+                await self.validate_files()
+        await self.report({"status": "completed"})
+        logger.info("All tasks completed for %s", self.id.key)
+        await self.run_npm_install()
+
+    async def plan_streaming(
+        self, session: List[LLMMessage], cancellation_token: CancellationToken
+    ) -> bool:
+        """Stream the plan as JSON lines and start each task as soon as its
+        line is complete. Rejected lines are sent back to the planner.
+
+        Returns False if the planner did not produce a single task, so the
+        caller can fall back to planning with tool calls.
+        """
+        messages = session + [UserMessage(content=PLAN_FORMAT, source="user")]
+        assigned = 0
+        for _ in range(self._plan_rounds):
+            parser = PlanStreamParser()
+            errors: List[str] = []
+
+            def assign(tasks: List[TaskMessage]) -> None:
+                nonlocal assigned
+                for task in tasks:
+                    logger.info(
+                        "Assigning task %s (parent %s) to %s: %s",
+                        task.task_id,
+                        task.parent_task_id,
+                        task.file_names,
+                        task.description,
+                    )
+                    try:
+                        self.submit_tasks(self._task_graph.add(task))
+                        assigned += 1
+                    except ValueError as e:
+                        errors.append(str(e))
+
+            async for item in self._model_client.create_stream(
+                messages, cancellation_token=cancellation_token
+            ):
+                if isinstance(item, str):
+                    assign(parser.feed(item))
+            assign(parser.close())
+
+            errors = parser.errors + errors
+            missing = self._task_graph.missing_parents()
+            if missing:
+                errors.append(f"Unknown parent tasks: {', '.join(missing)}.")
+            if not errors:
+                break
+            logger.warning("Planner sent %d invalid tasks: %s", len(errors), errors)
+            messages = messages + [
+                AssistantMessage(content=parser.text, source="planner"),
+                UserMessage(
+                    content="These tasks were rejected:\n"
+                    + "\n".join(errors)
+                    + "\nSend only the corrected and missing tasks, in the same format.",
+                    source="user",
+                ),
+            ]
+        return assigned > 0
+
+    async def plan_with_tools(
+        self, session: List[LLMMessage], cancellation_token: CancellationToken
+    ) -> None:
+        """Plan with assign_tasks tool calls. Tasks whose parent never shows
+        up are sent back to the planner, which gets plan_rounds - 1 chances to
+        assign the missing parents."""
+        messages = list(session)
+        for _ in range(self._plan_rounds):
+            messages += await tool_agent_caller_loop(
+                self,
+                tool_agent_id=self._tool_agent_id,
+                model_client=self._model_client,
+                input_messages=messages,
+                tool_schema=self._tool_schema,
+                cancellation_token=cancellation_token,
+            )
+            missing = self._task_graph.missing_parents()
+            if not missing:
+                return
+            logger.warning("Planner left tasks without their parent: %s", missing)
+            messages.append(
+                UserMessage(
+                    content="These parent tasks were never assigned: "
+                    + "; ".join(
+                        f"{parent}, needed by {', '.join(children)}"
+                        for parent, children in missing.items()
+                    )
+                    + ". Assign them with exactly these task ids.",
+                    source="user",
+                )
+            )
+
+    def cancel(self) -> None:
+        logger.info("Session %s cancelled", self.id.key)
+        asyncio.ensure_future(self._worker_pool.cancel())
 
-    def list_files_with_content(self):
-        print(f"Directory - {self._project_directory}")
-        ignore_dirs = ["node_modules", ".git", ".next"]
-        ignore_files = ["package-lock.json", ".env"]
-
-        project_content = ""
-
-        for root, dirs, files in os.walk(self._project_directory):
-            # Modify the dirs list in-place to skip ignored directories
-            dirs[:] = [d for d in dirs if d not in ignore_dirs]
-
-            for file in files:
-                if file in ignore_files:
-                    continue
-                filepath = os.path.join(root, file)
-                relative_path = os.path.relpath(filepath, self._project_directory)
-                project_content += f"Filepath - {relative_path}\n"
-                project_content += "Content\n"
-                project_content += "---------------------------\n"
-                try:
-                    with open(filepath, "r", encoding="utf-8") as f:
-                        content = f.read()
-                        project_content += content + "\n"
-                        print(f"Filepath - {relative_path} - size - {len(content)}")
-
-                except Exception as e:
-                    project_content += f"Error reading file: {e} \n"
-                project_content += "---------------------------\n"
-
-        print(len(project_content))
-        enc = tiktoken.encoding_for_model("gpt-4o")
-        print(len(enc.encode(project_content)))
+    async def report(self, update: dict) -> None:
+        await put_update(self._queue, update, self._cancellation_token)
 
+    async def list_files_with_content(self, query: str):
+        logger.debug("Directory - %s", self._project_directory)
+        with metrics.span("snapshot_build"):
+            changed = await self._workspace_index.refresh_async()
+            # ranking and packing a large workspace takes a while, keep it off
+            # the event loop too
+            project_content = await run_blocking(self._context_builder.build, query)
+        logger.info(
+            "%d files, %d changed, %d tokens",
+            len(self._workspace_index.files),
+            len(changed),
+            self._workspace_index.token_count,
+        )
         return project_content
 
     @message_handler
     async def handle_task_message(
         self, message: TaskMessage, ctx: MessageContext
     ) -> None:
-        print(f"Task message received: {message}")
-        self.tasks.append(message)
+        logger.debug("Task message received: %s", message)
+        # raises back to the planner's tool call on duplicate ids or cycles
+        self.submit_tasks(self._task_graph.add(message))
 
-        if self.current_task is None:
-            self.current_task = self.tasks.pop(0)
-            self.current_file_index = 0
-            print(f"Current task: {self.current_task}")
-            await self.assign_task_to_worker()
-        # time to assign the tasks based on each file
+    def submit_tasks(self, tasks: List[TaskMessage]) -> None:
+        # the files of a ready task fan out to the workers, in import order
+        jobs = [
+            (task.task_id, task.description, filename)
+            for task in tasks
+            for filename in task.file_names
+        ]
+        self.submit_files(self._file_schedule.add(jobs))
 
-    @message_handler
-    async def handle_task_completion_message(
-        self, message: TaskCompletionMessage, ctx: MessageContext
+    def submit_files(self, jobs: List[FileJob]) -> None:
+        for job in jobs:
+            self._worker_pool.submit(job)
+
+    @property
+    def in_flight_files(self) -> List[str]:
+        return [job[-1] for job in self._worker_pool.in_flight.values()]
+
+    async def handle_task_completion(
+        self, worker: int, message: TaskCompletionMessage
     ) -> None:
-        self.current_file_index += 1
-        if self.current_file_index < len(self.current_task.file_names):
-            await self.assign_task_to_worker()
-        else:
-            if len(self.tasks) > 0:
-                self.current_task = self.tasks.pop(0)
-                self.current_file_index = 0
-                await self.assign_task_to_worker()
-            else:
-                await self.run_npm_install()
-                await self._queue.put({"status": "completed"})
-                print("All tasks completed.")
-                
+        logger.info("Worker %d completed %s", worker, message.file_name)
+        await self.report({"status": "file_completed", "filename": message.file_name})
+        # keeps the search index and import graph current for the tasks that follow
+        await self._workspace_index.update_file_async(message.file_name)
+        self.submit_files(self._file_schedule.done(message.file_name))
+        self.submit_tasks(self._task_graph.complete_file(message.task_id))
+
     async def run_npm_install(self):
-        # cd to the workspace directory and run npm install
-        os.chdir(self._project_directory)
-        process = await asyncio.create_subprocess_exec(
-            'npm', 'install',
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+        # only installs when package.json or the lockfile changed, the code is
+        # already complete so this just keeps the stream open for its status
+        install = await self._dependencies.ensure_installed()
+        if install is None:
+            return
+        await self.report({"status": "installing_dependencies"})
+        # shared with other sessions, a cancelled session stops waiting for it
+        # but leaves the install running
+        succeeded = await self._cancellation_token.link_future(asyncio.shield(install))
+        await self.report(
+            {"status": "dependencies_installed" if succeeded else "dependencies_failed"}
+        )
+
+    async def validate_files(self) -> None:
+        """Check the files written in the session, send the ones with errors
+        back to their workers to fix and check those again."""
+        files = [filename for filename in self._file_workers if Validator.handles(filename)]
+        for attempt in range(self._fix_rounds + 1):
+            if not files:
+                return
+            await self.report({"status": "validating"})
+            # the results are streamed per file as they come in
+            results = await self._cancellation_token.link_future(
+                asyncio.gather(*[self.validate_file(filename) for filename in files])
+            )
+            failed = {
+                filename: diagnostics
+                for filename, diagnostics in zip(files, results)
+                if diagnostics
+            }
+            if not failed:
+                return
+            if attempt == self._fix_rounds:
+                logger.warning("%d files still have errors: %s", len(failed), list(failed))
+                return
+            metrics.increment("validation_fixes", len(failed))
+            by_worker: Dict[int, List[str]] = {}
+            for filename in failed:
+                by_worker.setdefault(self._file_workers[filename], []).append(filename)
+            # a worker fixes its files one after the other, with its history
+            await asyncio.gather(
+                *[
+                    self.fix_files(worker, filenames, failed, attempt)
+                    for worker, filenames in by_worker.items()
+                ]
+            )
+            files = list(failed)
+
+    async def validate_file(self, filename: str) -> List[Diagnostic]:
+        diagnostics = await self._validator.check(filename)
+        await self.report(
+            {
+                "status": "file_invalid" if diagnostics else "file_valid",
+                "filename": filename,
+                "diagnostics": [diagnostic.to_dict() for diagnostic in diagnostics],
+            }
         )
-        stdout, stderr = await process.communicate()
+        return diagnostics
+
+    async def fix_files(
+        self,
+        worker: int,
+        filenames: List[str],
+        failed: Dict[str, List[Diagnostic]],
+        attempt: int,
+    ) -> None:
+        for filename in filenames:
+            problems = "\n".join(str(diagnostic) for diagnostic in failed[filename])
+            description = (
+                f"The type checker and linter found these errors in {filename}:\n"
+                f"{problems}\n"
+                "Fix them without changing anything else."
+            )
+            completion = await self.write_file(
+                worker, (f"fix_{attempt}", description, filename)
+            )
+            self._blobs.release(completion.file_content)
+            await self.report({"status": "file_completed", "filename": filename})
+            await self._workspace_index.update_file_async(filename)
 
-        if process.returncode != 0:
-            # Handle the error
-            print(f"npm install failed: {stderr.decode()}")
-        else:
-            print("npm install succeeded")
-        
+    async def assign_task_to_worker(self, worker: int, job: FileJob):
+        completion = await self.write_file(worker, job)
+        try:
+            await self.handle_task_completion(worker, completion)
+        finally:
+            self._blobs.release(completion.file_content)
 
-    async def assign_task_to_worker(self):
-        if self.current_task is None:
-            return
+    async def write_file(self, worker: int, job: FileJob) -> TaskCompletionMessage:
+        """Have the worker in slot ``worker`` write the job's file, the
+        caller releases the content of the completion."""
+        task_id, description, filename = job
+        # workers are created lazily by the runtime the first time a key is used
+        worker_id = AgentId(self._worker_agent_type, f"{self.id.key}_{worker}")
 
-        # pick a worker for now the first worker
-        worker_topic_type = self._worker_topic_types[0]
-
-        print("Assigning to ", worker_topic_type, self.id.key)
-        filename = self.current_task.file_names[self.current_file_index]
-        # assign the task to the worker
-        await self._queue.put({"status": "writing_code", "filename": filename})
-        await self.runtime.publish_message(
-            SingleTaskMessage(
-                description=self.current_task.description,
-                file_name=filename,
-                file_content=self.get_file_content(filename),
-                full_path=os.path.join(self._project_directory, filename),
-            ),
-            TopicId(type=worker_topic_type, source=self.id.key),
+        logger.debug("Assigning %s to %s", filename, worker_id)
+        await self.report({"status": "writing_code", "filename": filename})
+        related_files = await run_blocking(
+            self._context_builder.related,
+            filename,
+            f"{description} {filename}",
+            self._related_files,
+        )
+        file_content = self._blobs.put(await run_blocking(self.get_file_content, filename))
+        message = SingleTaskMessage(
+            task_id=task_id,
+            description=description,
+            file_name=filename,
+            file_content=file_content,
+            full_path=os.path.join(self._project_directory, filename),
+            related_files=related_files,
         )
+        try:
+            completion = None
+            if self._remote_workers is not None:
+                # the worker process has a store of its own, the content goes along
+                remote_message = message.model_copy(
+                    update={"file_content": self._blobs.inline(file_content)}
+                )
+                completion = await self._remote_workers.run(
+                    remote_message, worker_id.key, self._cancellation_token
+                )
+                if completion is not None:
+                    completion.file_content = self._blobs.absorb(completion.file_content)
+                    content = self._blobs.get(completion.file_content)
+                    deltas = DeltaStream(self._delta_queue, filename, self._cancellation_token)
+                    await deltas.send(content)
+                    await deltas.finish(content)
+            if completion is None:
+                completion = await self.send_message(
+                    message, worker_id, cancellation_token=self._cancellation_token
+                )
+        finally:
+            self._blobs.release(file_content)
+        self._file_workers[filename] = worker
+        return completion
 
     def get_file_content(self, file_name: str):
         filepath = os.path.join(self._project_directory, file_name)
@@ -0,0 +1,163 @@
+import json
+import posixpath
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+SOURCE_EXTENSIONS = (".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs")
+TSCONFIG_FILES = ("tsconfig.json", "jsconfig.json")
+
+# import ... from "x", export ... from "x", import "x", import("x"), require("x")
+# no word boundaries, they make the scan several times slower
+_SPECIFIER_RE = re.compile(r"""(?:from|import|require)\s*\(?\s*["']([^"'\n]+)["']""")
+# not after a colon, to keep URLs
+_COMMENT_RE = re.compile(r"/\*.*?\*/|(?<!:)//[^\n]*", re.DOTALL)
+
+
+def import_specifiers(content: str) -> List[str]:
+    return _SPECIFIER_RE.findall(_COMMENT_RE.sub("", content))
+
+
+def _strip_extension(path: str) -> str:
+    stem, _, extension = path.rpartition(".")
+    return stem if "." + extension in SOURCE_EXTENSIONS else path
+
+
+def module_keys(path: str) -> List[str]:
+    """The names a file can be imported by: its path without the extension,
+    and its directory for index files."""
+    stem = _strip_extension(path)
+    if posixpath.basename(stem) == "index":
+        return [stem, posixpath.dirname(stem)]
+    return [stem]
+
+
+def path_aliases(content: str) -> Tuple[str | None, Dict[str, List[str]]]:
+    """``baseUrl`` and the ``paths`` patterns ending in ``*`` of a tsconfig."""
+    try:
+        options = json.loads(content).get("compilerOptions") or {}
+    except (ValueError, AttributeError):
+        # tsconfig allows comments and trailing commas, such files are skipped
+        return None, {}
+    base_url = posixpath.normpath(options["baseUrl"]) if options.get("baseUrl") else None
+    base = base_url or "."
+    aliases: Dict[str, List[str]] = {}
+    for pattern, targets in (options.get("paths") or {}).items():
+        if not pattern.endswith("*") or not isinstance(targets, list):
+            continue
+        aliases[pattern[:-1]] = [
+            posixpath.normpath(posixpath.join(base, target[:-1])) + "/"
+            for target in targets
+            if isinstance(target, str) and target.endswith("*")
+        ]
+    return base_url, aliases
+
+
+class ImportGraph:
+    """Which workspace files import which, from their import statements.
+
+    Imports are resolved without looking at the disk: relative specifiers and
+    the ``paths`` and ``baseUrl`` of the workspace's tsconfig are turned into
+    module keys, and a file provides the keys of :func:`module_keys`. Imports
+    of packages never match a file and are left out. :meth:`update` only
+    re-parses the files it is given, unless the tsconfig itself changes.
+    """
+
+    def __init__(self) -> None:
+        # path -> specifiers of its imports, kept to re-resolve on alias changes
+        self._specifiers: Dict[str, List[str]] = {}
+        # path -> module keys it imports
+        self._imports: Dict[str, Set[str]] = {}
+        # module key -> paths that import it
+        self._importers: Dict[str, Set[str]] = defaultdict(set)
+        # module key -> paths that provide it
+        self._modules: Dict[str, Set[str]] = defaultdict(set)
+        self._base_url: str | None = None
+        self._aliases: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._specifiers)
+
+    def update(
+        self, documents: Iterable[Tuple[str, str]] = (), removed: Iterable[str] = ()
+    ) -> None:
+        """Parse ``(path, content)`` documents, replacing earlier versions,
+        and drop the ``removed`` paths. Other files are ignored."""
+        sources = []
+        config = None
+        for path, content in documents:
+            if path in TSCONFIG_FILES:
+                config = path_aliases(content)
+            elif path.endswith(SOURCE_EXTENSIONS):
+                sources.append((path, import_specifiers(content)))
+        with self._lock:
+            for path in removed:
+                self._remove(path)
+            if config is not None and config != (self._base_url, self._aliases):
+                self._base_url, self._aliases = config
+                sources = list(self._specifiers.items()) + sources
+            for path, specifiers in sources:
+                self._remove(path)
+                self._add(path, specifiers)
+
+    def _resolve(self, path: str, specifier: str) -> List[str]:
+        if specifier.startswith("."):
+            candidates = [posixpath.join(posixpath.dirname(path), specifier)]
+        else:
+            candidates = []
+            for prefix, targets in self._aliases.items():
+                if specifier.startswith(prefix):
+                    candidates = [target + specifier[len(prefix):] for target in targets]
+                    break
+            else:
+                if self._base_url is not None:
+                    candidates = [posixpath.join(self._base_url, specifier)]
+        return [_strip_extension(posixpath.normpath(candidate)) for candidate in candidates]
+
+    def _add(self, path: str, specifiers: List[str]) -> None:
+        self._specifiers[path] = specifiers
+        keys = {key for specifier in specifiers for key in self._resolve(path, specifier)}
+        self._imports[path] = keys
+        for key in keys:
+            self._importers[key].add(path)
+        for key in module_keys(path):
+            self._modules[key].add(path)
+
+    def _remove(self, path: str) -> None:
+        if self._specifiers.pop(path, None) is None:
+            return
+        for key in self._imports.pop(path):
+            self._importers[key].discard(path)
+            if not self._importers[key]:
+                del self._importers[key]
+        for key in module_keys(path):
+            self._modules[key].discard(path)
+            if not self._modules[key]:
+                del self._modules[key]
+
+    def imports(self, path: str) -> List[str]:
+        """Workspace files ``path`` imports directly."""
+        with self._lock:
+            return sorted(
+                {
+                    module
+                    for key in self._imports.get(path, ())
+                    for module in self._modules.get(key, ())
+                    if module != path
+                }
+            )
+
+    def importers(self, path: str) -> List[str]:
+        """Workspace files that import ``path`` directly."""
+        with self._lock:
+            return sorted(
+                {
+                    importer
+                    for key in module_keys(path)
+                    for importer in self._importers.get(key, ())
+                    if importer != path
+                }
+            )
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List
+
+from multi_agent.metrics import metrics
+from multi_agent.session import SessionLimitExceeded
+
+
+logger = logging.getLogger(__name__)
+
+# share of the job workers each priority gets while all of them have jobs
+PRIORITY_WEIGHTS = {"high": 4, "normal": 2, "low": 1}
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = (
+    "queued",
+    "running",
+    "succeeded",
+    "failed",
+    "cancelled",
+)
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+@dataclass
+class Job:
+    message: str
+    workspace: str | None
+    priority: str
+    # jobs of a group take turns with the jobs of other groups of the same
+    # priority, a batch is one group
+    group: str
+    job_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    state: str = QUEUED
+    error: str = ""
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: float | None = None
+    finished_at: float | None = None
+    # every progress update of the session so far
+    updates: List[dict] = field(default_factory=list)
+    subscribers: List[asyncio.Queue] = field(default_factory=list, repr=False)
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.started_at or self.finished_at or time.monotonic()) - self.submitted_at
+
+    @property
+    def run_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def publish(self, update: dict | None) -> None:
+        """Record a progress update and pass it on, None ends the job's
+        subscriptions."""
+        if update is not None:
+            self.updates.append(update)
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(update)
+
+
+class JobQueue:
+    """Sessions submitted as jobs, run by ``workers`` workers in the background.
+
+    Jobs wait in one queue per priority. The queues are served by stride
+    scheduling in proportion to :data:`PRIORITY_WEIGHTS`, so high priority
+    jobs go first without low priority ones being starved, and within a
+    priority the groups, e.g. batches, take turns round robin. ``run_job``
+    runs a job's session and sends its progress to the queue it is given;
+    a job that finds every session slot taken by interactive requests is
+    put back and tried again ``retry_delay`` seconds later. Finished jobs
+    are kept for status queries, up to ``max_finished`` of them.
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[[Job, asyncio.Queue], Awaitable[None]],
+        workers: int = 2,
+        retry_delay: float = 1.0,
+        max_finished: int = 1000,
+    ) -> None:
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+        self._run_job = run_job
+        self._worker_count = workers
+        self._retry_delay = retry_delay
+        self._max_finished = max_finished
+        self.jobs: Dict[str, Job] = {}
+        self._finished: Deque[str] = deque()
+        # priority -> group -> jobs, groups are served round robin
+        self._queues: Dict[str, OrderedDict[str, Deque[Job]]] = {
+            priority: OrderedDict() for priority in PRIORITY_WEIGHTS
+        }
+        # virtual time of each priority, the lowest one goes next
+        self._passes: Dict[str, float] = {priority: 0.0 for priority in PRIORITY_WEIGHTS}
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        for _ in range(self._worker_count):
+            self._workers.append(asyncio.create_task(self._work()))
+
+    async def stop(self) -> None:
+        for job in self.jobs.values():
+            if job.state == RUNNING:
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def depth(self, priority: str) -> int:
+        return sum(len(jobs) for jobs in self._queues[priority].values())
+
+    def submit(
+        self,
+        message: str,
+        workspace: str | None = None,
+        priority: str = "normal",
+        group: str | None = None,
+    ) -> Job:
+        if priority not in PRIORITY_WEIGHTS:
+            raise ValueError(f"Unknown priority {priority}.")
+        job = Job(message=message, workspace=workspace, priority=priority, group="")
+        # a job on its own is a group of its own
+        job.group = group or job.job_id
+        self.jobs[job.job_id] = job
+        self._enqueue(job)
+        metrics.increment("jobs_submitted", priority=priority)
+        logger.info("Job %s queued with %s priority", job.job_id, priority)
+        return job
+
+    async def cancel(self, job_id: str) -> Job | None:
+        """Cancel a queued or running job, returns once it is cancelled."""
+        job = self.jobs.get(job_id)
+        if job is None or job.state in FINISHED:
+            return job
+        if job.state == RUNNING:
+            # the job's task records the cancellation
+            job.task.cancel()
+            await asyncio.wait([job.task])
+        else:
+            self._discard(job)
+            self._finish(job, CANCELLED)
+        return job
+
+    def _enqueue(self, job: Job, front: bool = False) -> None:
+        queues = self._queues[job.priority]
+        if not queues:
+            # an idle priority joins at the current virtual time instead of
+            # catching up on the turns it did not need
+            active = [self._passes[p] for p, q in self._queues.items() if q]
+            if active:
+                self._passes[job.priority] = max(self._passes[job.priority], min(active))
+        jobs = queues.setdefault(job.group, deque())
+        if front:
+            jobs.appendleft(job)
+            queues.move_to_end(job.group, last=False)
+        else:
+            jobs.append(job)
+        metrics.set_gauge("job_queue_depth", self.depth(job.priority), priority=job.priority)
+        self._wakeup.set()
+
+    def _discard(self, job: Job) -> None:
+        queues = self._queues[job.priority]
+        jobs = queues.get(job.group)
+        if jobs is None or job not in jobs:
+            # between two attempts to get a session
+            return
+        jobs.remove(job)
+        if not jobs:
+            del queues[job.group]
+        metrics.set_gauge("job_queue_depth", self.depth(job.priority), priority=job.priority)
+
+    def _next(self) -> Job | None:
+        priorities = [priority for priority, queues in self._queues.items() if queues]
+        if not priorities:
+            return None
+        priority = min(priorities, key=lambda p: self._passes[p])
+        self._passes[priority] += 1 / PRIORITY_WEIGHTS[priority]
+        queues = self._queues[priority]
+        group, jobs = next(iter(queues.items()))
+        job = jobs.popleft()
+        # round robin, the group goes to the back of the line
+        del queues[group]
+        if jobs:
+            queues[group] = jobs
+        metrics.set_gauge("job_queue_depth", self.depth(priority), priority=priority)
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            job = self._next()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job.task = asyncio.create_task(self._run(job))
+            # a cancelled job only cancels its own task, not the worker
+            await asyncio.gather(job.task, return_exceptions=True)
+
+    async def _run(self, job: Job) -> None:
+        job.state = RUNNING
+        job.started_at = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue()
+        pump = asyncio.create_task(self._pump(job, queue))
+        state, error = SUCCEEDED, ""
+        try:
+            await self._run_job(job, queue)
+        except SessionLimitExceeded:
+            state = QUEUED
+        except asyncio.CancelledError:
+            state = CANCELLED
+        except Exception as e:
+            logger.error("Job %s failed: %s", job.job_id, e)
+            state, error = FAILED, str(e)
+        finally:
+            # the rest of the updates, before the job is reported finished
+            pump.cancel()
+            while not queue.empty():
+                job.publish(queue.get_nowait())
+        if state == QUEUED:
+            # interactive requests hold every session, wait for one to end
+            job.state = QUEUED
+            job.started_at = None
+            await asyncio.sleep(self._retry_delay)
+            if job.state == QUEUED:
+                self._enqueue(job, front=True)
+            return
+        metrics.observe("job_queue_wait", job.started_at - job.submitted_at, priority=job.priority)
+        self._finish(job, state, error)
+
+    async def _pump(self, job: Job, queue: asyncio.Queue) -> None:
+        while True:
+            job.publish(await queue.get())
+
+    def _finish(self, job: Job, state: str, error: str = "") -> None:
+        job.state = state
+        job.error = error
+        job.finished_at = time.monotonic()
+        if state != SUCCEEDED:
+            job.publish({"status": state})
+        job.publish(None)
+        job.subscribers.clear()
+        metrics.increment("jobs_finished", priority=job.priority, state=state)
+        logger.info("Job %s %s after %.1fs", job.job_id, state, job.run_seconds)
+        self._finished.append(job.job_id)
+        while len(self._finished) > self._max_finished:
+            self.jobs.pop(self._finished.popleft(), None)
+
+    async def watch(self, job_id: str):
+        """The job's progress updates so far and then as they come, until
+        the job is finished."""
+        job = self.jobs[job_id]
+        subscriber: asyncio.Queue = asyncio.Queue()
+        updates = list(job.updates)
+        if job.state not in FINISHED:
+            job.subscribers.append(subscriber)
+        else:
+            subscriber.put_nowait(None)
+        try:
+            for update in updates:
+                yield update
+            while (update := await subscriber.get()) is not None:
+                yield update
+        finally:
+            if subscriber in job.subscribers:
+                job.subscribers.remove(subscriber)
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 from autogen_core.models import UserMessage, AssistantMessage
 
+from multi_agent.blob_store import BlobRef
+
 
 class GroupChatMessage(BaseModel):
     body: UserMessage | AssistantMessage
@@ -9,16 +11,43 @@ class GroupChatMessage(BaseModel):
 class TaskMessage(BaseModel):
     description: str
     file_names: list[str]
+    task_id: str
+    parent_task_id: str | None = None
 
 
 class SingleTaskMessage(BaseModel):
+    task_id: str
     description: str
     file_name: str
-    file_content: str
+    # the current content, in the session's blob store
+    file_content: BlobRef
     full_path: str
+    # signatures of the files it imports and of related workspace files
+    related_files: str = ""
 
 
 class TaskCompletionMessage(BaseModel):
+    task_id: str
     file_name: str
-    file_content: str
+    # the written content, released by the manager once it is handled
+    file_content: BlobRef
     completion: str
+
+
+class WorkerHeartbeat(BaseModel):
+    # published by worker processes, the first one registers the worker
+    agent_type: str
+    capacity: int
+
+
+class HeartbeatAck(BaseModel):
+    # the answer to a heartbeat, tells the worker that the host is reachable
+    agent_type: str
+
+
+class WorkerDeregistration(BaseModel):
+    agent_type: str
+
+
+class ReleaseSession(BaseModel):
+    session_id: str
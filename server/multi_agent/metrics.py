@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Deque, Dict, Iterator, Mapping, Optional, Sequence, Tuple, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import CreateResult, LLMMessage, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+from multi_agent.session import current_session_id
+from multi_agent.wrapped_client import WrappedChatCompletionClient
+
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class TimerStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """Process-wide counters, gauges and timers that are cheap to sample.
+
+    :meth:`render` exports everything in the Prometheus text format. Token
+    counts are also kept per session for the ``max_sessions`` most recent
+    sessions, in :attr:`session_tokens` only, since a label per session would
+    give Prometheus a new series for every session.
+    """
+
+    def __init__(self, max_sessions: int = 1000) -> None:
+        self._counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._timers: Dict[Tuple[str, Labels], TimerStats] = defaultdict(TimerStats)
+        self._max_sessions = max_sessions
+        self.session_tokens: OrderedDict[str, Dict[str, int]] = OrderedDict()
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        self._timers[(name, tuple(sorted(labels.items())))].observe(seconds)
+
+    @contextmanager
+    def span(self, name: str, **labels: str) -> Iterator[None]:
+        """Time a block and record it as ``agent_<name>_seconds``."""
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(name, elapsed, status=status, **labels)
+            logger.debug("span %s %s took %.3fs (%s)", name, labels, elapsed, status)
+
+    def record_usage(self, session_id: str | None, usage: RequestUsage) -> None:
+        self.increment("prompt_tokens", usage.prompt_tokens)
+        self.increment("completion_tokens", usage.completion_tokens)
+        if session_id is None:
+            return
+        tokens = self.session_tokens.pop(session_id, None) or {"prompt": 0, "completion": 0}
+        tokens["prompt"] += usage.prompt_tokens
+        tokens["completion"] += usage.completion_tokens
+        self.session_tokens[session_id] = tokens
+        while len(self.session_tokens) > self._max_sessions:
+            self.session_tokens.popitem(last=False)
+
+    def render(self) -> str:
+        lines = []
+        for (name, labels), value in sorted(self._counters.items()):
+            lines.append(f"agent_{name}_total{_format_labels(labels)} {value:g}")
+        for (name, labels), value in sorted(self._gauges.items()):
+            lines.append(f"agent_{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), stats in sorted(self._timers.items(), key=lambda item: item[0]):
+            formatted = _format_labels(labels)
+            lines.append(f"agent_{name}_seconds_count{formatted} {stats.count}")
+            lines.append(f"agent_{name}_seconds_sum{formatted} {stats.total:.6f}")
+            lines.append(f"agent_{name}_seconds_max{formatted} {stats.max:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping coroutine.
+
+    Every sample is recorded as ``agent_event_loop_lag_seconds``; the most
+    recent ``max_samples`` are also kept in :attr:`samples`.
+    """
+
+    def __init__(self, interval: float = 0.1, max_samples: int = 100000) -> None:
+        self._interval = interval
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.samples.append(lag)
+            metrics.observe("event_loop_lag", lag)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class MeteredChatCompletionClient(WrappedChatCompletionClient):
+    """Records model call latency and token usage, per session, in ``metrics``."""
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        with metrics.span("model_call", mode="create"):
+            result = await super().create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+        metrics.record_usage(current_session_id(), result.usage)
+        return result
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        start = time.perf_counter()
+        first_chunk = True
+        async for item in super().create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if first_chunk:
+                first_chunk = False
+                metrics.observe("time_to_first_token", time.perf_counter() - start)
+            if isinstance(item, CreateResult):
+                metrics.observe("model_call", time.perf_counter() - start, mode="stream", status="ok")
+                metrics.record_usage(current_session_id(), item.usage)
+            yield item
@@ -1,28 +1,114 @@
 import asyncio
+import logging
 import os
 import uuid
+from collections import OrderedDict
+from typing import Dict, Tuple
 
-from autogen_core import SingleThreadedAgentRuntime
-from autogen_core import TopicId
+from autogen_core import (
+    AgentId,
+    AgentInstantiationContext,
+    CancellationToken,
+    MessageHandlerContext,
+    SingleThreadedAgentRuntime,
+)
 from autogen_core import (
     TypeSubscription,
 )
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 
+from multi_agent import executors
 from multi_agent.agents.nextjs_programming_agent import NextJSProgrammingAgent
+from multi_agent.completion_cache import CachingChatCompletionClient, CompletionCache
+from multi_agent.dependencies import DependencyInstaller
 from multi_agent.group_chat_manager import GroupChatManager
+from multi_agent.jobs import Job, JobQueue
 from multi_agent.messages import GroupChatMessage, TaskMessage
-from autogen_core.models import UserMessage, AssistantMessage
+from multi_agent.metrics import LoopLagMonitor, MeteredChatCompletionClient, metrics
+from multi_agent.rate_limiter import RateLimitedChatCompletionClient, RateLimiter
+from multi_agent.session import (
+    Session,
+    SessionAgents,
+    SessionLimitExceeded,
+    SessionTimeout,
+    session_id_for_key,
+)
+from multi_agent.validation import CHECKS, Validator
+from multi_agent.workspace_index import WorkspaceIndex, get_encoding
+from multi_agent.workspaces import WorkspaceResolver
+from autogen_core.models import AssistantMessage, ChatCompletionClient, UserMessage
 from autogen_core.tool_agent import ToolAgent, tool_agent_caller_loop
 from autogen_core.tools import FunctionTool, Tool, ToolSchema
 
 
-worker_1_topic_type = "worker_1"
-worker_2_topic_type = "worker_2"
+logger = logging.getLogger(__name__)
+
+worker_agent_type = "nextjs_worker"
 group_chat_topic_type = "group_chat"
 worker_description = "Worker agent for writing nextjs code."
 
 
+def worker_settings(**kwargs) -> dict:
+    """NextJSProgrammingAgent options from ``kwargs`` or the environment,
+    shared by in-process workers and worker processes."""
+    return {
+        # how often streamed code is flushed to disk for the live preview
+        "flush_interval": float(os.environ.get("STREAM_FLUSH_INTERVAL", 0.25)),
+        "flush_bytes": int(os.environ.get("STREAM_FLUSH_BYTES", 4096)),
+        # WORKER_OUTPUT=edits lets workers answer with edits to existing files
+        "edit_mode": kwargs.get(
+            "edit_mode", os.environ.get("WORKER_OUTPUT", "full") == "edits"
+        ),
+        "edit_min_chars": int(
+            kwargs.get("edit_min_chars", os.environ.get("EDIT_MIN_CHARS", 2000))
+        ),
+        # earlier tasks a worker keeps in its prompt, the current one is always sent
+        "history_token_budget": int(
+            kwargs.get("history_token_budget")
+            or os.environ.get("HISTORY_TOKEN_BUDGET", 4000)
+        ),
+    }
+
+
+def build_model_client(
+    model_client: ChatCompletionClient | None = None, api_key: str | None = None
+) -> Tuple[ChatCompletionClient, RateLimiter, CompletionCache | None]:
+    """Wrap ``model_client``, or an OpenAI client, with metrics, the rate
+    limiter and the optional completion cache."""
+    # metered below the cache and the limiter, so every real model call and
+    # retry is timed and counted
+    client = MeteredChatCompletionClient(
+        model_client
+        or OpenAIChatCompletionClient(
+            model="gpt-4o",
+            api_key=api_key,
+            # retried by the rate limiter instead
+            max_retries=0,
+        )
+    )
+    # shared by every session of the process, 0 means no limit
+    rate_limiter = RateLimiter(
+        requests_per_minute=float(os.environ.get("MODEL_RPM", 0)),
+        tokens_per_minute=float(os.environ.get("MODEL_TPM", 0)),
+        max_concurrency=int(os.environ.get("MODEL_MAX_CONCURRENCY", 16)),
+    )
+    client = RateLimitedChatCompletionClient(
+        client,
+        rate_limiter,
+        max_retries=int(os.environ.get("MODEL_MAX_RETRIES", 5)),
+    )
+    # opt-in, replays identical planner and worker requests
+    completion_cache = None
+    cache_mb = float(os.environ.get("COMPLETION_CACHE_MB", 0))
+    if cache_mb > 0:
+        completion_cache = CompletionCache(
+            max_bytes=int(cache_mb * 1024 * 1024),
+            path=os.environ.get("COMPLETION_CACHE_PATH"),
+        )
+        client = CachingChatCompletionClient(client, completion_cache, model="gpt-4o")
+    return client, rate_limiter, completion_cache
+
+
 class MultiAgent:
     def add_listener(self, listener):
         self.message_listeners.append(listener)
@@ -45,99 +131,192 @@ class MultiAgent:
         task_id: str,
         parent_task_id: str | None = None,
     ):
-        print(
-            f"\n\n\n\nAssigning task: {description} to {file_names} with task_id: {task_id} and parent_task_id: {parent_task_id}\n\n\n\n"
-        )
-        # dispatch the TaskMessage so the manager can handle whatever is needed
-        await self.runtime.publish_message(
-            TaskMessage(
-                description=description,
-                file_names=file_names,
-            ),
-            TopicId(type=group_chat_topic_type, source=self.session_id),
+        # the tool agent is keyed by the session it plans for
+        session_id = MessageHandlerContext.agent_id().key
+        logger.info(
+            "Assigning task %s (parent %s) to %s: %s",
+            task_id,
+            parent_task_id,
+            file_names,
+            description,
         )
+        # send the TaskMessage directly so the manager has queued it before the
+        # planner's tool call returns
+        try:
+            await self.runtime.send_message(
+                TaskMessage(
+                    description=description,
+                    file_names=file_names,
+                    task_id=task_id,
+                    # planners sometimes send an empty string for "no parent"
+                    parent_task_id=parent_task_id or None,
+                ),
+                AgentId("group_chat_manager", session_id),
+            )
+        except ValueError as e:
+            # duplicate ids and cycles, the planner gets to fix the task
+            return f"Task {task_id} was rejected: {e} Assign it again with a new task id."
         return "Task assigned successfully."
 
-    async def initialize(self, queue, **kwargs):
-        print(kwargs)
-        self.session_id = str(uuid.uuid4())
+    def current_session(self) -> Session:
+        # called from agent factories
+        key = AgentInstantiationContext.current_agent_id().key
+        return self._sessions[session_id_for_key(key)]
+
+    async def initialize(self, **kwargs):
+        """Build the long-lived runtime that every session is routed through.
+
+        Agents are keyed by session id, so each session gets its own manager,
+        tool agent and workers, while the model client and its HTTP connection
+        pool are shared by all of them. At most ``max_sessions`` sessions run
+        at the same time, further ones are rejected.
+        """
+        logger.debug("initialize %s", kwargs)
+        self._sessions: Dict[str, Session] = {}
+        # a ready made client, e.g. FakeChatCompletionClient, needs no API key
+        model_client = kwargs.get("model_client")
         api_key = os.environ.get("OPENAI_API_KEY")
         if not api_key:
             api_key = kwargs.get("openai_key")
-        if not api_key:
+        if not api_key and model_client is None:
             raise ValueError("OPENAI_API_KEY is not set.")
-        self.runtime = SingleThreadedAgentRuntime()
-        worker_1_agent_type = await NextJSProgrammingAgent.register(
-            self.runtime,
-            worker_1_topic_type,  # Using topic type as the agent type.
-            lambda: NextJSProgrammingAgent(
-                description=worker_description,
-                group_chat_topic_type=group_chat_topic_type,
-                model_client=OpenAIChatCompletionClient(
-                    model="gpt-4o",
-                    api_key=api_key,
-                ),
-            ),
+        # default workspace for requests that do not name one
+        project_directory = (
+            kwargs.get("project_directory")
+            or os.environ.get("WORKSPACE_DIR")
+            or os.path.join(os.path.dirname(__file__), "../../code-server/workspace")
         )
-        await self.runtime.add_subscription(
-            TypeSubscription(
-                topic_type=worker_1_topic_type, agent_type=worker_1_agent_type.type
-            )
+        # maps the workspace named in a request to a directory
+        self.resolve_workspace = kwargs.get("workspace_resolver") or WorkspaceResolver(
+            project_directory, root=os.environ.get("WORKSPACES_ROOT")
         )
-        await self.runtime.add_subscription(
-            TypeSubscription(
-                topic_type=group_chat_topic_type, agent_type=worker_1_agent_type.type
-            )
+        self.max_sessions = int(
+            kwargs.get("max_sessions") or os.environ.get("MAX_SESSIONS", 8)
         )
-
-        worker_2_agent_type = await NextJSProgrammingAgent.register(
-            self.runtime,
-            worker_2_topic_type,  # Using topic type as the agent type.
-            lambda: NextJSProgrammingAgent(
-                description=worker_description,
-                group_chat_topic_type=group_chat_topic_type,
-                model_client=OpenAIChatCompletionClient(
-                    model="gpt-4o",
-                    api_key=api_key,
-                ),
-            ),
+        # workspaces whose index, installer and checker processes are kept
+        # once their sessions are over, least recently used ones are dropped
+        self.workspace_cache_size = int(
+            kwargs.get("workspace_cache_size") or os.environ.get("WORKSPACE_CACHE_SIZE", 8)
         )
-        await self.runtime.add_subscription(
-            TypeSubscription(
-                topic_type=worker_2_topic_type, agent_type=worker_2_agent_type.type
+        self._workspaces: OrderedDict[str, None] = OrderedDict()
+        # seconds a session may run before it is cancelled
+        self.session_timeout = float(
+            kwargs.get("session_timeout") or os.environ.get("SESSION_TIMEOUT", 900)
+        )
+        # sessions submitted as jobs run in the background, on at most
+        # JOB_WORKERS of the sessions so interactive requests still get some
+        job_workers = int(kwargs.get("job_workers") or os.environ.get("JOB_WORKERS", 2))
+        if job_workers >= self.max_sessions:
+            job_workers = max(self.max_sessions - 1, 1)
+            logger.warning(
+                "JOB_WORKERS is not below MAX_SESSIONS, running %d job workers", job_workers
             )
+        max_workers = int(
+            kwargs.get("max_workers") or os.environ.get("MAX_WORKERS", 4)
         )
-        await self.runtime.add_subscription(
-            TypeSubscription(
-                topic_type=group_chat_topic_type, agent_type=worker_2_agent_type.type
+        context_token_budget = int(
+            kwargs.get("context_token_budget")
+            or os.environ.get("CONTEXT_TOKEN_BUDGET", 60000)
+        )
+        # PLANNER_MODE=tools plans with tool calls instead of a streamed plan
+        planner_mode = kwargs.get("planner_mode") or os.environ.get(
+            "PLANNER_MODE", "stream"
+        )
+        # signatures of the best matching files sent along with each task
+        related_files = int(
+            kwargs.get("related_files", os.environ.get("WORKER_RELATED_FILES", 3))
+        )
+        # VALIDATION=typecheck,lint checks the written files before the
+        # session completes, and sends files with errors back to be fixed
+        validation = kwargs.get("validation")
+        if validation is None:
+            validation = os.environ.get("VALIDATION", "")
+        if isinstance(validation, str):
+            validation = [check.strip() for check in validation.split(",") if check.strip()]
+        unknown = set(validation) - set(CHECKS)
+        if unknown:
+            raise ValueError(f"Unknown validation checks: {', '.join(sorted(unknown))}.")
+        fix_rounds = int(kwargs.get("fix_rounds", os.environ.get("VALIDATION_FIX_ROUNDS", 2)))
+        validation_concurrency = int(
+            kwargs.get("validation_concurrency")
+            or os.environ.get("VALIDATION_CONCURRENCY", 4)
+        )
+        settings = worker_settings(**kwargs)
+        self.model_client, self.rate_limiter, self.completion_cache = build_model_client(
+            model_client, api_key
+        )
+        # WORKER_HOST_ADDRESS and WORKER_PROCESSES run workers in separate
+        # processes, the in-process workers only take over while none is connected
+        worker_host_address = kwargs.get("worker_host_address") or os.environ.get(
+            "WORKER_HOST_ADDRESS"
+        )
+        worker_processes = int(
+            kwargs.get("worker_processes") or os.environ.get("WORKER_PROCESSES", 0)
+        )
+        self.remote_workers = None
+        if worker_host_address or worker_processes > 0:
+            # needs autogen-ext[grpc], only imported when it is used
+            from multi_agent.distributed import RemoteWorkers
+
+            self.remote_workers = RemoteWorkers(
+                worker_host_address or "localhost:50060",
+                processes=worker_processes,
+                heartbeat_timeout=float(os.environ.get("WORKER_HEARTBEAT_TIMEOUT", 15)),
             )
+            await self.remote_workers.start()
+        self.runtime = SingleThreadedAgentRuntime()
+        self.session_agents = SessionAgents(self.runtime)
+        # workers are instantiated on demand by the manager, one per pool slot
+        await NextJSProgrammingAgent.register(
+            self.runtime,
+            worker_agent_type,
+            self.session_agents.factory(
+                lambda: NextJSProgrammingAgent(
+                    description=worker_description,
+                    group_chat_topic_type=group_chat_topic_type,
+                    model_client=self.model_client,
+                    queue=self.current_session().delta_queue,
+                    blobs=self.current_session().blobs,
+                    **settings,
+                )
+            ),
         )
 
         tools = [
             FunctionTool(
                 self.assign_tasks,
-                description="Assign a task to a NextJS expert based on the user's message and project structure. You need to provide a detailed description of the task, what needs to be done, and the expected outcome. Make sure that two different tasks do not modify the same file. Come up with some basic task id, to keep track of dependency. If one task depends on another, then mention the task_parent_id.",
+                description="Assign a task to a NextJS expert based on the user's message and project structure. You need to provide a detailed description of the task, what needs to be done, and the expected outcome. Make sure that two different tasks do not modify the same file. Come up with some basic task id, to keep track of dependency. If one task depends on another, then mention the parent_task_id.",
             )
         ]
 
         await ToolAgent.register(
             self.runtime,
             "tool_executor_agent",
-            lambda: ToolAgent("tool executor agent", tools),
+            self.session_agents.factory(lambda: ToolAgent("tool executor agent", tools)),
         )
 
         group_chat_manager_type = await GroupChatManager.register(
             self.runtime,
             "group_chat_manager",
-            lambda: GroupChatManager(
-                model_client=OpenAIChatCompletionClient(
-                    model="gpt-4o",
-                    api_key=api_key,
-                ),
-                tool_schema=[tool.schema for tool in tools],
-                worker_topic_types=[worker_1_topic_type, worker_2_topic_type],
-                worker_descriptions=[worker_description, worker_description],
-                queue=queue,
+            self.session_agents.factory(
+                lambda: GroupChatManager(
+                    model_client=self.model_client,
+                    tool_schema=[tool.schema for tool in tools],
+                    worker_agent_type=worker_agent_type,
+                    worker_description=worker_description,
+                    max_workers=max_workers,
+                    context_token_budget=context_token_budget,
+                    project_directory=self.current_session().workspace,
+                    planner_mode=planner_mode,
+                    related_files=related_files,
+                    validation=validation,
+                    fix_rounds=fix_rounds,
+                    validation_concurrency=validation_concurrency,
+                    queue=self.current_session().queue,
+                    delta_queue=self.current_session().delta_queue,
+                    remote_workers=self.remote_workers,
+                    blobs=self.current_session().blobs,
+                )
             ),
         )
         await self.runtime.add_subscription(
@@ -146,19 +325,142 @@ class MultiAgent:
                 agent_type=group_chat_manager_type.type,
             )
         )
-
-    async def start(self, message: UserMessage):
-        print("Starting the runtime")
+        # agent_event_loop_lag_seconds shows when blocking work stalls sessions
+        self.loop_monitor = LoopLagMonitor(
+            interval=float(os.environ.get("LOOP_LAG_INTERVAL", 0.1))
+        )
+        self.loop_monitor.start()
+        executors.warm_up()
+        logger.info("Starting the runtime")
         self.runtime.start()
-        print("publishing message")
-        print(GroupChatMessage(body=message))
-        await self.runtime.publish_message(
-            GroupChatMessage(body=message),
-            TopicId(type=group_chat_topic_type, source=self.session_id),
+        self.jobs = JobQueue(self.run_job, workers=job_workers)
+        self.jobs.start()
+
+    async def warm_up(self) -> None:
+        """Load what the first session would otherwise wait for: the
+        tokenizer's BPE ranks and the index of the default workspace."""
+        with metrics.span("warm_up"):
+            await executors.run_blocking(get_encoding)
+            workspace = self.resolve_workspace(None)
+            if os.path.isdir(workspace):
+                self.use_workspace(workspace)
+                await WorkspaceIndex.for_directory(workspace).refresh_async()
+
+    async def start(
+        self,
+        message: str,
+        queue: asyncio.Queue,
+        stream_deltas: bool = False,
+        workspace: str | None = None,
+        timeout: float | None = None,
+    ):
+        """Run ``message`` as one session on the shared runtime and return once
+        it is done.
+
+        Raises SessionLimitExceeded when ``max_sessions`` are already running
+        and InvalidWorkspace when ``workspace`` can not be resolved. The
+        session is cancelled, including its model calls and workers, when the
+        caller is cancelled or after ``timeout`` (at most ``session_timeout``)
+        seconds, in which case SessionTimeout is raised.
+        """
+        workspace_directory = self.resolve_workspace(workspace)
+        if len(self._sessions) >= self.max_sessions:
+            metrics.increment("sessions_rejected")
+            raise SessionLimitExceeded(
+                f"{len(self._sessions)} sessions are running, try again later."
+            )
+        session_id = str(uuid.uuid4())
+        self._sessions[session_id] = Session(
+            queue=queue, workspace=workspace_directory, stream_deltas=stream_deltas
         )
+        self.use_workspace(workspace_directory)
+        metrics.increment("sessions_started")
+        metrics.set_gauge("active_sessions", len(self._sessions))
+        logger.info("Session %s started in %s", session_id, workspace_directory)
+        if timeout is None or timeout > self.session_timeout:
+            timeout = self.session_timeout
+        cancellation_token = CancellationToken()
+        timer = asyncio.get_running_loop().call_later(timeout, cancellation_token.cancel)
+        completed = False
+        try:
+            # the manager only returns once planning and every file are done
+            await self.runtime.send_message(
+                GroupChatMessage(body=UserMessage(content=message, source="user")),
+                AgentId("group_chat_manager", session_id),
+                cancellation_token=cancellation_token,
+            )
+            completed = True
+        except asyncio.CancelledError:
+            # only the timer cancels the token before the session is over
+            if cancellation_token.is_cancelled():
+                metrics.increment("sessions_timed_out")
+                raise SessionTimeout(f"Session took longer than {timeout:g}s.")
+            raise
+        finally:
+            timer.cancel()
+            # stops the session's model calls and workers if the caller went
+            # away or the session failed, a completed session has none left
+            if not completed:
+                cancellation_token.cancel()
+            await self.release_session(session_id)
+        logger.info("Session %s finished", session_id)
+
+    def submit_job(
+        self,
+        message: str,
+        workspace: str | None = None,
+        priority: str = "normal",
+        group: str | None = None,
+    ) -> Job:
+        """Queue a session to run in the background, raises InvalidWorkspace
+        right away instead of when the job runs."""
+        self.resolve_workspace(workspace)
+        return self.jobs.submit(message, workspace, priority, group)
+
+    async def run_job(self, job: Job, queue: asyncio.Queue) -> None:
+        await self.start(
+            job.message,
+            queue=queue,
+            workspace=job.workspace,
+        )
+
+    async def release_session(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        # a cancelled session can leave refs behind
+        session.blobs.clear()
+        metrics.set_gauge("active_sessions", len(self._sessions))
+        # so a long-lived runtime does not keep every session's agents alive
+        await self.session_agents.release(session_id)
+        if self.remote_workers is not None:
+            self.remote_workers.release_session(session_id)
+        await self.release_workspaces()
+
+    def use_workspace(self, workspace: str) -> None:
+        self._workspaces[workspace] = None
+        self._workspaces.move_to_end(workspace)
 
-        await self.runtime.stop_when_idle()
-        print("Runtime stopped")
+    async def release_workspaces(self) -> None:
+        """Drop the caches of the least recently used workspaces beyond
+        ``workspace_cache_size``, except ones a session runs in or that are
+        installing their dependencies."""
+        in_use = {session.workspace for session in self._sessions.values()}
+        for workspace in list(self._workspaces):
+            if len(self._workspaces) <= self.workspace_cache_size:
+                break
+            if workspace in in_use or not DependencyInstaller.release(workspace):
+                continue
+            del self._workspaces[workspace]
+            WorkspaceIndex.release(workspace)
+            await Validator.release(workspace)
+            logger.info("Released the caches of %s", workspace)
 
     async def stop(self):
+        await self.jobs.stop()
+        await self.loop_monitor.stop()
         await self.runtime.stop()
+        if self.remote_workers is not None:
+            await self.remote_workers.stop()
+        await Validator.stop_all()
+        if self.completion_cache is not None:
+            self.completion_cache.close()
+        executors.shutdown()
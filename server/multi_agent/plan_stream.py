@@ -0,0 +1,52 @@
+import json
+from typing import List
+
+from pydantic import ValidationError
+
+from multi_agent.messages import TaskMessage
+
+
+PLAN_FORMAT = """Respond only with the tasks, one JSON object per line and nothing else, no markdown and no numbering:
+{"task_id": "<short id>", "description": "<what to do and the expected outcome>", "file_names": ["<file to change>"], "parent_task_id": "<task_id of the parent>" or null}
+Write every task on a single line, and write a parent task before the tasks that depend on it."""
+
+
+class PlanStreamParser:
+    """Turns a streamed plan in the :data:`PLAN_FORMAT` into tasks line by line.
+
+    :meth:`feed` returns the tasks completed by a chunk, so they can be
+    dispatched while the rest of the plan is still being generated. Lines that
+    are not a valid task are collected in :attr:`errors` to be sent back to the
+    planner.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self.text = ""
+        self.errors: List[str] = []
+
+    def feed(self, chunk: str) -> List[TaskMessage]:
+        self.text += chunk
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        return [task for task in map(self._parse_line, lines) if task is not None]
+
+    def close(self) -> List[TaskMessage]:
+        line, self._buffer = self._buffer, ""
+        task = self._parse_line(line)
+        return [task] if task is not None else []
+
+    def _parse_line(self, line: str) -> TaskMessage | None:
+        line = line.strip()
+        # models wrap the plan in a code fence now and then despite being asked
+        if not line or line.startswith("```"):
+            return None
+        try:
+            task = TaskMessage.model_validate(json.loads(line))
+        except (json.JSONDecodeError, ValidationError) as e:
+            self.errors.append(f"Invalid task line {line[:200]!r}: {e}")
+            return None
+        # planners sometimes send an empty string for "no parent"
+        task.parent_task_id = task.parent_task_id or None
+        return task
+
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+import openai
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage
+from autogen_core.tools import Tool, ToolSchema
+
+from multi_agent.executors import run_blocking
+from multi_agent.metrics import metrics
+from multi_agent.session import current_session_id
+from multi_agent.wrapped_client import WrappedChatCompletionClient
+
+
+logger = logging.getLogger(__name__)
+
+# errors that mean the provider is overloaded, concurrency is cut on these
+OVERLOAD_ERRORS = (openai.RateLimitError, openai.APITimeoutError, asyncio.TimeoutError)
+# errors worth retrying, nothing was generated yet when they are raised
+RETRY_ERRORS = OVERLOAD_ERRORS + (openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over a minute, 0 means unlimited."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(
+            self.per_minute, self.level + (now - self._updated) * self.per_minute / 60
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken, requests larger than the
+        whole bucket only wait for a full bucket."""
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.per_minute) - self.level
+        return max(missing, 0.0) * 60 / self.per_minute
+
+    def take(self, amount: float) -> None:
+        # may go negative when usage turns out higher than estimated
+        if self.per_minute > 0:
+            self._refill()
+            self.level -= amount
+
+
+class RateLimiter:
+    """Process-wide admission control for model calls.
+
+    Calls wait in one FIFO queue per session and the queues are served round
+    robin, so a session with many files can not starve the others. A call is
+    admitted once the request and token budgets allow it and fewer than
+    ``limit`` calls are running. ``limit`` adapts like TCP congestion control:
+    it grows by one per ``limit`` successful calls, is halved on rate limits
+    and timeouts and is cut by a tenth when latency jumps above
+    ``latency_tolerance`` times its moving average. Latency is tracked per
+    kind of call, a planner ``create`` and a worker stream are not comparable.
+    """
+
+    # calls of a kind to see before latency is used to cut concurrency
+    warmup_samples = 5
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        latency_tolerance: float = 2.0,
+    ) -> None:
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self._latency_tolerance = latency_tolerance
+        # moving average and sample count per kind of call
+        self.latency: Dict[str, Tuple[float, int]] = {}
+        self.active = 0
+        self._queues: OrderedDict[str, Deque[Tuple[asyncio.Future, int]]] = OrderedDict()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(
+        self,
+        session_id: str,
+        tokens: int,
+        cancellation_token: CancellationToken | None = None,
+    ) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append((waiter, tokens))
+        self._schedule()
+        if cancellation_token is not None:
+            cancellation_token.link_future(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # admitted just before being cancelled
+                self.release(ok=True)
+            else:
+                self._discard(session_id, waiter)
+            raise
+
+    def release(
+        self,
+        ok: bool,
+        latency: float | None = None,
+        overloaded: bool = False,
+        kind: str = "create",
+    ) -> None:
+        self.active -= 1
+        if overloaded:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+        elif ok and latency is not None:
+            average, samples = self.latency.get(kind, (latency, 0))
+            if samples >= self.warmup_samples and latency > average * self._latency_tolerance:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.latency[kind] = (0.8 * average + 0.2 * latency, samples + 1)
+        metrics.set_gauge("model_concurrency_limit", self.limit)
+        self._schedule()
+
+    def record_usage(self, estimated: int, actual: int) -> None:
+        # charge what was really used, the estimate only covered the prompt
+        self._tokens.take(actual - estimated)
+
+    def _discard(self, session_id: str, waiter: asyncio.Future) -> None:
+        queue = self._queues.get(session_id)
+        if queue is None:
+            return
+        for item in queue:
+            if item[0] is waiter:
+                queue.remove(item)
+                break
+        if not queue:
+            del self._queues[session_id]
+
+    def _schedule(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queues and self.active < int(self.limit):
+            session_id, queue = next(iter(self._queues.items()))
+            waiter, tokens = queue[0]
+            if waiter.done():
+                queue.popleft()
+            else:
+                wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                if wait > 0:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._schedule)
+                    break
+                queue.popleft()
+                self._requests.take(1)
+                self._tokens.take(tokens)
+                self.active += 1
+                waiter.set_result(None)
+            # round robin, the session goes to the back of the line
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
+        metrics.set_gauge("model_calls_queued", self.queued)
+        metrics.set_gauge("model_calls_active", self.active)
+
+
+class Attempt:
+    """Timing of one model call, latency is measured to the first response."""
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.latency: float | None = None
+
+    def responded(self) -> None:
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.start
+
+
+def retry_after(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedChatCompletionClient(WrappedChatCompletionClient):
+    """Sends every call through a shared :class:`RateLimiter` and retries
+    rate limits, timeouts and server errors with jittered exponential backoff.
+
+    Streams are only retried until their first chunk, partial output is never
+    replayed.
+    """
+
+    def __init__(
+        self,
+        client: ChatCompletionClient,
+        limiter: RateLimiter,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        completion_tokens: int = 1000,
+        session_key: Callable[[], str | None] = current_session_id,
+    ) -> None:
+        super().__init__(client)
+        self._limiter = limiter
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        # expected completion size, added to the prompt for the token budget
+        self._completion_tokens = completion_tokens
+        self._session_key = session_key
+
+    async def estimate_tokens(
+        self,
+        messages: Sequence[LLMMessage],
+        tools: Sequence[Tool | ToolSchema],
+        extra_create_args: Mapping[str, Any],
+    ) -> int:
+        completion_tokens = extra_create_args.get("max_tokens") or self._completion_tokens
+        # tokenizes the whole prompt, tens of thousands of tokens for the
+        # planner, so it runs off the event loop
+        prompt_tokens = await run_blocking(self._client.count_tokens, messages, tools=tools)
+        return prompt_tokens + completion_tokens
+
+    @asynccontextmanager
+    async def _slot(
+        self, kind: str, tokens: int, cancellation_token: CancellationToken | None
+    ) -> AsyncIterator[Attempt]:
+        await self._limiter.acquire(self._session_key() or "", tokens, cancellation_token)
+        attempt = Attempt()
+        try:
+            yield attempt
+        except OVERLOAD_ERRORS:
+            self._limiter.release(ok=False, overloaded=True)
+            raise
+        except BaseException:
+            self._limiter.release(ok=False)
+            raise
+        attempt.responded()
+        self._limiter.release(ok=True, latency=attempt.latency, kind=kind)
+
+    async def _backoff(
+        self,
+        attempt: int,
+        error: BaseException,
+        cancellation_token: CancellationToken | None,
+    ) -> None:
+        # full jitter, but never sooner than the provider asked for
+        delay = random.uniform(0, min(self._max_delay, self._base_delay * 2**attempt))
+        delay = max(delay, retry_after(error) or 0)
+        metrics.increment("model_retries", error=type(error).__name__)
+        logger.warning(
+            "Model call failed (%s), retry %d in %.1fs", error, attempt + 1, delay
+        )
+        sleep = asyncio.ensure_future(asyncio.sleep(delay))
+        if cancellation_token is not None:
+            cancellation_token.link_future(sleep)
+        await sleep
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        tokens = await self.estimate_tokens(messages, tools, extra_create_args)
+        for attempt in range(self._max_retries + 1):
+            try:
+                async with self._slot("create", tokens, cancellation_token):
+                    result = await self._client.create(
+                        messages,
+                        tools=tools,
+                        json_output=json_output,
+                        extra_create_args=extra_create_args,
+                        cancellation_token=cancellation_token,
+                    )
+            except RETRY_ERRORS as e:
+                if attempt == self._max_retries:
+                    raise
+                await self._backoff(attempt, e, cancellation_token)
+                continue
+            self._limiter.record_usage(
+                tokens, result.usage.prompt_tokens + result.usage.completion_tokens
+            )
+            return result
+        raise AssertionError("unreachable")
+
+    async def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        tokens = await self.estimate_tokens(messages, tools, extra_create_args)
+        for attempt in range(self._max_retries + 1):
+            started = False
+            try:
+                async with self._slot("stream", tokens, cancellation_token) as call:
+                    async for item in self._client.create_stream(
+                        messages,
+                        tools=tools,
+                        json_output=json_output,
+                        extra_create_args=extra_create_args,
+                        cancellation_token=cancellation_token,
+                    ):
+                        started = True
+                        call.responded()
+                        if isinstance(item, CreateResult):
+                            self._limiter.record_usage(
+                                tokens,
+                                item.usage.prompt_tokens + item.usage.completion_tokens,
+                            )
+                        yield item
+            except RETRY_ERRORS as e:
+                if started or attempt == self._max_retries:
+                    raise
+                await self._backoff(attempt, e, cancellation_token)
+                continue
+            return
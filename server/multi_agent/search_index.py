@@ -0,0 +1,166 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z0-9_]+")
+# splits camelCase, PascalCase and snake_case identifiers into words
+_WORD_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+_EXPORT_RE = re.compile(
+    r"^\s*export\s+(?:default\s+)?(?:declare\s+)?(?:abstract\s+)?(?:async\s+)?"
+    r"(?:function\*?|class|const|let|var|interface|type|enum)\s+([A-Za-z_$][\w$]*)",
+    re.MULTILINE,
+)
+_EXPORT_LIST_RE = re.compile(r"^\s*export\s*(?:type\s*)?\{([^}]*)\}", re.MULTILINE)
+_STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "the", "this", "to", "with", "add", "make", "please",
+}
+
+# how much a match in each field counts, a file named after a query term is a
+# better hit than one that mentions it
+FIELD_WEIGHTS = {"path": 3.0, "symbols": 2.0, "content": 1.0}
+
+
+def extract_terms(text: str) -> List[str]:
+    """Lowercase words of the identifiers in ``text``; compound identifiers
+    also count as a whole, so "navbar" finds ``NavBar``."""
+    terms = []
+    for identifier in _IDENTIFIER_RE.findall(text):
+        words = [word.lower() for word in _WORD_RE.findall(identifier)]
+        if len(words) > 1:
+            terms.append(identifier.lower())
+        terms.extend(word for word in words if len(word) > 1 and word not in _STOP_WORDS)
+    return terms
+
+
+def exported_symbols(content: str) -> List[str]:
+    symbols = _EXPORT_RE.findall(content)
+    for names in _EXPORT_LIST_RE.findall(content):
+        for name in names.split(","):
+            # "a as b" exports b
+            name = name.split(" as ")[-1].strip()
+            if name:
+                symbols.append(name)
+    return symbols
+
+
+def document_fields(path: str, content: str) -> Dict[str, Counter[str]]:
+    return {
+        "path": Counter(extract_terms(path)),
+        "symbols": Counter(extract_terms(" ".join(exported_symbols(content)))),
+        "content": Counter(extract_terms(content)),
+    }
+
+
+class SearchIndex:
+    """Inverted index over the workspace files for BM25 lookups.
+
+    Paths, exported symbols and identifiers are indexed as separate fields
+    and a file's score is the weighted sum of its BM25 score per field.
+    :meth:`update` only touches the postings of the files it is given, so it
+    can follow every change to the workspace. Safe to use from the I/O
+    threads, terms are extracted outside the lock.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self._k1 = k1
+        self._b = b
+        # field -> term -> path -> term frequency
+        self._postings: Dict[str, Dict[str, Dict[str, int]]] = {
+            field: defaultdict(dict) for field in FIELD_WEIGHTS
+        }
+        # field -> path -> number of terms
+        self._lengths: Dict[str, Dict[str, int]] = {field: {} for field in FIELD_WEIGHTS}
+        self._total_lengths: Dict[str, int] = {field: 0 for field in FIELD_WEIGHTS}
+        self._documents: Dict[str, Dict[str, Counter[str]]] = {}
+        # field -> path -> BM25 length normalization, rebuilt after updates
+        self._norms: Dict[str, Dict[str, float]] | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def update(
+        self, documents: Iterable[Tuple[str, str]] = (), removed: Iterable[str] = ()
+    ) -> None:
+        """Index ``(path, content)`` documents, replacing earlier versions,
+        and drop the ``removed`` paths."""
+        fields = [(path, document_fields(path, content)) for path, content in documents]
+        with self._lock:
+            for path in removed:
+                self._remove(path)
+            for path, document in fields:
+                self._remove(path)
+                self._add(path, document)
+            self._norms = None
+
+    def _add(self, path: str, document: Dict[str, Counter[str]]) -> None:
+        self._documents[path] = document
+        for field, terms in document.items():
+            postings = self._postings[field]
+            for term, count in terms.items():
+                postings[term][path] = count
+            length = sum(terms.values())
+            self._lengths[field][path] = length
+            self._total_lengths[field] += length
+
+    def _remove(self, path: str) -> None:
+        document = self._documents.pop(path, None)
+        if document is None:
+            return
+        for field, terms in document.items():
+            postings = self._postings[field]
+            for term in terms:
+                del postings[term][path]
+                if not postings[term]:
+                    del postings[term]
+            self._total_lengths[field] -= self._lengths[field].pop(path)
+
+    def _length_norms(self) -> Dict[str, Dict[str, float]]:
+        if self._norms is None:
+            count = max(len(self._documents), 1)
+            self._norms = {}
+            for field, lengths in self._lengths.items():
+                average_length = max(self._total_lengths[field] / count, 1.0)
+                self._norms[field] = {
+                    path: self._k1 * (1 - self._b + self._b * length / average_length)
+                    for path, length in lengths.items()
+                }
+        return self._norms
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """BM25 score of every file that matches a term of ``query``."""
+        terms = set(extract_terms(query))
+        scores: Dict[str, float] = defaultdict(float)
+        with self._lock:
+            count = len(self._documents)
+            if not count:
+                return {}
+            norms = self._length_norms()
+            for field, weight in FIELD_WEIGHTS.items():
+                postings = self._postings[field]
+                field_norms = norms[field]
+                for term in terms:
+                    matches = postings.get(term)
+                    if not matches:
+                        continue
+                    idf = math.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+                    factor = weight * idf * (self._k1 + 1)
+                    for path, frequency in matches.items():
+                        scores[path] += factor * frequency / (frequency + field_norms[path])
+        return scores
+
+    def search(
+        self, query: str, k: int = 10, exclude: Set[str] = frozenset()
+    ) -> List[Tuple[str, float]]:
+        """The ``k`` best matching paths with their scores, best first."""
+        scores = self.scores(query)
+        return heapq.nlargest(
+            k,
+            ((path, score) for path, score in scores.items() if path not in exclude),
+            key=lambda item: item[1],
+        )
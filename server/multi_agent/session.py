@@ -0,0 +1,114 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Set, TypeVar
+
+from autogen_core import (
+    AgentId,
+    AgentInstantiationContext,
+    AgentRuntime,
+    CancellationToken,
+    MessageHandlerContext,
+)
+
+from multi_agent.blob_store import BlobStore
+
+
+class SessionLimitExceeded(Exception):
+    pass
+
+
+class SessionTimeout(TimeoutError):
+    pass
+
+
+class PlanningFailed(Exception):
+    """The planner's tasks can not all run, e.g. they wait for parent tasks
+    that were never assigned."""
+
+
+@dataclass
+class Session:
+    queue: asyncio.Queue
+    workspace: str
+    stream_deltas: bool = False
+    # file bodies the session's messages refer to
+    blobs: BlobStore = field(default_factory=BlobStore)
+
+    @property
+    def delta_queue(self) -> asyncio.Queue | None:
+        return self.queue if self.stream_deltas else None
+
+
+def session_id_for_key(key: str) -> str:
+    # managers and tool agents are keyed by the session id, workers by
+    # "<session id>_<slot>"
+    return key.split("_")[0]
+
+
+T = TypeVar("T")
+
+
+def check_runtime(runtime: AgentRuntime) -> None:
+    """Fail at startup, not by leaking every session, if ``runtime`` is an
+    autogen version whose agent instances :class:`SessionAgents` can not drop."""
+    if not isinstance(getattr(runtime, "_instantiated_agents", None), dict):
+        raise RuntimeError(
+            f"{type(runtime).__name__} can not drop agents, this needs autogen-core 0.4"
+        )
+
+
+class SessionAgents:
+    """The agents instantiated for each session, so they are closed and
+    dropped from the runtime when the session ends.
+
+    autogen 0.4 runtimes keep every agent they instantiate and have no public
+    way to remove one; :meth:`release` closes the agent and then takes it out
+    of the runtime's instance cache, the only place that relies on it. Wrap
+    the agent factories with :meth:`factory` to record the instances.
+    """
+
+    def __init__(self, runtime: AgentRuntime) -> None:
+        check_runtime(runtime)
+        self._runtime = runtime
+        self._agents: Dict[str, Set[AgentId]] = defaultdict(set)
+
+    def factory(self, create: Callable[[], T]) -> Callable[[], T]:
+        def create_and_record() -> T:
+            agent_id = AgentInstantiationContext.current_agent_id()
+            self._agents[session_id_for_key(agent_id.key)].add(agent_id)
+            return create()
+
+        return create_and_record
+
+    async def release(self, session_id: str) -> None:
+        instances = self._runtime._instantiated_agents
+        for agent_id in self._agents.pop(session_id, ()):
+            agent = instances.pop(agent_id, None)
+            if agent is not None:
+                await agent.close()
+
+    def __len__(self) -> int:
+        return sum(len(agents) for agents in self._agents.values())
+
+
+def current_session_id() -> str | None:
+    """Session of the agent whose message handler is running, if any."""
+    try:
+        return session_id_for_key(MessageHandlerContext.agent_id().key)
+    except RuntimeError:
+        return None
+
+
+async def put_update(
+    queue: asyncio.Queue, update: dict, cancellation_token: CancellationToken
+) -> None:
+    """Queue a progress update, giving up once the session is cancelled.
+
+    The queue is bounded, without this a worker would wait forever for a
+    client that went away.
+    """
+    if not queue.full():
+        queue.put_nowait(update)
+        return
+    await cancellation_token.link_future(asyncio.ensure_future(queue.put(update)))
@@ -0,0 +1,155 @@
+import logging
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+
+from multi_agent.messages import TaskMessage
+from multi_agent.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# task id, description and file name of one file to write
+FileJob = Tuple[str, str, str]
+
+
+class TaskGraph:
+    """Dependency graph of the planner's tasks.
+
+    A task becomes ready once its parent task has finished, and a task is
+    finished once every one of its files has been written. Tasks can be added
+    in any order; a parent that never shows up is reported by
+    :meth:`missing_parents` once planning is over.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[str, TaskMessage] = {}
+        self._children: Dict[str, List[str]] = {}
+        self._remaining_files: Dict[str, int] = {}
+        self._finished: Set[str] = set()
+
+    def add(self, task: TaskMessage) -> List[TaskMessage]:
+        """Add a task and return the tasks that are ready to run because of it."""
+        if task.task_id in self._tasks:
+            raise ValueError(f"Task {task.task_id} has already been assigned.")
+
+        # each task has a single parent and the graph is acyclic so far, so a
+        # cycle exists only if the new task is one of its own ancestors
+        parent_id = task.parent_task_id
+        while parent_id is not None:
+            if parent_id == task.task_id:
+                raise ValueError(
+                    f"Task {task.task_id} would create a dependency cycle through {task.parent_task_id}."
+                )
+            if parent_id not in self._tasks:
+                break
+            parent_id = self._tasks[parent_id].parent_task_id
+
+        self._tasks[task.task_id] = task
+        self._remaining_files[task.task_id] = len(task.file_names)
+        if task.parent_task_id is not None:
+            self._children.setdefault(task.parent_task_id, []).append(task.task_id)
+
+        if task.parent_task_id is None or task.parent_task_id in self._finished:
+            return self._release(task.task_id)
+        return []
+
+    def complete_file(self, task_id: str) -> List[TaskMessage]:
+        """Mark one file of ``task_id`` as written and return newly ready tasks."""
+        self._remaining_files[task_id] -= 1
+        if self._remaining_files[task_id] > 0:
+            return []
+        return self._finish(task_id)
+
+    def missing_parents(self) -> Dict[str, List[str]]:
+        """Map each unknown parent task id to the tasks waiting on it."""
+        missing: Dict[str, List[str]] = {}
+        for parent_id, children in self._children.items():
+            if parent_id not in self._tasks:
+                missing[parent_id] = list(children)
+        return missing
+
+    @property
+    def unfinished(self) -> List[str]:
+        return [task_id for task_id in self._tasks if task_id not in self._finished]
+
+    def _release(self, task_id: str) -> List[TaskMessage]:
+        # a task without files is done as soon as it is ready
+        if self._remaining_files[task_id] > 0:
+            return [self._tasks[task_id]]
+        return self._finish(task_id)
+
+    def _finish(self, task_id: str) -> List[TaskMessage]:
+        self._finished.add(task_id)
+        ready: List[TaskMessage] = []
+        for child_id in self._children.get(task_id, []):
+            ready.extend(self._release(child_id))
+        return ready
+
+
+class FileSchedule:
+    """Order in which the files of ready tasks are written.
+
+    A file is held back while another job writes the same file, so parallel
+    tasks never overwrite each other, and while a file it imports, according
+    to ``imports``, is still queued or being written, so it is written
+    against the final version of its dependencies. Files only wait for jobs
+    queued before them, which rules out waiting in a cycle; files that are
+    added together are queued dependencies first.
+    """
+
+    def __init__(self, imports: Callable[[str], Iterable[str]]) -> None:
+        self._imports = imports
+        self._waiting: List[FileJob] = []
+        self._writing: Set[str] = set()
+
+    def add(self, jobs: List[FileJob]) -> List[FileJob]:
+        """Queue ``jobs`` and return the ones that can be written now."""
+        busy = self._writing | {job[2] for job in self._waiting}
+        for job in jobs:
+            if job[2] in busy:
+                logger.warning(
+                    "Task %s writes %s, which is already being written", job[0], job[2]
+                )
+                metrics.increment("write_conflicts")
+            busy.add(job[2])
+        self._waiting.extend(self._dependencies_first(jobs))
+        return self._release()
+
+    def done(self, filename: str) -> List[FileJob]:
+        """Mark ``filename`` as written and return the jobs it held back."""
+        self._writing.discard(filename)
+        return self._release()
+
+    def _dependencies_first(self, jobs: List[FileJob]) -> List[FileJob]:
+        by_file: Dict[str, List[FileJob]] = {}
+        for job in jobs:
+            by_file.setdefault(job[2], []).append(job)
+        ordered: List[FileJob] = []
+        visited: Set[str] = set()
+
+        def visit(filename: str) -> None:
+            visited.add(filename)
+            for dependency in self._imports(filename):
+                if dependency in by_file and dependency not in visited:
+                    visit(dependency)
+            ordered.extend(by_file[filename])
+
+        for job in jobs:
+            if job[2] not in visited:
+                visit(job[2])
+        return ordered
+
+    def _release(self) -> List[FileJob]:
+        ready: List[FileJob] = []
+        # files that jobs later in the queue have to wait for
+        blocked = set(self._writing)
+        waiting: List[FileJob] = []
+        for job in self._waiting:
+            filename = job[2]
+            if filename in blocked or blocked.intersection(self._imports(filename)):
+                waiting.append(job)
+            else:
+                ready.append(job)
+                self._writing.add(filename)
+            blocked.add(filename)
+        self._waiting = waiting
+        return ready
@@ -0,0 +1,347 @@
+"""Type checks and lints the files a session wrote.
+
+Both checkers are long-lived node processes per workspace, started on first
+use: tsserver, which keeps the program in memory and only re-checks what
+changed, and ``eslint_worker.js``, which loads the workspace's ESLint config
+and plugins once. Both run from the workspace's own node_modules; a checker
+whose package is not installed is skipped.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Sequence
+
+from multi_agent.executors import run_blocking
+from multi_agent.import_graph import SOURCE_EXTENSIONS
+from multi_agent.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+CHECKS = ("typecheck", "lint")
+ESLINT_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eslint_worker.js")
+
+
+@dataclass
+class Diagnostic:
+    filename: str
+    line: int
+    column: int
+    message: str
+    # "tsc" or "eslint"
+    source: str
+
+    def __str__(self) -> str:
+        return f"{self.filename}:{self.line}:{self.column} {self.source}: {self.message}"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class NodeChecker(ABC):
+    """A node process that answers numbered requests, restarted if it exits."""
+
+    name = ""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._process: asyncio.subprocess.Process | None = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._sequence = 0
+        self._start_lock = asyncio.Lock()
+        self._reader: asyncio.Task | None = None
+        self._stopping = False
+
+    @abstractmethod
+    def command(self) -> List[str] | None:
+        """The command to start the checker, None if it is not installed."""
+
+    @abstractmethod
+    def encode(self, sequence: int, request: dict) -> bytes:
+        ...
+
+    @abstractmethod
+    async def read_reply(self, stdout: asyncio.StreamReader) -> dict | None:
+        """The next reply, None once the process has exited."""
+
+    @abstractmethod
+    def reply_sequence(self, reply: dict) -> int:
+        ...
+
+    @abstractmethod
+    async def check(self, filename: str) -> List[Diagnostic]:
+        ...
+
+    async def start(self) -> bool:
+        async with self._start_lock:
+            if self._process is not None and self._process.returncode is None:
+                return True
+            command = self.command()
+            if command is None:
+                return False
+            try:
+                self._process = await asyncio.create_subprocess_exec(
+                    *command,
+                    cwd=self.root,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    # diagnostics of a large file come as one line
+                    limit=16 * 1024 * 1024,
+                )
+            except OSError as e:
+                logger.error("Could not start %s: %s", self.name, e)
+                return False
+            logger.info("Started %s for %s", self.name, self.root)
+            self._reader = asyncio.create_task(self._read(self._process))
+            return True
+
+    async def request(self, request: dict) -> dict:
+        if not await self.start():
+            raise RuntimeError(f"{self.name} is not installed in the workspace")
+        self._sequence += 1
+        sequence = self._sequence
+        future = asyncio.get_running_loop().create_future()
+        self._pending[sequence] = future
+        try:
+            self._process.stdin.write(self.encode(sequence, request))
+            await self._process.stdin.drain()
+            return await future
+        except ConnectionError as e:
+            raise RuntimeError(f"{self.name} exited") from e
+        finally:
+            self._pending.pop(sequence, None)
+
+    async def _read(self, process: asyncio.subprocess.Process) -> None:
+        try:
+            while True:
+                reply = await self.read_reply(process.stdout)
+                if reply is None:
+                    break
+                future = self._pending.get(self.reply_sequence(reply))
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            logger.error("Unreadable reply from %s: %s", self.name, e)
+            process.kill()
+        finally:
+            if not self._stopping:
+                logger.warning("%s for %s exited", self.name, self.root)
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError(f"{self.name} exited"))
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._process is not None and self._process.returncode is None:
+            self._process.terminate()
+            await self._process.wait()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+class TypeScriptChecker(NodeChecker):
+    """Syntax and type errors from tsserver.
+
+    The file is opened with its content on disk for the check and closed
+    again, so tsserver goes back to watching it.
+    """
+
+    name = "tsserver"
+
+    def __init__(self, root: str) -> None:
+        super().__init__(root)
+        # opening and closing the same file for two sessions must not overlap
+        self._lock = asyncio.Lock()
+
+    def command(self) -> List[str] | None:
+        tsserver = os.path.join(self.root, "node_modules", "typescript", "lib", "tsserver.js")
+        if not os.path.exists(tsserver):
+            return None
+        return ["node", tsserver, "--disableAutomaticTypingAcquisition"]
+
+    def encode(self, sequence: int, request: dict) -> bytes:
+        return (json.dumps({"seq": sequence, "type": "request", **request}) + "\n").encode()
+
+    async def read_reply(self, stdout: asyncio.StreamReader) -> dict | None:
+        # "Content-Length: n" and an empty line, then n bytes of JSON
+        while True:
+            header = await stdout.readline()
+            if not header:
+                return None
+            if not header.startswith(b"Content-Length:"):
+                continue
+            length = int(header.split(b":", 1)[1])
+            await stdout.readline()
+            message = json.loads(await stdout.readexactly(length))
+            # events, like the project loading, are not answers
+            if message.get("type") == "response":
+                return message
+
+    def reply_sequence(self, reply: dict) -> int:
+        return reply.get("request_seq", 0)
+
+    async def call(self, command: str, arguments: dict) -> dict:
+        reply = await self.request({"command": command, "arguments": arguments})
+        if not reply.get("success"):
+            raise RuntimeError(f"{command} failed: {reply.get('message')}")
+        return reply
+
+    async def check(self, filename: str) -> List[Diagnostic]:
+        path = os.path.join(self.root, filename)
+        try:
+            content = await run_blocking(_read_text, path)
+        except FileNotFoundError:
+            return []
+        diagnostics = []
+        async with self._lock:
+            await self.call(
+                "updateOpen",
+                {"openFiles": [{"file": path, "fileContent": content, "projectRootPath": self.root}]},
+            )
+            try:
+                for command in ("syntacticDiagnosticsSync", "semanticDiagnosticsSync"):
+                    reply = await self.call(command, {"file": path})
+                    diagnostics.extend(reply.get("body") or [])
+            finally:
+                await self.call("updateOpen", {"closedFiles": [path]})
+        return [
+            Diagnostic(
+                filename=filename,
+                line=diagnostic["start"]["line"],
+                column=diagnostic["start"]["offset"],
+                message=f"{diagnostic['text']} (TS{diagnostic.get('code')})",
+                source="tsc",
+            )
+            for diagnostic in diagnostics
+            if diagnostic.get("category") == "error"
+        ]
+
+
+class ESLintChecker(NodeChecker):
+    """Lint errors, not warnings, from the workspace's ESLint config."""
+
+    name = "eslint"
+
+    def command(self) -> List[str] | None:
+        if not os.path.exists(os.path.join(self.root, "node_modules", "eslint")):
+            return None
+        return ["node", ESLINT_WORKER]
+
+    def encode(self, sequence: int, request: dict) -> bytes:
+        return (json.dumps({"id": sequence, **request}) + "\n").encode()
+
+    async def read_reply(self, stdout: asyncio.StreamReader) -> dict | None:
+        line = await stdout.readline()
+        return json.loads(line) if line else None
+
+    def reply_sequence(self, reply: dict) -> int:
+        return reply.get("id", 0)
+
+    async def check(self, filename: str) -> List[Diagnostic]:
+        reply = await self.request({"file": filename})
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return [
+            Diagnostic(
+                filename=filename,
+                line=message.get("line", 0),
+                column=message.get("column", 0),
+                message=(
+                    f"{message['message']} ({message['ruleId']})"
+                    if message.get("ruleId")
+                    else message["message"]
+                ),
+                source="eslint",
+            )
+            for message in reply.get("messages", [])
+            if message.get("severity") == 2
+        ]
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class Validator:
+    """Runs the enabled checks on one file at a time, for up to
+    ``concurrency`` files of a workspace at once.
+
+    A checker that is missing or fails is logged and skipped, the file
+    counts as valid as far as that checker is concerned. Use
+    :meth:`for_directory` to share the checker processes of a workspace
+    across sessions.
+    """
+
+    _validators: Dict[str, "Validator"] = {}
+
+    def __init__(
+        self, root: str, checks: Sequence[str] = CHECKS, concurrency: int = 4
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self._checkers: List[NodeChecker] = []
+        if "typecheck" in checks:
+            self._checkers.append(TypeScriptChecker(self.root))
+        if "lint" in checks:
+            self._checkers.append(ESLintChecker(self.root))
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._skipped = set()
+
+    @classmethod
+    def for_directory(
+        cls, root: str, checks: Sequence[str] = CHECKS, concurrency: int = 4
+    ) -> "Validator":
+        root = os.path.abspath(root)
+        if root not in cls._validators:
+            cls._validators[root] = cls(root, checks, concurrency)
+        return cls._validators[root]
+
+    @classmethod
+    async def release(cls, root: str) -> None:
+        """Stop the checker processes of the workspace at ``root``."""
+        validator = cls._validators.pop(os.path.abspath(root), None)
+        if validator is not None:
+            await validator.stop()
+
+    @classmethod
+    async def stop_all(cls) -> None:
+        validators = list(cls._validators.values())
+        cls._validators.clear()
+        await asyncio.gather(*[validator.stop() for validator in validators])
+
+    @staticmethod
+    def handles(filename: str) -> bool:
+        return filename.endswith(SOURCE_EXTENSIONS)
+
+    async def start(self) -> None:
+        """Start the checker processes ahead of the first check."""
+        await asyncio.gather(*[checker.start() for checker in self._checkers])
+
+    async def stop(self) -> None:
+        await asyncio.gather(*[checker.stop() for checker in self._checkers])
+
+    async def check(self, filename: str) -> List[Diagnostic]:
+        async with self._semaphore:
+            results = await asyncio.gather(
+                *[self._run(checker, filename) for checker in self._checkers]
+            )
+        return [diagnostic for result in results for diagnostic in result]
+
+    async def _run(self, checker: NodeChecker, filename: str) -> List[Diagnostic]:
+        if checker.command() is None:
+            if checker.name not in self._skipped:
+                self._skipped.add(checker.name)
+                logger.warning("%s is not installed in %s, skipping it", checker.name, self.root)
+            return []
+        try:
+            with metrics.span("validation", checker=checker.name):
+                return await checker.check(filename)
+        except RuntimeError as e:
+            logger.warning("%s could not check %s: %s", checker.name, filename, e)
+            metrics.increment("validation_errors", checker=checker.name)
+            return []
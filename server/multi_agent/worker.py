@@ -0,0 +1,246 @@
+"""A worker process that writes files for the server's sessions.
+
+Connects to the worker host started by the server (``WORKER_HOST_ADDRESS``),
+on this machine or another one that sees the workspaces at the same paths:
+
+    python -m multi_agent.worker --host localhost:50060 --capacity 8
+
+The process reads the same model and worker settings from the environment as
+the server. It leaves the host on SIGTERM or SIGINT, and exits by itself when
+the connection to the host is lost.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import signal
+import time
+import uuid
+from typing import Dict, Set
+
+from autogen_core import (
+    AgentId,
+    CancellationToken,
+    MessageContext,
+    RoutedAgent,
+    TopicId,
+    TypeSubscription,
+    message_handler,
+    try_get_known_serializers_for_type,
+)
+from autogen_core.models import ChatCompletionClient
+from autogen_ext.runtimes.grpc import GrpcWorkerAgentRuntime
+from dotenv import load_dotenv
+
+from multi_agent.agents.nextjs_programming_agent import NextJSProgrammingAgent
+from multi_agent.blob_store import BlobStore
+from multi_agent.distributed import control_topic_type, registry_topic_type
+from multi_agent.messages import (
+    HeartbeatAck,
+    ReleaseSession,
+    SingleTaskMessage,
+    TaskCompletionMessage,
+    WorkerDeregistration,
+    WorkerHeartbeat,
+)
+from multi_agent.multi_agent import (
+    build_model_client,
+    group_chat_topic_type,
+    worker_agent_type,
+    worker_description,
+    worker_settings,
+)
+from multi_agent.session import SessionAgents, session_id_for_key
+
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteProgrammingAgent(NextJSProgrammingAgent):
+    """A worker whose running tasks can be cancelled per session.
+
+    File contents arrive inlined in their refs and are kept in a blob store
+    of the agent's own, the written file goes back inlined as well.
+    """
+
+    def __init__(self, running: Dict[str, Set[CancellationToken]], **kwargs) -> None:
+        super().__init__(blobs=BlobStore(), **kwargs)
+        self._running = running
+
+    async def on_message_impl(self, message, ctx: MessageContext):
+        # the grpc runtime gives every request a token that nothing cancels
+        session_id = session_id_for_key(self.id.key)
+        tokens = self._running.setdefault(session_id, set())
+        tokens.add(ctx.cancellation_token)
+        if isinstance(message, SingleTaskMessage):
+            file_content = self._blobs.absorb(message.file_content)
+            message = message.model_copy(update={"file_content": file_content})
+        try:
+            result = await super().on_message_impl(message, ctx)
+            if isinstance(result, TaskCompletionMessage):
+                written = result.file_content
+                result.file_content = self._blobs.inline(written)
+                self._blobs.release(written)
+            return result
+        finally:
+            if isinstance(message, SingleTaskMessage):
+                self._blobs.release(message.file_content)
+            tokens.discard(ctx.cancellation_token)
+            if not tokens:
+                self._running.pop(session_id, None)
+
+
+class WorkerControlAgent(RoutedAgent):
+    def __init__(
+        self,
+        agents: SessionAgents,
+        running: Dict[str, Set[CancellationToken]],
+    ) -> None:
+        super().__init__("Worker control")
+        self._agents = agents
+        self._running = running
+
+    @message_handler
+    async def handle_release(self, message: ReleaseSession, ctx: MessageContext) -> None:
+        tokens = self._running.pop(message.session_id, set())
+        if tokens:
+            logger.info("Cancelling %d tasks of session %s", len(tokens), message.session_id)
+        for token in tokens:
+            token.cancel()
+        await self._agents.release(message.session_id)
+
+
+async def run_worker(
+    host_address: str,
+    capacity: int = 8,
+    heartbeat_interval: float = 5.0,
+    heartbeat_timeout: float = 15.0,
+    model_client: ChatCompletionClient | None = None,
+    **kwargs,
+) -> None:
+    """Serve worker tasks from the host at ``host_address`` until stopped,
+    or until a heartbeat is not answered within ``heartbeat_timeout``."""
+    if model_client is None and not os.environ.get("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY is not set.")
+    model_client, _, completion_cache = build_model_client(
+        model_client, os.environ.get("OPENAI_API_KEY")
+    )
+    settings = worker_settings(**kwargs)
+    # the host sends each agent type to one process only
+    agent_type = f"{worker_agent_type}_{uuid.uuid4().hex[:12]}"
+    running: Dict[str, Set[CancellationToken]] = {}
+
+    runtime = GrpcWorkerAgentRuntime(host_address=host_address)
+    runtime.start()
+    for message_type in (
+        TaskCompletionMessage,
+        WorkerHeartbeat,
+        HeartbeatAck,
+        WorkerDeregistration,
+    ):
+        runtime.add_message_serializer(try_get_known_serializers_for_type(message_type))
+    agents = SessionAgents(runtime)
+    await RemoteProgrammingAgent.register(
+        runtime,
+        agent_type,
+        agents.factory(
+            lambda: RemoteProgrammingAgent(
+                running,
+                description=worker_description,
+                group_chat_topic_type=group_chat_topic_type,
+                model_client=model_client,
+                **settings,
+            )
+        ),
+    )
+    control_type = f"{agent_type}_control"
+    await WorkerControlAgent.register(
+        runtime, control_type, lambda: WorkerControlAgent(agents, running)
+    )
+    await runtime.add_subscription(
+        TypeSubscription(topic_type=control_topic_type, agent_type=control_type)
+    )
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopped.set)
+
+    registry = TopicId(registry_topic_type, "default")
+    logger.info("Worker %s connected to %s", agent_type, host_address)
+    answered = time.monotonic()
+    while True:
+        # sends are only queued, only answered heartbeats show that the host is
+        # there. A single answer can go missing, autogen 0.4 hosts mix up the
+        # requests of workers that use the same request id, so the host only
+        # counts as gone when none is answered for heartbeat_timeout
+        heartbeat = asyncio.ensure_future(
+            runtime.send_message(
+                WorkerHeartbeat(agent_type=agent_type, capacity=capacity),
+                AgentId(registry_topic_type, "default"),
+            )
+        )
+        stopping = asyncio.ensure_future(stopped.wait())
+        await asyncio.wait(
+            (heartbeat, stopping),
+            timeout=heartbeat_interval,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        stopping.cancel()
+        if heartbeat.done() and heartbeat.exception() is None:
+            answered = time.monotonic()
+        else:
+            heartbeat.cancel()
+        if stopped.is_set():
+            break
+        if time.monotonic() - answered > heartbeat_timeout:
+            logger.error("Lost the connection to %s, exiting", host_address)
+            break
+        try:
+            # jitter, so that workers that started together do not send their
+            # heartbeats at the same moment
+            await asyncio.wait_for(
+                stopped.wait(), timeout=heartbeat_interval * random.uniform(0.5, 1.0)
+            )
+        except asyncio.TimeoutError:
+            pass
+
+    if stopped.is_set():
+        # the manager moves the tasks that are still running to other workers
+        await runtime.publish_message(WorkerDeregistration(agent_type=agent_type), registry)
+    for tokens in running.values():
+        for token in tokens:
+            token.cancel()
+    await runtime.stop()
+    if completion_cache is not None:
+        completion_cache.close()
+    logger.info("Worker %s stopped", agent_type)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--host", default=os.environ.get("WORKER_HOST_ADDRESS", "localhost:50060")
+    )
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        default=int(os.environ.get("WORKER_CAPACITY", 8)),
+        help="tasks this process takes before others are preferred",
+    )
+    parser.add_argument(
+        "--heartbeat-timeout",
+        type=float,
+        default=float(os.environ.get("WORKER_HEARTBEAT_TIMEOUT", 15)),
+        help="seconds without an answer to a heartbeat before the worker exits",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+    asyncio.run(
+        run_worker(
+            args.host, capacity=args.capacity, heartbeat_timeout=args.heartbeat_timeout
+        )
+    )
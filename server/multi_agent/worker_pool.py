@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Set, Tuple
+
+from multi_agent.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """Runs submitted jobs on at most ``max_workers`` workers at the same time.
+
+    Worker slots are handed out on demand, so a pool only ever creates as many
+    workers as there is parallel work for. ``run_job`` receives the worker slot
+    and the job; the slot is stable for the life of the pool so it can be used
+    to address the same agent again.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        run_job: Callable[[int, Any], Awaitable[Any]],
+    ) -> None:
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+        self._max_workers = max_workers
+        self._run_job = run_job
+        # jobs waiting for a worker, with the time they were submitted
+        self._pending: Deque[Tuple[Any, float]] = deque()
+        self._free_workers: List[int] = []
+        self._worker_count = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._errors: List[BaseException] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._cancelled = False
+        self.in_flight: Dict[int, Any] = {}
+
+    @property
+    def worker_count(self) -> int:
+        return self._worker_count
+
+    def submit(self, job: Any) -> None:
+        self._pending.append((job, time.perf_counter()))
+        self._idle.clear()
+        self._dispatch()
+
+    async def join(self) -> None:
+        """Wait until every submitted job has finished.
+
+        The first error raised by a job is re-raised once the pool is idle,
+        CancelledError is raised if the pool was cancelled.
+        """
+        await self._idle.wait()
+        if self._cancelled:
+            raise asyncio.CancelledError()
+        if self._errors:
+            error = self._errors[0]
+            self._errors.clear()
+            raise error
+
+    async def cancel(self) -> None:
+        self._cancelled = True
+        self._pending.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._idle.set()
+
+    def _acquire_worker(self) -> int | None:
+        if self._free_workers:
+            return self._free_workers.pop()
+        if self._worker_count < self._max_workers:
+            self._worker_count += 1
+            return self._worker_count
+        return None
+
+    def _dispatch(self) -> None:
+        while self._pending and not self._cancelled:
+            worker = self._acquire_worker()
+            if worker is None:
+                return
+            job, submitted_at = self._pending.popleft()
+            metrics.observe("queue_wait", time.perf_counter() - submitted_at)
+            self.in_flight[worker] = job
+            task = asyncio.create_task(self._run(worker, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, worker: int, job: Any) -> None:
+        try:
+            await self._run_job(worker, job)
+        except Exception as e:
+            logger.error("Worker %d failed: %s", worker, e)
+            self._errors.append(e)
+        finally:
+            del self.in_flight[worker]
+            self._free_workers.append(worker)
+            self._dispatch()
+            if not self._pending and not self.in_flight:
+                self._idle.set()
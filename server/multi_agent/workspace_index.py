@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import tiktoken
+
+from multi_agent.import_graph import ImportGraph
+from multi_agent.search_index import SearchIndex
+
+
+IGNORE_DIRS = ["node_modules", ".git", ".next"]
+IGNORE_FILES = ["package-lock.json", ".env"]
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o") -> tiktoken.Encoding:
+    # loading the BPE ranks is expensive, do it once per process
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+@dataclass
+class FileEntry:
+    path: str
+    mtime_ns: int
+    size: int
+    content_hash: str
+    token_count: int
+    content: str
+    error: str | None = None
+    # derived views, computed lazily and dropped with the entry when it changes
+    summary: str | None = field(default=None, repr=False)
+    summary_token_count: int = field(default=0, repr=False)
+
+
+class WorkspaceIndex:
+    """Cached snapshot of the files in a workspace.
+
+    :meth:`refresh` only re-reads files whose mtime or size changed since the
+    last call, and only re-tokenizes files whose content hash changed. Use
+    :meth:`for_directory` to share one index per workspace across sessions.
+    """
+
+    _indexes: Dict[str, "WorkspaceIndex"] = {}
+
+    def __init__(
+        self,
+        root: str,
+        ignore_dirs: List[str] = IGNORE_DIRS,
+        ignore_files: List[str] = IGNORE_FILES,
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self._ignore_dirs = set(ignore_dirs)
+        self._ignore_files = set(ignore_files)
+        self.files: Dict[str, FileEntry] = {}
+        # one refresh at a time, sessions in the same workspace share the index
+        self._refresh_lock = asyncio.Lock()
+        # for relevance lookups and imports, kept in step with files
+        self.search = SearchIndex()
+        self.graph = ImportGraph()
+
+    @classmethod
+    def for_directory(cls, root: str) -> "WorkspaceIndex":
+        root = os.path.abspath(root)
+        if root not in cls._indexes:
+            cls._indexes[root] = cls(root)
+        return cls._indexes[root]
+
+    @classmethod
+    def release(cls, root: str) -> None:
+        """Drop the index of the workspace at ``root``, the next
+        :meth:`for_directory` starts a new one."""
+        cls._indexes.pop(os.path.abspath(root), None)
+
+    @property
+    def token_count(self) -> int:
+        return sum(entry.token_count for entry in self.files.values())
+
+    def refresh(self) -> List[str]:
+        """Bring the index up to date and return the paths that changed."""
+        changed, entries, removed = self._scan()
+        for entry in entries:
+            entry.token_count = count_tokens(entry.content)
+        self._update_views([(entry.path, entry.content) for entry in entries], removed)
+        self._apply(entries, removed)
+        return changed
+
+    async def refresh_async(self) -> List[str]:
+        """:meth:`refresh` without blocking the event loop.
+
+        Files are read on the I/O threads and changed files are tokenized in
+        one batch, while the index itself is only updated on the event loop.
+        """
+        # imported here, executors builds on this module
+        from multi_agent.executors import count_tokens_batch, run_blocking
+
+        async with self._refresh_lock:
+            changed, entries, removed = await run_blocking(self._scan)
+            counts = await count_tokens_batch([entry.content for entry in entries])
+            for entry, token_count in zip(entries, counts):
+                entry.token_count = token_count
+            await run_blocking(
+                self._update_views,
+                [(entry.path, entry.content) for entry in entries],
+                removed,
+            )
+            self._apply(entries, removed)
+        return changed
+
+    async def update_file_async(self, relative_path: str) -> bool:
+        """:meth:`update_file` without blocking the event loop."""
+        from multi_agent.executors import count_tokens_batch, run_blocking
+
+        async with self._refresh_lock:
+            try:
+                entry = await run_blocking(self._read_file, relative_path)
+            except FileNotFoundError:
+                await run_blocking(self._update_views, removed=[relative_path])
+                return self.files.pop(relative_path, None) is not None
+            if entry is None:
+                return False
+            [entry.token_count] = await count_tokens_batch([entry.content])
+            await run_blocking(self._update_views, [(relative_path, entry.content)])
+            self.files[relative_path] = entry
+        return True
+
+    def _scan(self) -> Tuple[List[str], List[FileEntry], List[str]]:
+        """Walk the workspace without changing :attr:`files`.
+
+        Returns the changed paths, new entries for the changed files, still
+        without a token count, and the paths of removed files.
+        """
+        changed: List[str] = []
+        entries: List[FileEntry] = []
+        seen = set()
+        for root, dirs, files in os.walk(self.root):
+            # Modify the dirs list in-place to skip ignored directories
+            dirs[:] = [d for d in dirs if d not in self._ignore_dirs]
+            for file in files:
+                if file in self._ignore_files:
+                    continue
+                filepath = os.path.join(root, file)
+                relative_path = os.path.relpath(filepath, self.root)
+                try:
+                    entry = self._read_file(relative_path)
+                except FileNotFoundError:
+                    # deleted while walking
+                    continue
+                seen.add(relative_path)
+                if entry is not None:
+                    changed.append(relative_path)
+                    entries.append(entry)
+
+        removed = [path for path in list(self.files) if path not in seen]
+        return changed + removed, entries, removed
+
+    def _apply(self, entries: List[FileEntry], removed: List[str]) -> None:
+        for entry in entries:
+            self.files[entry.path] = entry
+        for relative_path in removed:
+            self.files.pop(relative_path, None)
+
+    def _update_views(
+        self, documents: List[Tuple[str, str]] = (), removed: List[str] = ()
+    ) -> None:
+        self.search.update(documents, removed)
+        self.graph.update(documents, removed)
+
+    def update_file(self, relative_path: str) -> bool:
+        """Re-index a single file if it changed, returns whether it did."""
+        try:
+            entry = self._read_file(relative_path)
+        except FileNotFoundError:
+            self._update_views(removed=[relative_path])
+            return self.files.pop(relative_path, None) is not None
+        if entry is None:
+            return False
+        entry.token_count = count_tokens(entry.content)
+        self._update_views([(relative_path, entry.content)])
+        self.files[relative_path] = entry
+        return True
+
+    def _read_file(self, relative_path: str) -> FileEntry | None:
+        """A new entry, without a token count, if the file changed."""
+        filepath = os.path.join(self.root, relative_path)
+        stat = os.stat(filepath)
+
+        entry = self.files.get(relative_path)
+        if (
+            entry is not None
+            and entry.error is None
+            and entry.mtime_ns == stat.st_mtime_ns
+            and entry.size == stat.st_size
+        ):
+            return None
+
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                content = f.read()
+            error = None
+        except Exception as e:
+            content = ""
+            error = str(e)
+
+        content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        if entry is not None and entry.content_hash == content_hash and error is None:
+            # touched but not modified, keep the cached token count
+            entry.mtime_ns = stat.st_mtime_ns
+            entry.size = stat.st_size
+            entry.error = None
+            return None
+
+        return FileEntry(
+            path=relative_path,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            content_hash=content_hash,
+            token_count=0,
+            content=content,
+            error=error,
+        )
+
+    def render(self) -> str:
+        """Render every indexed file in the planner's project content format."""
+        return "".join(
+            self.render_file(self.files[path]) for path in sorted(self.files)
+        )
+
+    @staticmethod
+    def render_file(entry: FileEntry) -> str:
+        if entry.error is not None:
+            body = f"Error reading file: {entry.error} \n"
+        else:
+            body = entry.content + "\n"
+        return (
+            f"Filepath - {entry.path}\n"
+            "Content\n"
+            "---------------------------\n"
+            f"{body}"
+            "---------------------------\n"
+        )
@@ -0,0 +1,30 @@
+import os
+
+
+class InvalidWorkspace(ValueError):
+    pass
+
+
+class WorkspaceResolver:
+    """Maps the workspace named in a request to a directory on disk.
+
+    Requests without a workspace use ``default_directory``. Named workspaces
+    are only allowed when ``root`` is set and must be existing directories
+    inside it, so a request can not point the workers at arbitrary paths.
+    """
+
+    def __init__(self, default_directory: str, root: str | None = None) -> None:
+        self.default_directory = os.path.abspath(default_directory)
+        self.root = os.path.realpath(root) if root else None
+
+    def __call__(self, name: str | None) -> str:
+        if not name:
+            return self.default_directory
+        if self.root is None:
+            raise InvalidWorkspace("Per-request workspaces are disabled, set WORKSPACES_ROOT.")
+        path = os.path.realpath(os.path.join(self.root, name))
+        if path == self.root or os.path.commonpath([self.root, path]) != self.root:
+            raise InvalidWorkspace(f"Workspace {name!r} is outside of {self.root}.")
+        if not os.path.isdir(path):
+            raise InvalidWorkspace(f"Workspace {name!r} does not exist.")
+        return path
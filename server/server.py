@@ -1,30 +1,159 @@
+import time
+
+# startup_seconds counts from here
+STARTED = time.monotonic()
+
 import asyncio
+import importlib
+import json
 import os
+import uuid
+from typing import TYPE_CHECKING
 
-from autogen_core.models import UserMessage
 from dotenv import load_dotenv
+import grpc
 from grpc.aio import server as aio_server
 import logging
 
 import agents_pb2_grpc
 import agents_pb2
-from multi_agent.multi_agent import MultiAgent
+from multi_agent.executors import run_blocking
+from multi_agent.workspaces import InvalidWorkspace
+
+if TYPE_CHECKING:
+    # imports openai, autogen and tiktoken, loaded by AgentService.boot once
+    # the server listens; the handlers that need them only run after that
+    from multi_agent.jobs import Job
+    from multi_agent.multi_agent import MultiAgent
 
 load_dotenv()  # Load environment variables from .env
 
 
+# progress updates a session can buffer before its workers wait for the client
+PROGRESS_QUEUE_SIZE = int(os.environ.get("PROGRESS_QUEUE_SIZE", 256))
+
+PRIORITIES = {
+    agents_pb2.PRIORITY_NORMAL: "normal",
+    agents_pb2.PRIORITY_HIGH: "high",
+    agents_pb2.PRIORITY_LOW: "low",
+}
+PRIORITY_VALUES = {name: value for value, name in PRIORITIES.items()}
+
+
+def progress_message(update: dict) -> agents_pb2.ChatMessageProgress:
+    delta = update.get("delta")
+    return agents_pb2.ChatMessageProgress(
+        status=update.get("status", ""),
+        # filename might be there or not
+        filename=update.get("filename", ""),
+        delta=agents_pb2.FileDelta(**delta) if delta else None,
+        diagnostics=[
+            agents_pb2.Diagnostic(**diagnostic)
+            for diagnostic in update.get("diagnostics", ())
+        ],
+    )
+
+
+def job_status(job: "Job") -> agents_pb2.JobStatus:
+    return agents_pb2.JobStatus(
+        job_id=job.job_id,
+        state=job.state,
+        priority=PRIORITY_VALUES[job.priority],
+        workspace=job.workspace or "",
+        status=job.updates[-1].get("status", "") if job.updates else "",
+        files_completed=[
+            update["filename"]
+            for update in job.updates
+            if update.get("status") == "file_completed"
+        ],
+        error=job.error,
+        wait_seconds=job.wait_seconds,
+        run_seconds=job.run_seconds,
+    )
+
+
 class AgentService(agents_pb2_grpc.AgentService):
+    def __init__(self, multi_agent: "MultiAgent | None" = None):
+        # one warm runtime and model client shared by every request, set by
+        # boot() unless it is given
+        self._multi_agent = multi_agent
+        self._status = "serving" if multi_agent is not None else "importing"
+        self._startup_seconds = 0.0
+
+    async def boot(self, **kwargs) -> None:
+        """Load, initialize and warm up the agents while the server already
+        answers Health, other requests are turned away until this is done."""
+        # openai and autogen take a second or more to import, the import runs
+        # on a thread so health checks are answered meanwhile
+        started = time.perf_counter()
+        module = await run_blocking(importlib.import_module, "multi_agent.multi_agent")
+        from multi_agent.metrics import metrics
+
+        metrics.observe(
+            "startup", time.perf_counter() - started, status="ok", stage="importing"
+        )
+        multi_agent = module.MultiAgent()
+        self._status = "initializing"
+        with metrics.span("startup", stage="initializing"):
+            await multi_agent.initialize(**kwargs)
+        self._status = "warming_up"
+        with metrics.span("startup", stage="warming_up"):
+            await multi_agent.warm_up()
+        self._multi_agent = multi_agent
+        self._status = "serving"
+        self._startup_seconds = time.monotonic() - STARTED
+        logging.info("Ready after %.2fs", self._startup_seconds)
+
+    async def stop(self) -> None:
+        if self._multi_agent is not None:
+            await self._multi_agent.stop()
+
+    async def Health(self, request, context):
+        return agents_pb2.HealthReply(
+            ready=self._multi_agent is not None,
+            status=self._status,
+            startup_seconds=self._startup_seconds or time.monotonic() - STARTED,
+        )
+
+    async def _agents(self, context) -> "MultiAgent":
+        if self._multi_agent is None:
+            await context.abort(
+                grpc.StatusCode.UNAVAILABLE, "The server is starting, try again later."
+            )
+        return self._multi_agent
+
     async def ProcessChatMessage(self, request, context):
+        await self.run_session(request, context, stream_deltas=False)
+
+    async def StreamChatMessage(self, request, context):
+        await self.run_session(request, context, stream_deltas=True)
+
+    async def run_session(self, request, context, stream_deltas: bool):
+        multi_agent = await self._agents(context)
+        from multi_agent.session import PlanningFailed, SessionLimitExceeded, SessionTimeout
+
         try:
-            print("Processing chat message...", request.message)
-            queue = asyncio.Queue()
-            multi_agent = MultiAgent()
-            await multi_agent.initialize(queue=queue)
+            logging.info("Processing chat message: %s", request.message)
+            # bounded so a slow client slows the workers down instead of
+            # letting the queue grow without limit
+            queue = asyncio.Queue(maxsize=PROGRESS_QUEUE_SIZE)
 
             async def start_agent():
-                await multi_agent.start(
-                    UserMessage(content=request.message, source="user")
-                )
+                try:
+                    await multi_agent.start(
+                        request.message,
+                        queue=queue,
+                        stream_deltas=stream_deltas,
+                        workspace=request.workspace or None,
+                        # None without a deadline
+                        timeout=context.time_remaining(),
+                    )
+                except asyncio.CancelledError:
+                    # the client went away, nobody reads the queue anymore
+                    raise
+                except BaseException:
+                    await queue.put(None)
+                    raise
                 await queue.put(None)  # End of stream signal
 
             async def read_queue():
@@ -32,28 +161,108 @@ class AgentService(agents_pb2_grpc.AgentService):
                     update = await queue.get()
                     if update is None:  # End of stream signal
                         break
-                    await context.write(
-                        agents_pb2.ChatMessageProgress(
-                            status=update.get("status", ""),
-                            # filename might be there or not
-                            filename=update.get("filename", ""),
-                        )
-                    )
-            await asyncio.gather(start_agent(), read_queue())
+                    await context.write(progress_message(update))
+
+            # the updates are all sent before an error ends the stream
+            agent = asyncio.ensure_future(start_agent())
+            try:
+                await read_queue()
+            except BaseException:
+                agent.cancel()
+                raise
+            await agent
+        except SessionLimitExceeded as e:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+        except SessionTimeout as e:
+            await context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, str(e))
+        except InvalidWorkspace as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        except PlanningFailed as e:
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
         except Exception as e:
-            logging.error(f"Error processing chat message: {e}")
+            logging.error("Error processing chat message: %s", e)
             context.set_details(str(e))
             raise e
 
+    async def GetStats(self, request, context):
+        await self._agents(context)
+        from multi_agent.metrics import metrics
+
+        return agents_pb2.StatsReply(
+            text=metrics.render(),
+            sessions_json=json.dumps(metrics.session_tokens) if request.sessions else "",
+        )
+
+    async def SubmitJob(self, request, context):
+        multi_agent = await self._agents(context)
+        try:
+            job = multi_agent.submit_job(
+                request.message,
+                workspace=request.workspace or None,
+                priority=PRIORITIES.get(request.priority, "normal"),
+            )
+        except InvalidWorkspace as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        return job_status(job)
+
+    async def SubmitBatch(self, request, context):
+        multi_agent = await self._agents(context)
+        # nothing is queued unless every job can be
+        for job_request in request.jobs:
+            try:
+                multi_agent.resolve_workspace(job_request.workspace or None)
+            except InvalidWorkspace as e:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        batch_id = str(uuid.uuid4())
+        jobs = [
+            multi_agent.submit_job(
+                job_request.message,
+                workspace=job_request.workspace or None,
+                priority=PRIORITIES.get(job_request.priority, "normal"),
+                group=batch_id,
+            )
+            for job_request in request.jobs
+        ]
+        return agents_pb2.BatchReply(batch_id=batch_id, jobs=[job_status(job) for job in jobs])
+
+    async def GetJob(self, request, context):
+        return job_status(await self._job(request, context))
+
+    async def WatchJob(self, request, context):
+        await self._job(request, context)
+        async for update in self._multi_agent.jobs.watch(request.job_id):
+            await context.write(progress_message(update))
+
+    async def CancelJob(self, request, context):
+        await self._job(request, context)
+        return job_status(await self._multi_agent.jobs.cancel(request.job_id))
+
+    async def _job(self, request, context) -> "Job":
+        multi_agent = await self._agents(context)
+        job = multi_agent.jobs.jobs.get(request.job_id)
+        if job is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, f"Unknown job {request.job_id}.")
+        return job
+
 
 async def serve():
+    service = AgentService()
     server = aio_server()
-    agents_pb2_grpc.add_AgentServiceServicer_to_server(AgentService(), server)
-    server.add_insecure_port("[::]:50051")
+    agents_pb2_grpc.add_AgentServiceServicer_to_server(service, server)
+    port = int(os.environ.get("GRPC_PORT", 50051))
+    server.add_insecure_port(f"[::]:{port}")
+    # listen first, so health checks see the server starting instead of a
+    # closed port
     await server.start()
-    print("Async gRPC Server running on port grpc://localhost:50051")
-    await server.wait_for_termination()
+    logging.info("Async gRPC Server running on port grpc://localhost:%d", port)
+    try:
+        await service.boot()
+        await server.wait_for_termination()
+    finally:
+        await server.stop(grace=None)
+        await service.stop()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
     asyncio.run(serve())
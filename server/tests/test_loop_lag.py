@@ -0,0 +1,82 @@
+"""The event loop stays responsive while prompts are tokenized.
+
+Runs the rate limiter's token estimate with the real OpenAI client, i.e.
+``count_tokens`` on tiktoken, for several planner sized prompts at once and
+fails if the loop falls behind:
+
+    cd server && python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from autogen_core.models import SystemMessage, UserMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+
+from multi_agent.metrics import LoopLagMonitor
+from multi_agent.rate_limiter import RateLimitedChatCompletionClient, RateLimiter
+
+MODEL = "gpt-4o"
+# sleeps of the monitor that may wake up this late
+MAX_LAG = 0.05
+
+
+@pytest.fixture(scope="module")
+def client() -> OpenAIChatCompletionClient:
+    import tiktoken
+
+    try:
+        # the BPE ranks are downloaded on first use
+        tiktoken.encoding_for_model(MODEL)
+    except Exception as e:
+        pytest.skip(f"tiktoken can not load the {MODEL} encoding: {e}")
+    return OpenAIChatCompletionClient(model=MODEL, api_key="test")
+
+
+def planner_prompt(files: int = 2000):
+    project = "".join(
+        f"File: src/components/Component{i}.tsx\n"
+        + f"export function Part{i}() {{\n"
+        f"  return <div className=\"component-{i}\">Component {i}</div>;\n"
+        "}\n" * 10
+        for i in range(files)
+    )
+    return [
+        SystemMessage(content=f"You are a planner. The project:\n{project}"),
+        UserMessage(content="Add a subtitle to every component.", source="user"),
+    ]
+
+
+def test_estimate_tokens_off_the_loop(client):
+    messages = planner_prompt()
+    started = time.perf_counter()
+    client.count_tokens(messages)
+    inline = time.perf_counter() - started
+    # otherwise it would pass even with the count back on the loop
+    assert inline > 2 * MAX_LAG, f"the prompt is tokenized in {inline:.3f}s, make it longer"
+
+    limited = RateLimitedChatCompletionClient(client, RateLimiter())
+
+    async def run() -> float:
+        monitor = LoopLagMonitor(interval=0.005)
+        monitor.start()
+        # the monitor has to be waiting before the estimates start
+        await asyncio.sleep(0.01)
+        try:
+            await asyncio.gather(
+                *[limited.estimate_tokens(messages, [], {}) for _ in range(4)]
+            )
+            # and has to record the last wake up
+            await asyncio.sleep(0.01)
+        finally:
+            await monitor.stop()
+        return max(monitor.samples, default=0.0)
+
+    lag = asyncio.run(run())
+    assert lag < MAX_LAG, f"the event loop lagged {lag * 1000:.0f}ms"
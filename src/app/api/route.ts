@@ -18,7 +18,10 @@ export async function POST(request: NextRequest) {
 
   const stream = new ReadableStream({
     start(controller) {
-      const call = client.ProcessChatMessage({ message: json.message });
+      const call = client.ProcessChatMessage({
+        message: json.message,
+        workspace: json.workspace,
+      });
 
       call.on("data", (response: { status: string; filename: string }) => {
         const chunk = new TextEncoder().encode(
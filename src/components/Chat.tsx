@@ -26,8 +26,22 @@ const operationLabels = {
     "": "Waiting...",
     planning: "Planning...",
     writing_code: "Writing code...",
+    file_completed: "Writing code...",
     completed: "Completed",
+    installing_dependencies: "Installing dependencies...",
+    dependencies_installed: "Completed",
+    dependencies_failed: "Completed, npm install failed",
+    validating: "Checking files...",
+    file_valid: "Checking files...",
+    file_invalid: "Fixing errors...",
+    planning_failed: "Planning failed",
 };
+const finishedStatuses = [
+    "completed",
+    "dependencies_installed",
+    "dependencies_failed",
+    "planning_failed",
+];
 
 interface Message {
     message: string;
@@ -195,8 +209,9 @@ export default function Chat({
                                     </Text>
                                     {msg.operationStatus && (
                                         <Flex align="center" gap="xs">
-                                            {msg.operationStatus ===
-                                            "completed" ? (
+                                            {finishedStatuses.includes(
+                                                msg.operationStatus
+                                            ) ? (
                                                 <IconCircleCheckFilled
                                                     style={{
                                                         width: "18px",